@@ -92,6 +92,8 @@ COMMANDS = {
         'CreateLabels': (0, 'create_labels'),
         'EntryLabel': ('L{address}', ''),
         'EntryPointLabel': ('{main}_{index}', ''),
+        'Incremental': (0, 'incremental'),
+        'Jobs': (1, 'jobs'),
         'JoinCss': ('', 'single_css'),
         'OutputDir': ('.', 'output_dir'),
         'Quiet': (0, 'quiet'),
@@ -79,6 +79,11 @@ def _parse_length(length, default_base, required):
         return (get_int_param(length), default_base)
     return (0, default_base)
 
+def _slice(addresses, start, end):
+    # Return the addresses in the sorted list 'addresses' that lie in the
+    # range start <= address < end
+    return addresses[bisect.bisect_left(addresses, start):bisect.bisect_left(addresses, end)]
+
 class CtlParser:
     def __init__(self, ctls=None):
         self._subctls = {}
@@ -338,10 +343,10 @@ class CtlParser:
 
         # Create sub-blocks
         for sub_address in sorted(self._subctls):
-            for block in blocks:
-                if block.start <= sub_address < block.end:
-                    block.add_block(self._subctls[sub_address] or block.ctl, sub_address)
-                    break
+            index = bisect.bisect_right(block_addresses, sub_address) - 1
+            if 0 <= index < len(blocks):
+                block = blocks[index]
+                block.add_block(self._subctls[sub_address] or block.ctl, sub_address)
 
         # Set sub-block end addresses
         for block in blocks:
@@ -350,7 +355,9 @@ class CtlParser:
             block.blocks[-1].end = block.end
 
         # Set sub-block attributes
-        asm_directives = tuple(self._asm_directives.items())
+        asm_directives = dict(self._asm_directives)
+        asm_addresses = sorted(asm_directives)
+        ignoreua_addresses = sorted(self._ignoreua_directives)
         for block in blocks:
             for sub_block in block.blocks:
                 sub_address = sub_block.start
@@ -358,11 +365,11 @@ class CtlParser:
                 sub_block.header = self._reduce(self._mid_block_comments, sub_address)
                 sub_block.comment = (self._instruction_comments.get(sub_address) or ())[:]
                 sub_block.multiline_comment = self._multiline_comments.get(sub_address)
-                sub_block.asm_directives = dict([d for d in asm_directives if sub_address <= d[0] < sub_block.end])
+                sub_block.asm_directives = {a: asm_directives[a] for a in _slice(asm_addresses, sub_address, sub_block.end)}
                 sub_block.ignoreua_directives = {}
-                for addr, dirs in self._ignoreua_directives.items():
-                    if sub_address <= addr < sub_block.end:
-                        sub_block.ignoreua_directives[addr] = {k: v for k, v in dirs.items() if k not in ENTRY_COMMENT_TYPES}
+                for addr in _slice(ignoreua_addresses, sub_address, sub_block.end):
+                    dirs = self._ignoreua_directives[addr]
+                    sub_block.ignoreua_directives[addr] = {k: v for k, v in dirs.items() if k not in ENTRY_COMMENT_TYPES}
 
         return blocks
 
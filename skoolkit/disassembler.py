@@ -101,7 +101,8 @@ class OperandFormatter:
 class Disassembler:
     """Initialise the disassembler.
 
-    :param snapshot: The snapshot (list of 65536 byte values) to disassemble.
+    :param snapshot: The snapshot (a 65536-byte bytearray, or a list of 65536
+                     byte values) to disassemble.
     :param config: Configuration object with the following attributes:
 
                    * `asm_hex` - if `True`, produce a hexadecimal disassembly
@@ -137,6 +138,8 @@ class Disassembler:
             self.after_DD = {k: (v[0], v[1].lower()) for k, v in self.after_DD.items()}
             self.after_ED = {k: (v[0], v[1].lower()) for k, v in self.after_ED.items()}
             self.after_DDCB = {k: (v[0], v[1].lower()) for k, v in self.after_DDCB.items()}
+        self._formats = {}
+        self._table = self._build_table()
 
     # Component API
     def disassemble(self, start, end, base):
@@ -150,6 +153,8 @@ class Disassembler:
                      one for each operand (e.g. 'dh').
         :return: A list of tuples of the form ``(address, operation, bytes)``.
         """
+        if self._table:
+            return self._disassemble(start, end, base)
         instructions = []
         address = start
         while address < end:
@@ -167,6 +172,126 @@ class Disassembler:
             address += length
         return instructions
 
+    def _build_table(self):
+        # Pre-decode the opcode tables so that an address range can be
+        # disassembled without calling a decoder method per instruction. Each
+        # entry is (_SUB, table, offset) for a prefix (where 'offset' is the
+        # offset of the next opcode byte), or (kind, template, length, pos)
+        # where 'pos' is the offset of the first operand byte. If any table
+        # contains an unknown decoder, None is returned and disassemble() falls
+        # back to calling the decoders.
+        try:
+            table = [self._decode(*self.ops[i], 0) for i in range(256)]
+            ed_table = [self._decode(*self.after_ED.get(i, (None, None)), 1, 2) for i in range(256)]
+            cb_table = [(_NO_ARG, self.after_CB[i], 2, 0) for i in range(256)]
+            ixy_tables = []
+            for ixy, ixy_lower in (('IX', 'ix'), ('IY', 'iy')):
+                ddcb_table = []
+                for i in range(256):
+                    decoder, template = self.after_DDCB.get(i, (None, None))
+                    if template:
+                        template = template.replace('IX', ixy).replace('ix', ixy_lower)
+                        ddcb_table.append(self._decode(decoder, template, 1)[:2] + (4, 2))
+                    else:
+                        ddcb_table.append((_DEFB, None, 4, 0))
+                dd_table = []
+                for i in range(256):
+                    decoder, template = self.after_DD.get(i, (None, None))
+                    if template:
+                        template = template.replace('IX', ixy).replace('ix', ixy_lower)
+                        dd_table.append(self._decode(decoder, template, 1))
+                    elif decoder == Disassembler.ddcb_arg:
+                        dd_table.append((_SUB, ddcb_table, 3))
+                    else:
+                        # The instruction is unchanged by the DD/FD prefix
+                        dd_table.append((_DEFB, None, 1, 0))
+                ixy_tables.append(dd_table)
+        except KeyError:
+            return None
+        for opcode, decoder, subtable in (
+                (0xCB, Disassembler.cb_arg, cb_table),
+                (0xDD, Disassembler.dd_arg, ixy_tables[0]),
+                (0xED, Disassembler.ed_arg, ed_table),
+                (0xFD, Disassembler.fd_arg, ixy_tables[1])
+        ):
+            if self.ops[opcode] != (decoder, ''):
+                return None
+            table[opcode] = (_SUB, subtable, 1)
+        return table
+
+    def _decode(self, decoder, template, prefix, defb_size=None):
+        if decoder is None:
+            return (_DEFB, None, defb_size, 0)
+        if decoder == Disassembler.defb4:
+            return (_DEFB, None, 4, 0)
+        if not template:
+            # A prefix; this is handled by the caller
+            return (_SUB, None, 0)
+        kind, length = _DECODERS[decoder]
+        if kind == _RST:
+            return (kind, (template[:4], int(template[4:])), length + prefix, prefix)
+        return (kind, template, length + prefix, prefix + 1)
+
+    def _get_formats(self, method, base):
+        formats = self._formats.get((method, base))
+        if formats is None:
+            formats = self._formats[(method, base)] = _Formats(method, base)
+        return formats
+
+    def _index_offset(self, value, base):
+        if value < 128:
+            return '+{}'.format(self.op_formatter.format_byte(value, base))
+        return '-{}'.format(self.op_formatter.format_byte(256 - value, base))
+
+    def _disassemble(self, start, end, base):
+        snapshot = self.snapshot
+        table = self._table
+        byte_strs = self._get_formats(self.op_formatter.format_byte, base)
+        word_strs = self._get_formats(self.op_formatter.format_word, base)
+        offset_strs = self._get_formats(self._index_offset, base)
+        ixy_offset_strs = self._get_formats(self._index_offset, base[0])
+        ixy_byte_strs = self._get_formats(self.op_formatter.format_byte, base[-1])
+        instructions = []
+        append = instructions.append
+        address = start
+        while address < end:
+            entry = table[snapshot[address]]
+            while entry[0] == _SUB:
+                entry = entry[1][snapshot[(address + entry[2]) & 65535]]
+            kind, template, length, pos = entry
+            if kind == _NO_ARG:
+                operation = template
+            elif kind == _WORD:
+                operation = template.format(word_strs[snapshot[(address + pos) & 65535] + 256 * snapshot[(address + pos + 1) & 65535]])
+            elif kind == _BYTE:
+                operation = template.format(byte_strs[snapshot[(address + pos) & 65535]])
+            elif kind == _INDEX:
+                operation = template.format(offset_strs[snapshot[(address + pos) & 65535]])
+            elif kind == _JR:
+                offset = snapshot[(address + pos) & 65535]
+                if offset < 128:
+                    jr_address = address + pos + 1 + offset
+                else:
+                    jr_address = address + pos + offset - 255
+                if 0 <= jr_address < 65536:
+                    operation = template.format(word_strs[jr_address])
+                else:
+                    operation, length = self._defb(address, 2)
+            elif kind == _INDEX_ARG:
+                operation = template.format(ixy_offset_strs[snapshot[(address + pos) & 65535]], ixy_byte_strs[snapshot[(address + pos + 1) & 65535]])
+            elif kind == _RST:
+                operation = template[0] + byte_strs[template[1]]
+            else:
+                operation, length = self._defb(address, length)
+            if address + length <= 65536:
+                append((address, operation, snapshot[address:address + length]))
+            elif self.wrap:
+                append((address, operation, snapshot[address:65536] + snapshot[:(address + length) & 65535]))
+            else:
+                append(self._defb_line(address, snapshot[address:65536]))
+            address += length
+        return instructions
+
     def _defb_line(self, address, data, sublengths=((0, DEFAULT_BASE),), defm=False):
         return (address, self.defb_dir(data, sublengths, defm), data)
 
@@ -1090,3 +1215,26 @@ class Disassembler:
         0xF6: (index, 'SET 6,(IX{})'),
         0xFE: (index, 'SET 7,(IX{})')
     }
+
+_NO_ARG, _BYTE, _WORD, _JR, _RST, _INDEX, _INDEX_ARG, _DEFB, _SUB = range(9)
+
+_DECODERS = {
+    Disassembler.no_arg: (_NO_ARG, 1),
+    Disassembler.byte_arg: (_BYTE, 2),
+    Disassembler.word_arg: (_WORD, 3),
+    Disassembler.jr_arg: (_JR, 2),
+    Disassembler.rst_arg: (_RST, 1),
+    Disassembler.index: (_INDEX, 2),
+    Disassembler.index_arg: (_INDEX_ARG, 3)
+}
+
+class _Formats(dict):
+    # Caches the operands formatted by an OperandFormatter method in a given
+    # base
+    def __init__(self, method, base):
+        self.method = method
+        self.base = base
+
+    def __missing__(self, value):
+        formatted = self[value] = self.method(value, self.base)
+        return formatted
@@ -34,6 +34,22 @@ FLIP = (
     15, 143, 79, 207, 47, 175, 111, 239, 31, 159, 95, 223, 63, 191, 127, 255
 )
 
+# Byte flip table for bytes.translate()
+FLIP_BYTES = bytes(FLIP)
+
+def _transpose(tile_data):
+    # Transpose an 8x8 bit matrix (packed into a 64-bit integer, one row per
+    # byte, with the top row in the most significant byte) about its main
+    # diagonal, by swapping 1x1, 2x2 and then 4x4 blocks of bits
+    x = int.from_bytes(bytes(tile_data), 'big')
+    t = (x ^ (x >> 7)) & 0x00AA00AA00AA00AA
+    x ^= t ^ (t << 7)
+    t = (x ^ (x >> 14)) & 0x0000CCCC0000CCCC
+    x ^= t ^ (t << 14)
+    t = (x ^ (x >> 28)) & 0x00000000F0F0F0F0
+    x ^= t ^ (t << 28)
+    return x.to_bytes(8, 'big')
+
 class Udg:
     """Initialise the UDG.
 
@@ -41,6 +57,8 @@ class Udg:
     :param data: The graphic data (sequence of 8 bytes).
     :param mask: The mask data (sequence of 8 bytes).
     """
+    __slots__ = ('attr', 'data', 'mask')
+
     def __init__(self, attr, data, mask=None):
         self.attr = attr
         self.data = data
@@ -57,28 +75,12 @@ class Udg:
         return False
 
     def _rotate_tile(self, tile_data, backwards=0):
-        rotated = []
+        # A clockwise rotation is a transposition followed by a horizontal
+        # flip, and an anticlockwise rotation is a transposition followed by
+        # a vertical flip
         if backwards:
-            b = 1
-            while b < 129:
-                rbyte = 0
-                for byte in tile_data:
-                    rbyte *= 2
-                    if byte & b:
-                        rbyte += 1
-                rotated.append(rbyte)
-                b *= 2
-        else:
-            b = 128
-            while b:
-                rbyte = 0
-                for byte in tile_data:
-                    rbyte //= 2
-                    if byte & b:
-                        rbyte += 128
-                rotated.append(rbyte)
-                b //= 2
-        return rotated
+            return list(_transpose(tile_data)[::-1])
+        return list(_transpose(tile_data).translate(FLIP_BYTES))
 
     # API
     def flip(self, flip=1):
@@ -88,9 +90,9 @@ class Udg:
                      horizontally and vertically.
         """
         if flip & 1:
-            self.data = [FLIP[b] for b in self.data]
+            self.data = list(bytes(self.data).translate(FLIP_BYTES))
             if self.mask:
-                self.mask = [FLIP[b] for b in self.mask]
+                self.mask = list(bytes(self.mask).translate(FLIP_BYTES))
         if flip & 2:
             self.data.reverse()
             if self.mask:
@@ -299,20 +301,12 @@ def overlay_udgs(bg, fg, x, y, mask=0, rattr=None, rbyte=None):
     if xshift or yshift:
         fg_udgs = [[udg.copy() for udg in row] for row in fg]
         if xshift:
-            xshift_r = 8 - xshift
-            bit_mask = (255 << xshift_r) & 255
             for row in fg_udgs:
                 row.append(Udg(row[-1].attr, [0] * 8, [255] * 8))
-                bits, mbits = [0] * 8, [bit_mask] * 8
-                for udg in row:
-                    for i in range(8):
-                        sbits = (udg.data[i] << xshift_r) & bit_mask
-                        udg.data[i] = (udg.data[i] >> xshift) | bits[i]
-                        bits[i] = sbits
-                        if udg.mask:
-                            msbits = (udg.mask[i] << xshift_r) & bit_mask
-                            udg.mask[i] = (udg.mask[i] >> xshift) | mbits[i]
-                            mbits[i] = msbits
+                # Shift each pixel row of graphic bytes, and of mask bytes
+                # (filling with 1s on the left), across the whole UDG row
+                _shift_right(row, 'data', xshift, 0)
+                _shift_right([udg for udg in row if udg.mask], 'mask', xshift, 255)
         if yshift:
             fg_udgs.append([Udg(u.attr, [0] * 8, [255] * 8) for u in fg_udgs[-1]])
             for i in range(len(fg_udgs[0])):
@@ -343,17 +337,26 @@ def overlay_udgs(bg, fg, x, y, mask=0, rattr=None, rbyte=None):
                 for i in range(8):
                     bg_udg.data[i] = rbyte(bg_udg.data[i], fg_udg.data[i], fmask[i])
             elif mask == 1 and fg_udg.mask:
-                for i in range(8):
-                    bg_udg.data[i] = (bg_udg.data[i] | fg_udg.data[i]) & fg_udg.mask[i]
+                bg_udg.data[:] = [(b | f) & m for b, f, m in zip(bg_udg.data, fg_udg.data, fg_udg.mask)]
             elif mask == 2 and fg_udg.mask:
-                for i in range(8):
-                    bg_udg.data[i] = (bg_udg.data[i] & fg_udg.mask[i]) | fg_udg.data[i]
+                bg_udg.data[:] = [(b & m) | f for b, f, m in zip(bg_udg.data, fg_udg.data, fg_udg.mask)]
             else:
-                for i in range(8):
-                    bg_udg.data[i] |= fg_udg.data[i]
+                bg_udg.data[:] = [b | f for b, f in zip(bg_udg.data, fg_udg.data)]
             if rattr:
                 bg_udg.attr = rattr(bg_udg.attr, fg_udg.attr)
 
+def _shift_right(udgs, name, xshift, fill):
+    # Shift the bits in a row of UDGs right by xshift, filling from the left
+    # with the bits of the byte value 'fill'
+    size = len(udgs)
+    fill <<= 8 * size
+    rows = []
+    for i in range(8):
+        row = int.from_bytes(bytes([getattr(udg, name)[i] for udg in udgs]), 'big')
+        rows.append((((fill | row) >> xshift) & ~fill).to_bytes(size, 'big'))
+    for udg, data in zip(udgs, zip(*rows)):
+        setattr(udg, name, list(data))
+
 # API
 def rotate_udgs(udgs, rotate=1):
     """
@@ -396,11 +399,69 @@ def adjust_udgs(udgs, flip, rotate):
     rotate_udgs(udgs, rotate)
     return udgs
 
+class UdgCache:
+    """A cache of the graphic data and mask data of the UDGs built from a
+    memory snapshot. The cache is cleared automatically when it is used with a
+    different snapshot object, but must be cleared explicitly whenever the
+    contents of the snapshot change.
+    """
+    # The maximum number of UDGs to cache before starting afresh
+    max_size = 4096
+
+    def __init__(self):
+        self.snapshot = None
+        self._tiles = {}
+
+    def clear(self):
+        """Clear the cache."""
+        self._tiles.clear()
+
+    def get_udg(self, snapshot, attr, addr, step=1, inc=0, mask_addr=None, mask_step=1):
+        """Return a UDG built from a snapshot.
+
+        :param snapshot: The memory snapshot.
+        :param attr: The attribute byte.
+        :param addr: The address of the graphic data.
+        :param step: The distance between consecutive bytes of graphic data.
+        :param inc: The value to add to each byte of graphic data.
+        :param mask_addr: The address of the mask data (if any).
+        :param mask_step: The distance between consecutive bytes of mask
+                          data.
+        """
+        if snapshot is not self.snapshot:
+            self.snapshot = snapshot
+            self._tiles.clear()
+        key = (addr, step, inc, mask_addr, mask_step)
+        tile = self._tiles.get(key)
+        if tile is None:
+            # The data is stored in tuples, which are shared between cache
+            # hits; each UDG gets its own copy (as a list) because UDG data
+            # may be modified in place (by flipping, overlaying or plotting)
+            data = _read_udg_bytes(snapshot, addr, step)
+            if inc:
+                data = tuple([(b + inc) % 256 for b in data])
+            mask = None
+            if mask_addr is not None:
+                mask = _read_udg_bytes(snapshot, mask_addr, mask_step)
+            if len(self._tiles) >= self.max_size:
+                self._tiles.clear()
+            tile = self._tiles[key] = (data, mask)
+        if tile[1] is None:
+            return Udg(attr, list(tile[0]))
+        return Udg(attr, list(tile[0]), list(tile[1]))
+
+def _read_udg_bytes(snapshot, addr, step):
+    # Read 8 bytes from a snapshot, by slicing if every address is in range
+    # (which is faster than, and equivalent to, indexing)
+    if step > 0 and addr >= 0 and addr + 7 * step < len(snapshot):
+        return tuple(snapshot[addr:addr + 8 * step:step])
+    return tuple([snapshot[addr + n * step] for n in range(8)])
+
 def build_udg(snapshot, addr, attr, step, inc, flip, rotate, mask, mask_addr, mask_step):
     udg_bytes = [(snapshot[addr + n * step] + inc) % 256 for n in range(8)]
     mask_bytes = None
     if mask and mask_addr is not None:
-        mask_bytes = snapshot[mask_addr:mask_addr + 8 * mask_step:mask_step]
+        mask_bytes = list(snapshot[mask_addr:mask_addr + 8 * mask_step:mask_step])
     udg = Udg(attr, udg_bytes, mask_bytes)
     udg.flip(flip)
     udg.rotate(rotate)
@@ -410,7 +471,7 @@ def font_udgs(snapshot, address, attr, message):
     udgs = []
     for c in message:
         a = address + 8 * (ord(c) - 32)
-        udgs.append(Udg(attr, snapshot[a:a + 8]))
+        udgs.append(Udg(attr, list(snapshot[a:a + 8])))
     return [udgs]
 
 def scr_udgs(snapshot, x, y, w, h, df_addr=16384, af_addr=22528):
@@ -420,5 +481,5 @@ def scr_udgs(snapshot, x, y, w, h, df_addr=16384, af_addr=22528):
     for r in range(y, y + height):
         attr_addr = af_addr + 32 * r + x
         addr = df_addr + 2048 * (r // 8) + 32 * (r % 8) + x
-        udgs.append([Udg(snapshot[attr_addr + i], snapshot[addr + i:addr + i + 2048:256]) for i in range(width)])
+        udgs.append([Udg(snapshot[attr_addr + i], list(snapshot[addr + i:addr + i + 2048:256])) for i in range(width)])
     return udgs
@@ -14,6 +14,11 @@
 # You should have received a copy of the GNU General Public License along with
 # SkoolKit. If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
+import os
+from io import BytesIO
+
+from skoolkit import VERSION
 from skoolkit.pngwriter import PngWriter
 
 TRANSPARENT = 'TRANSPARENT'
@@ -36,6 +41,8 @@ BRIGHT_WHITE = 'BRIGHT_WHITE'
 PNG_ALPHA = 'PNGAlpha'
 PNG_COMPRESSION_LEVEL = 'PNGCompressionLevel'
 PNG_ENABLE_ANIMATION = 'PNGEnableAnimation'
+IMAGE_CACHE = 'ImageCache'
+IMAGE_CACHE_SIZE = 'ImageCacheSize'
 
 class ImageWriter:
     """Initialise the image writer.
@@ -55,6 +62,9 @@ class ImageWriter:
         self.options = self._get_default_options()
         if config:
             for k, v in config.items():
+                if k == IMAGE_CACHE:
+                    self.options[k] = v
+                    continue
                 try:
                     self.options[k] = int(v)
                 except ValueError:
@@ -71,6 +81,10 @@ class ImageWriter:
             2: AndOrMask()
         }
         self.writer = PngWriter(self.options[PNG_ALPHA] & 255, self.options[PNG_COMPRESSION_LEVEL], self.masks)
+        if self.options[IMAGE_CACHE]:
+            self.cache = ImageCache(self.options[IMAGE_CACHE], self.options[IMAGE_CACHE_SIZE] * 1024)
+        else:
+            self.cache = None
 
     # Component API
     def image_fname(self, fname):
@@ -97,6 +111,19 @@ class ImageWriter:
         :return: The content with which the image macro is replaced; if `None`,
                  an appropriate ``<img .../>`` element is used.
         """
+        if self.cache:
+            key = self._get_key(frames)
+            img_data = self.cache.get(key)
+            if img_data is None:
+                img_stream = BytesIO()
+                self._write_image(frames, img_stream)
+                img_data = img_stream.getvalue()
+                self.cache.put(key, img_data)
+            img_file.write(img_data)
+        else:
+            self._write_image(frames, img_file)
+
+    def _write_image(self, frames, img_file):
         use_flash = len(frames) == 1 and self.options[PNG_ENABLE_ANIMATION]
         attrs = set()
         colours = set()
@@ -109,6 +136,15 @@ class ImageWriter:
         palette, attr_map, has_trans = self._get_palette(colours, attrs, has_trans, frames[0].tindex)
         self.writer.write_image(frames, img_file, palette, attr_map, has_trans, frames[0].flash_rect)
 
+    def _get_key(self, frames):
+        frame_data = []
+        for frame in frames:
+            udgs = [[(u.attr, tuple(u.data), u.mask and tuple(u.mask)) for u in row] for row in frame.udgs]
+            frame_data.append((udgs, frame.scale, frame.mask, frame.x, frame.y, frame.width, frame.height,
+                               frame.delay, frame.tindex, frame.alpha, frame.x_offset, frame.y_offset))
+        options = (self.options[PNG_ALPHA], self.options[PNG_COMPRESSION_LEVEL], self.options[PNG_ENABLE_ANIMATION])
+        return hashlib.sha256(repr((VERSION, self.colours, options, frame_data)).encode('utf8')).hexdigest()
+
     def get_default_colours(self):
         return (
             (TRANSPARENT, (0, 254, 0)),
@@ -133,7 +169,9 @@ class ImageWriter:
         return {
             PNG_COMPRESSION_LEVEL: 9,
             PNG_ENABLE_ANIMATION: 1,
-            PNG_ALPHA: 255
+            PNG_ALPHA: 255,
+            IMAGE_CACHE: '',
+            IMAGE_CACHE_SIZE: 65536
         }
 
     def get_attr_map(self):
@@ -152,15 +190,6 @@ class ImageWriter:
             attr_map[attr] = (paper, ink)
         return attr_map
 
-    def _check_pixels(self, colours, pixels, ink, paper, has_trans, has_non_trans):
-        if ink in pixels:
-            colours.add(ink)
-            has_non_trans = True
-        if paper in pixels:
-            colours.add(paper)
-            has_non_trans = True
-        return has_trans or None in pixels, has_non_trans
-
     def _get_colours(self, frame, use_flash=False):
         udg_array = frame.udgs
         null_mask = frame.mask == 0
@@ -190,27 +219,29 @@ class ImageWriter:
                 paper, ink = self.attr_index[attr]
                 if udg.mask:
                     has_masks = 1
+                flash = use_flash and attr & 128 and ink != paper
+                if not flash and ink in colours and paper in colours and (null_mask or has_trans):
+                    # This UDG cannot add anything to what is already known
+                    x += inc
+                    continue
                 udg_whole = x0 <= x < x1_floor and y0 <= y < y1_floor
-                has_non_trans = False
                 if udg_whole:
                     # Uncropped UDG
-                    for i in range(8):
-                        pixels = mask.apply(udg, i, paper, ink, None)
-                        has_trans, has_non_trans = self._check_pixels(colours, pixels, ink, paper, has_trans, has_non_trans)
-                        if ink in colours and paper in colours and has_non_trans and (null_mask or has_trans):
-                            break
+                    usage = mask.usage(udg, 0, 8)
                 else:
                     # Cropped UDG
                     min_k = max(0, (x0 - x) // scale)
                     max_k = min(8, 1 + (x1 - 1 - x) // scale)
                     min_j = max(0, (y0 - y) // scale)
                     max_j = min(8, 1 + (y1 - 1 - y) // scale)
-                    for j in range(min_j, max_j):
-                        pixels = mask.apply(udg, j, paper, ink, None)[min_k:max_k]
-                        has_trans, has_non_trans = self._check_pixels(colours, pixels, ink, paper, has_trans, has_non_trans)
-                        if ink in colours and paper in colours and has_non_trans and (null_mask or has_trans):
-                            break
-                if use_flash and attr & 128 and ink != paper and has_non_trans:
+                    usage = mask.usage(udg, min_j, max_j) & COLUMNS[min_k][max_k]
+                if usage & 255:
+                    colours.add(ink)
+                if usage & 65280:
+                    colours.add(paper)
+                if usage > 65535:
+                    has_trans = True
+                if flash and usage & 65535:
                     if udg_whole:
                         min_x = min(x, min_x)
                         max_x = max(x + inc, max_x)
@@ -264,7 +295,94 @@ class ImageWriter:
 
         return palette, attr_map, has_trans
 
+class ImageCache:
+    # A directory of finished image files, each named after the hash of the
+    # frames and options it was built from, that is kept below a given size by
+    # removing the least recently used files
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_size = max_size
+        self.size = None
+
+    def get(self, key):
+        path = os.path.join(self.cache_dir, key + '.png')
+        try:
+            with open(path, 'rb') as f:
+                img_data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return img_data
+
+    def put(self, key, img_data):
+        path = os.path.join(self.cache_dir, key + '.png')
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                f.write(img_data)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+        if self.size is None:
+            self.size = sum(size for mtime, size, path in self._get_files())
+        else:
+            self.size += len(img_data)
+        if self.size > self.max_size:
+            self._evict(path)
+
+    def _get_files(self):
+        files = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.png'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _evict(self, keep):
+        files = sorted(self._get_files())
+        self.size = sum(f[1] for f in files)
+        for mtime, size, path in files:
+            if self.size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                self.size -= size
+            except OSError:
+                pass
+
+def _get_columns():
+    # Map (min_k, max_k) to the ink, paper and transparent bits of the pixels
+    # in columns min_k to max_k-1 of a UDG
+    columns = []
+    for min_k in range(9):
+        columns.append([])
+        for max_k in range(9):
+            bits = (255 >> min_k) & (65280 >> max_k) & 255
+            columns[-1].append(bits * 65793)
+    return columns
+
+COLUMNS = _get_columns()
+
 class NoMask:
+    def usage(self, udg, min_j, max_j):
+        # A pixel is ink in a row if its bit is set, and paper in a row if its
+        # bit is reset (which is the case in some row if it is reset in the
+        # AND of all the rows)
+        ink, paper = 0, 255
+        for udg_byte in udg.data[min_j:max_j]:
+            ink |= udg_byte
+            paper &= udg_byte
+        if min_j < max_j:
+            return ink | (paper ^ 255) << 8
+        return 0
+
     def apply(self, udg, row, paper, ink, trans):
         udg_byte = udg.data[row]
         pixels = [paper] * 8
@@ -276,7 +394,24 @@ class NoMask:
             index -= 1
         return pixels
 
+NO_MASK = NoMask()
+
 class OrAndMask:
+    table = None
+
+    def usage(self, udg, min_j, max_j):
+        # Bits 0-7, 8-15 and 16-23 of the value for each (UDG byte, mask byte)
+        # pair in the table show which pixels are ink, paper and transparent
+        if udg.mask:
+            if self.table is None:
+                OrAndMask.table = [b & m | (m ^ 255) << 8 | (m & (b ^ 255)) << 16 for b in range(256) for m in range(256)]
+            table = self.table
+            usage = 0
+            for udg_byte, mask_byte in zip(udg.data[min_j:max_j], udg.mask[min_j:max_j]):
+                usage |= table[udg_byte * 256 + mask_byte]
+            return usage
+        return NO_MASK.usage(udg, min_j, max_j)
+
     def apply(self, udg, row, paper, ink, trans):
         udg_byte = udg.data[row]
         if udg.mask:
@@ -305,6 +440,21 @@ class OrAndMask:
         )
 
 class AndOrMask:
+    table = None
+
+    def usage(self, udg, min_j, max_j):
+        # Bits 0-7, 8-15 and 16-23 of the value for each (UDG byte, mask byte)
+        # pair in the table show which pixels are ink, paper and transparent
+        if udg.mask:
+            if self.table is None:
+                AndOrMask.table = [b | ((b | m) ^ 255) << 8 | (m & (b ^ 255)) << 16 for b in range(256) for m in range(256)]
+            table = self.table
+            usage = 0
+            for udg_byte, mask_byte in zip(udg.data[min_j:max_j], udg.mask[min_j:max_j]):
+                usage |= table[udg_byte * 256 + mask_byte]
+            return usage
+        return NO_MASK.usage(udg, min_j, max_j)
+
     def apply(self, udg, row, paper, ink, trans):
         udg_byte = udg.data[row]
         if udg.mask:
@@ -16,6 +16,8 @@
 
 import zlib
 
+from skoolkit.graphics import Frame
+
 # http://www.libpng.org/pub/png/spec/iso/index-object.html
 # https://wiki.mozilla.org/APNG_Specification
 PNG_SIGNATURE = bytes((137, 80, 78, 71, 13, 10, 26, 10))
@@ -27,7 +29,6 @@ IDAT = bytes((73, 68, 65, 84))
 FDAT = bytes((102, 100, 65, 84))
 FDAT2 = bytes((102, 100, 65, 84, 0, 0, 0, 2))
 IEND_CHUNK = bytes((0, 0, 0, 0, 73, 69, 78, 68, 174, 66, 96, 130))
-CRC_MASK = 4294967295
 
 BITS4 = [[int(d) for d in '{:04b}'.format(n)] for n in range(16)]
 BIT_PAIRS = [[((n << m) & 128) // 64 + ((n << m) & 8) // 8 for m in range(4)] for n in range(256)]
@@ -53,7 +54,6 @@ class PngWriter:
         self.alpha = alpha
         self.compression_level = compression_level
         self.masks = masks
-        self._create_crc_table()
         self._create_png_method_dict()
 
     def write_image(self, frames, img_file, palette, attr_map, has_trans, flash_rect):
@@ -61,6 +61,7 @@ class PngWriter:
         frame1 = frames[0]
         width, height = frame1.width, frame1.height
         frame1_data, frame2_data = self._build_image_data(frame1, palette_size, bit_depth, attr_map, flash_rect)
+        deltas = self._get_deltas(frames)
 
         # PNG signature
         img_file.write(PNG_SIGNATURE)
@@ -83,14 +84,14 @@ class PngWriter:
         # acTL
         if len(frames) == 1 and flash_rect:
             img_file.write(ACTL_CHUNK)
-        elif len(frames) > 1:
-            actl_chunk = (97, 99, 84, 76, 0, 0, 0, len(frames), 0, 0, 0, 0)
+        elif len(deltas) > 1:
+            actl_chunk = (97, 99, 84, 76, 0, 0, 0, len(deltas), 0, 0, 0, 0)
             self._write_chunk(img_file, actl_chunk)
 
         # fcTL
-        if len(frames) > 1 or flash_rect:
+        if len(deltas) > 1 or flash_rect:
             seq_num = 0
-            self._write_fctl_chunk(img_file, seq_num, frame1.delay, width, height)
+            self._write_fctl_chunk(img_file, seq_num, deltas[0][1], width, height)
 
         # IDAT
         self._write_img_data_chunk(img_file, IDAT + frame1_data)
@@ -100,10 +101,10 @@ class PngWriter:
             f2_x_offset, f2_y_offset, f2_width, f2_height = flash_rect
             self._write_fctl_chunk(img_file, 1, frame1.delay, f2_width, f2_height, f2_x_offset, f2_y_offset)
             self._write_img_data_chunk(img_file, FDAT2 + frame2_data)
-        for frame in frames[1:]:
+        for frame, delay, x_offset, y_offset in deltas[1:]:
             frame_data = self._build_image_data(frame, palette_size, bit_depth, attr_map)[0]
             seq_num += 1
-            self._write_fctl_chunk(img_file, seq_num, frame.delay, frame.width, frame.height, frame.x_offset, frame.y_offset)
+            self._write_fctl_chunk(img_file, seq_num, delay, frame.width, frame.height, x_offset, y_offset)
             seq_num += 1
             fdat = FDAT + bytes(self._to_bytes(seq_num))
             self._write_img_data_chunk(img_file, fdat + frame_data)
@@ -111,16 +112,63 @@ class PngWriter:
         # IEND
         img_file.write(IEND_CHUNK)
 
-    def _create_crc_table(self):
-        self.crc_table = []
-        for i in range(256):
-            c = i
-            for k in range(8):
-                if c & 1:
-                    c = 3988292384 ^ (c >> 1)
-                else:
-                    c = c >> 1
-            self.crc_table.append(c)
+    def _get_deltas(self, frames):
+        # Return a list of (frame, delay, x_offset, y_offset) tuples for the
+        # frames to write: a frame that is identical to the one before it is
+        # dropped and its delay added to that frame's delay, and a frame that
+        # differs only in part from the one before it is replaced by the part
+        # that changed
+        frame = frames[0]
+        deltas = [[frame, frame.delay, frame.x_offset, frame.y_offset]]
+        for prev_frame, frame in zip(frames, frames[1:]):
+            delta = [frame, frame.delay, frame.x_offset, frame.y_offset]
+            rect = self._get_changed_rect(prev_frame, frame)
+            if rect:
+                x, y, width, height = rect
+                if width < frame.width or height < frame.height:
+                    delta[0] = self._get_region(frame, x, y, width, height)
+                    delta[2] += x
+                    delta[3] += y
+            elif rect is not None and deltas[-1][1] + frame.delay < 65536:
+                deltas[-1][1] += frame.delay
+                continue
+            deltas.append(delta)
+        return deltas
+
+    def _get_changed_rect(self, prev_frame, frame):
+        # Return the smallest UDG-aligned rectangle (relative to the frame and
+        # clipped to its cropping rectangle) containing every UDG that differs
+        # from the one in the same position in the previous frame; return an
+        # empty tuple if no UDGs differ, or None if the frames do not have the
+        # same geometry
+        geometry = (frame.scale, frame.mask, frame.x, frame.y, frame.width, frame.height, frame.x_offset, frame.y_offset)
+        if geometry != (prev_frame.scale, prev_frame.mask, prev_frame.x, prev_frame.y, prev_frame.width,
+                        prev_frame.height, prev_frame.x_offset, prev_frame.y_offset):
+            return None
+        udgs, prev_udgs = frame.udgs, prev_frame.udgs
+        if len(udgs) != len(prev_udgs) or len(udgs[0]) != len(prev_udgs[0]):
+            return None
+        scale, x0, y0, width, height = geometry[0], geometry[2], geometry[3], geometry[4], geometry[5]
+        inc = 8 * scale
+        c0, c1 = x0 // inc, (x0 + width - 1) // inc + 1
+        rows = [r for r in range(y0 // inc, (y0 + height - 1) // inc + 1) if udgs[r][c0:c1] != prev_udgs[r][c0:c1]]
+        if not rows:
+            return ()
+        r0, r1 = rows[0], rows[-1] + 1
+        cols = [c for c in range(c0, c1) if any(udgs[r][c] != prev_udgs[r][c] for r in range(r0, r1))]
+        x, y = max(x0, cols[0] * inc), max(y0, r0 * inc)
+        return (x - x0, y - y0, min(x0 + width, (cols[-1] + 1) * inc) - x, min(y0 + height, r1 * inc) - y)
+
+    def _get_region(self, frame, x, y, width, height):
+        if frame.cropped:
+            region = Frame(frame.udgs, frame.scale, frame.mask, frame.x + x, frame.y + y, width, height)
+        else:
+            # Use the UDGs in the region, so that the region is not cropped
+            inc = 8 * frame.scale
+            udgs = [row[x // inc:(x + width) // inc] for row in frame.udgs[y // inc:(y + height) // inc]]
+            region = Frame(udgs, frame.scale, frame.mask)
+        region.has_masks = frame.has_masks
+        return region
 
     def _create_png_method_dict(self):
         # The PNG method dictionary is keyed on:
@@ -227,21 +275,15 @@ class PngWriter:
 
         return frame1, frame2
 
-    def _get_crc(self, byte_list):
-        crc = CRC_MASK
-        for b in byte_list:
-            crc = self.crc_table[(crc ^ b) & 255] ^ (crc >> 8)
-        return self._to_bytes(crc ^ CRC_MASK)
-
     def _write_chunk(self, img_file, chunk_data):
-        img_file.write(bytes(self._to_bytes(len(chunk_data) - 4))) # length
-        img_file.write(bytes(chunk_data))
-        img_file.write(bytes(self._get_crc(chunk_data))) # CRC
+        self._write_img_data_chunk(img_file, bytes(chunk_data))
 
     def _write_img_data_chunk(self, img_file, img_data):
-        img_file.write(bytes(self._to_bytes(len(img_data) - 4))) # length
-        img_file.write(img_data)
-        img_file.write(bytes(self._get_crc(img_data))) # CRC
+        img_file.write(b''.join((
+            (len(img_data) - 4).to_bytes(4, 'big'), # length
+            img_data,                                # chunk type and data
+            zlib.crc32(img_data).to_bytes(4, 'big')  # CRC
+        )))
 
     def _scan_frame(self, frame, scan_udg_f, *args):
         compressor = zlib.compressobj(self.compression_level)
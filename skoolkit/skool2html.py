@@ -15,8 +15,13 @@
 # SkoolKit. If not, see <http://www.gnu.org/licenses/>.
 
 import glob
+import hashlib
+import inspect
+import json
+import multiprocessing
 import sys
 import os
+import re
 from os.path import isfile, isdir, basename, dirname
 import shutil
 import time
@@ -29,7 +34,7 @@ from skoolkit import (defaults, SkoolKitError, find_file, show_package_dir,
                       CASE_LOWER)
 from skoolkit.config import get_config, show_config, update_options
 from skoolkit.refparser import RefParser
-from skoolkit.skoolhtml import FileInfo
+from skoolkit.skoolhtml import FileInfo, HtmlWriter, join
 from skoolkit.skoolparser import SkoolParser
 
 SEARCH_DIRS = (
@@ -45,6 +50,16 @@ files, font files, and files listed in the [Resources] section of the ref file:
 
 """.lstrip()
 
+# Name of the file in which --incremental records page keys
+MANIFEST = '.skool2html.json'
+
+# Pages to be written by worker processes (when using --jobs)
+_pages = ()
+
+# Macros whose effects (on the memory snapshot, or on the frames used by
+# #UDGARRAY*, #COPY, #OVER and #PLOT) may carry over from one page to the next
+RE_STATEFUL_MACROS = re.compile(r'#(POKES|PUSHS|POPS|COPY|OVER|PLOT|UDGARRAY\*|LET|DEF(INE)?\b)')
+
 def show_search_dirs():
     write(SEARCH_DIRS_MSG)
     prefix = '- '
@@ -229,11 +244,159 @@ def run(infiles, options, config):
             raise SkoolKitError('Invalid page ID: {0}'.format(page_id))
     pages = options.pages or all_page_ids
 
-    write_disassembly(html_writer, options.files, ref_search_dir, options.search, pages, options.themes, options.single_css)
-
-def write_disassembly(html_writer, files, search_dir, extra_search_dirs, pages, css_themes, single_css):
+    manifest = None
+    if options.incremental:
+        manifest = BuildManifest(file_info, _get_build_key(reffiles, html_writer_class, options))
+
+    stateful = _is_stateful(reffiles, options.config_specs, html_writer_class)
+    write_disassembly(html_writer, options.files, ref_search_dir, options.search, pages, options.themes, options.single_css,
+                      options.jobs, manifest, stateful)
+
+def _is_stateful(reffiles, config_specs, html_writer_class):
+    # Return whether the ref files, --config specs or HTML writer class may
+    # make one page depend on what was written before it
+    for fname in reffiles:
+        with open(fname, encoding='utf8', errors='replace') as f:
+            if RE_STATEFUL_MACROS.search(f.read()):
+                return True
+    if any(RE_STATEFUL_MACROS.search(spec) for spec in config_specs):
+        return True
+    # A custom HTML writer class must declare (by setting 'parallel_pages' to
+    # True) that the pages it writes do not depend on each other
+    return html_writer_class is not HtmlWriter and not getattr(html_writer_class, 'parallel_pages', False)
+
+def _uses_stateful_macros(html_writer):
+    parser = html_writer.parser
+    return any(RE_STATEFUL_MACROS.search(repr(_entry_items(e))) for e in parser.memory_map) or \
+           any(RE_STATEFUL_MACROS.search(e) for e in parser.expands)
+
+def _get_build_key(reffiles, html_writer_class, options):
+    sources = []
+    for fname in reffiles + [inspect.getsourcefile(html_writer_class)]:
+        with open(fname, 'rb') as f:
+            sources.append(hashlib.sha256(f.read()).hexdigest())
+    return _digest(VERSION, sorted(get_config('skoolkit').items()), sources, options.config_specs, options.case,
+                   options.base, options.asm_labels, options.create_labels, options.variables, options.themes,
+                   options.single_css, options.search)
+
+def _get_asm_pages(html_writer, cwd, map_file, single_page_path):
+    if html_writer.asm_single_page:
+        return [(single_page_path, html_writer, 'write_entries', (cwd, map_file))]
+    pages = []
+    for i, entry in enumerate(html_writer.memory_map):
+        fname = join(cwd, html_writer.asm_fname(entry.address))
+        pages.append((fname, html_writer, 'write_entry', (cwd, i, map_file)))
+    return pages
+
+def _write_page(page):
+    html_writer, method_name, args = page[1:]
+    file_info = html_writer.file_info
+    file_info.used_images.clear()
+    getattr(html_writer, method_name)(*args)
+    return sorted(file_info.used_images)
+
+def _write_pages(span):
+    return [_write_page(page) for page in _pages[span[0]:span[1]]]
+
+def write_pages(pages, jobs):
+    if jobs < 2:
+        return [_write_page(page) for page in pages]
+
+    # Each worker process is forked from this one (and so shares the parsed
+    # skool file and ref files), and writes a contiguous run of pages
+    global _pages
+    _pages = pages
+    num_pages = len(pages)
+    jobs = min(jobs, num_pages)
+    spans = [(num_pages * i // jobs, num_pages * (i + 1) // jobs) for i in range(jobs)]
+    with multiprocessing.get_context('fork').Pool(jobs, maxtasksperchild=1) as pool:
+        results = pool.map(_write_pages, spans, 1)
+    _pages = ()
+    return [images for span_images in results for images in span_images]
+
+def _digest(*items):
+    return hashlib.sha256(repr(items).encode('utf8')).hexdigest()
+
+def _entry_items(entry):
+    instructions = [(i.ctl, i.addr_str, i.operation, i.bytes, i.asm_label, i.mid_block_comment,
+                     i.comment and (i.comment.rowspan, i.comment.text)) for i in entry.instructions]
+    registers = [(r.delimiters, r.prefix, r.name, r.contents) for r in entry.registers]
+    return (entry.ctl, entry.addr_str, entry.description, entry.details, registers,
+            entry.end_comment, entry.headers, entry.footers, entry.size, instructions)
+
+def _entry_digest(entry):
+    return _digest(*_entry_items(entry))
+
+class BuildManifest:
+    # Records the key of every page written by an incremental build (see
+    # skool2html.py --incremental), along with the images the page uses, so
+    # that pages whose inputs have not changed are skipped on the next build
+    def __init__(self, file_info, build_key):
+        self.path = join(file_info.odir, MANIFEST)
+        self.build_key = build_key
+        self.pages = {}
+        if not file_info.replace_images and isfile(self.path):
+            try:
+                with open(self.path, encoding='utf8') as f:
+                    self.pages = json.load(f)['pages']
+            except (ValueError, KeyError, TypeError):
+                pass
+        self.keys = {}
+
+    def _writer_key(self, html_writer):
+        parser = html_writer.parser
+        layout = [(e.address, e.ctl, [(i.address, i.asm_label, i.reference and i.reference.address)
+                                      for i in e.instructions]) for e in parser.memory_map]
+        return _digest(self.build_key, html_writer.code_id, sorted(html_writer.game_vars.items()),
+                       parser.expands, hashlib.sha256(bytes(parser.snapshot)).hexdigest(), layout)
+
+    def _get_keys(self, pages):
+        writer_keys = {}
+        for path, html_writer, method_name, args in pages:
+            if html_writer not in writer_keys:
+                entries = [_entry_digest(e) for e in html_writer.memory_map]
+                summaries = [(e.description, e.details, e.size) for e in html_writer.memory_map]
+                writer_key = self._writer_key(html_writer)
+                writer_keys[html_writer] = (writer_key, entries, summaries, _digest(writer_key, entries))
+            writer_key, entries, summaries, all_entries = writer_keys[html_writer]
+            if method_name == 'write_entry':
+                # An entry page also shows the title, description and size of
+                # the previous and next entries
+                index = args[1]
+                self.keys[path] = _digest(writer_key, entries[index], summaries[max(index - 1, 0):index + 2])
+            else:
+                self.keys[path] = _digest(all_entries, method_name, args)
+
+    def get_stale_pages(self, pages, file_info, rebuild=False):
+        self._get_keys(pages)
+        if rebuild:
+            return pages
+        stale = []
+        for page in pages:
+            path = page[0]
+            key, images = self.pages.get(path, (None, []))
+            if key != self.keys[path] or not all(file_info.file_exists(f) for f in [path] + images):
+                stale.append(page)
+        return stale
+
+    def update(self, pages, images):
+        for page, page_images in zip(pages, images):
+            self.pages[page[0]] = [self.keys[page[0]], page_images]
+
+    def write(self):
+        with open(self.path, 'w', encoding='utf8') as f:
+            json.dump({'pages': self.pages}, f, indent=1, sort_keys=True)
+
+def write_disassembly(html_writer, files, search_dir, extra_search_dirs, pages, css_themes, single_css, jobs=1, manifest=None,
+                      stateful=False):
     paths = html_writer.paths
     game_vars = html_writer.game_vars
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        jobs = 1
+    if jobs > 1 or manifest:
+        page_list = []
+    else:
+        page_list = None
 
     # Create the disassembly subdirectory if necessary
     odir = html_writer.file_info.odir
@@ -262,23 +425,32 @@ def write_disassembly(html_writer, files, search_dir, extra_search_dirs, pages,
 
     # Write disassembly files
     if 'd' in files:
-        if html_writer.asm_single_page:
-            message = 'Writing ' + normpath(paths['AsmSinglePage'])
+        if page_list is not None:
+            page_list.extend(_get_asm_pages(html_writer, html_writer.code_path, paths['MemoryMap'], paths['AsmSinglePage']))
         else:
-            message = 'Writing disassembly files in ' + normpath(html_writer.code_path)
-        clock(html_writer.write_asm_entries, message)
+            if html_writer.asm_single_page:
+                message = 'Writing ' + normpath(paths['AsmSinglePage'])
+            else:
+                message = 'Writing disassembly files in ' + normpath(html_writer.code_path)
+            clock(html_writer.write_asm_entries, message)
 
     # Write the memory map files
     if 'm' in files:
         for map_name in html_writer.main_memory_maps:
-            clock(html_writer.write_map, 'Writing ' + normpath(paths[map_name]), map_name)
+            if page_list is not None:
+                page_list.append((paths[map_name], html_writer, 'write_map', (map_name,)))
+            else:
+                clock(html_writer.write_map, 'Writing ' + normpath(paths[map_name]), map_name)
 
     # Write pages defined by [Page:*] sections
     if 'P' in files:
         for page_id in pages:
             page_details = html_writer.pages[page_id]
             copy_resources(search_dir, extra_search_dirs, odir, page_details.get('JavaScript'), js_path)
-            clock(html_writer.write_page, 'Writing ' + normpath(paths[page_id]), page_id)
+            if page_list is not None:
+                page_list.append((paths[page_id], html_writer, 'write_page', (page_id,)))
+            else:
+                clock(html_writer.write_page, 'Writing ' + normpath(paths[page_id]), page_id)
 
     # Write other code files
     if 'o' in files:
@@ -291,6 +463,10 @@ def write_disassembly(html_writer, files, search_dir, extra_search_dirs, pages,
             map_name = code['IndexPageId']
             map_path = paths[map_name]
             asm_path = paths[code['CodePathId']]
+            if page_list is not None:
+                page_list.append((map_path, html_writer2, 'write_map', (map_name,)))
+                page_list.extend(_get_asm_pages(html_writer2, asm_path, map_path, paths[code['AsmSinglePageId']]))
+                continue
             clock(html_writer2.write_map, 'Writing ' + normpath(map_path), map_name)
             if html_writer.asm_single_page:
                 message = 'Writing ' + normpath(paths[code['AsmSinglePageId']])
@@ -298,6 +474,28 @@ def write_disassembly(html_writer, files, search_dir, extra_search_dirs, pages,
                 message = 'Writing disassembly files in ' + normpath(asm_path)
             clock(html_writer2.write_entries, message, asm_path, map_path)
 
+    if page_list:
+        # If any page may depend on what was written before it, every page must
+        # be written, and in order by one process, to produce the same output
+        # as a normal single-process run
+        stateful = stateful or any(_uses_stateful_macros(w) for w in {p[1] for p in page_list})
+        if stateful:
+            jobs = 1
+    if manifest:
+        num_pages = len(page_list)
+        page_list = manifest.get_stale_pages(page_list, html_writer.file_info, stateful)
+    if page_list:
+        if jobs > 1:
+            message = 'Writing {} pages using {} processes'.format(len(page_list), min(jobs, len(page_list)))
+        else:
+            message = 'Writing {} pages'.format(len(page_list))
+        images = clock(write_pages, message, page_list, jobs)
+        if manifest:
+            manifest.update(page_list, images)
+    if manifest:
+        manifest.write()
+        notify('Pages written: {}; pages skipped: {}'.format(len(page_list), num_pages - len(page_list)))
+
     # Write index.html
     if 'i' in files:
         clock(html_writer.write_index, 'Writing ' + normpath(paths['GameIndex']))
@@ -331,10 +529,15 @@ def main(args):
                        help="Write the disassembly in decimal.")
     group.add_argument('-H', '--hex', dest='base', action='store_const', const=BASE_16, default=config['Base'],
                        help="Write the disassembly in hexadecimal.")
+    group.add_argument('--incremental', dest='incremental', action='store_const', const=1, default=config['Incremental'],
+                       help="Skip pages whose content has not changed since the\n"
+                            "last build.")
     group.add_argument('-I', '--ini', dest='params', metavar='p=v', action='append', default=[],
                        help="Set the value of the configuration parameter 'p' to\n'v'. This option may be used multiple times.")
     group.add_argument('-j', '--join-css', dest='single_css', metavar='NAME', default=config['JoinCss'],
                        help="Concatenate CSS files into a single file with this name.")
+    group.add_argument('--jobs', dest='jobs', metavar='N', type=int, default=config['Jobs'],
+                       help="Write pages in parallel using N processes.")
     group.add_argument('-l', '--lower', dest='case', action='store_const', const=CASE_LOWER, default=config['Case'],
                        help="Write the disassembly in lower case.")
     group.add_argument('-o', '--rebuild-images', dest='new_images', action='store_const', const=1, default=config['RebuildImages'],
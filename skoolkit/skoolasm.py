@@ -25,6 +25,14 @@ BLOCK_SEP = '\x00'
 
 UDGTABLE_MARKER = '#UDGTABLE'
 
+RE_ADDRESS = re.compile(r'(\A|\s|\()((?:0x|\$)[0-9A-Fa-f]{4}|[1-9][0-9]{2,4})(?!([0-9A-Za-z]|[./*+][0-9]))')
+
+# Characters that TextWrapper converts to spaces
+WRAP_WHITESPACE = frozenset('\t\n\x0b\x0c\r')
+
+# Number of lines to collect before writing them to stdout
+BUFFER_SIZE = 1024
+
 TEMPLATES = {
     'comment': '; {text}',
     'equ': '{label} {equ} {value}',
@@ -39,6 +47,8 @@ class AsmWriter:
         self.parser = parser
         self.templates = TEMPLATES.copy()
         self.templates.update(templates)
+        self._formatters = {}
+        self._buffer = []
         self.show_warnings = self._get_int_property(properties, 'warnings', 1)
         self.asm_address_template = config['Address']
 
@@ -153,7 +163,13 @@ class AsmWriter:
             self.warn(one.format(items.pop(), *args))
 
     def format_template(self, name, fields):
-        return format_template(self.templates.get(name, ''), name, **fields)
+        formatter = self._formatters.get(name)
+        if formatter is None:
+            formatter = self._formatters[name] = self.templates.get(name, '').format
+        try:
+            return formatter(**fields)
+        except (KeyError, ValueError):
+            return format_template(self.templates.get(name, ''), name, **fields)
 
     def write(self):
         for index, entry in enumerate(self.parser.memory_map):
@@ -175,6 +191,7 @@ class AsmWriter:
             self.print_entry()
             self.write_line('')
             self.print_blocks(entry.footers)
+        self.flush()
 
     def print_blocks(self, blocks):
         for block in blocks:
@@ -209,7 +226,15 @@ class AsmWriter:
             self.print_comment_lines(self.entry.end_comment, ignoreua=self.entry.ignoreua['e'])
 
     def write_line(self, s):
-        write_text('{0}{1}'.format(s, self.end))
+        self._buffer.append(s)
+        if len(self._buffer) >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._buffer.append('')
+            write_text(self.end.join(self._buffer))
+            self._buffer = []
 
     def pop_snapshot(self):
         """Replace the current memory snapshot with the one most recently saved
@@ -322,7 +347,12 @@ class AsmWriter:
         lines = []
         for index, block in enumerate(self.expand(text).split(BLOCK_SEP)):
             if index % 2 == 0:
-                if block:
+                if len(block) <= width and block == block.strip() and WRAP_WHITESPACE.isdisjoint(block):
+                    # The block fits on one line, so there is no need to wrap
+                    # it
+                    if block:
+                        lines.append(block)
+                elif block:
                     lines.extend(wrap(block, width))
             elif block.startswith(TABLE_MARKER):
                 table_lines = self.table_writer.format_table(block[len(TABLE_MARKER):].lstrip())
@@ -357,14 +387,15 @@ class AsmWriter:
             if lines:
                 started = True
             for line in lines:
-                if instruction:
-                    self.format_warn('Comment above {1} contains address ({0}) not converted to a label:\n; {2}',
-                                     'Comment above {1} contains addresses ({0}) not converted to labels:\n; {2}',
-                                     self.find_unconverted_addresses(line, ignoreua), instruction.address, line)
-                else:
-                    self.format_warn('Comment contains address ({}) not converted to a label:\n; {}',
-                                     'Comment contains addresses ({}) not converted to labels:\n; {}',
-                                     self.find_unconverted_addresses(line, ignoreua), line)
+                if self.show_warnings:
+                    if instruction:
+                        self.format_warn('Comment above {1} contains address ({0}) not converted to a label:\n; {2}',
+                                         'Comment above {1} contains addresses ({0}) not converted to labels:\n; {2}',
+                                         self.find_unconverted_addresses(line, ignoreua), instruction.address, line)
+                    else:
+                        self.format_warn('Comment contains address ({}) not converted to a label:\n; {}',
+                                         'Comment contains addresses ({}) not converted to labels:\n; {}',
+                                         self.find_unconverted_addresses(line, ignoreua), line)
                 self.write_line(self.format_template('comment', {'text': line}).rstrip())
 
     def print_registers(self):
@@ -391,9 +422,10 @@ class AsmWriter:
                 reg_lines.append(self.format_template('register', subs).rstrip())
                 subs['prefix'] = subs['reg'] = ''
             reg_desc = '\n'.join(reg_lines)
-            self.format_warn('Register description contains address ({}) not converted to a label:\n{}',
-                             'Register description contains addresses ({}) not converted to labels:\n{}',
-                             self.find_unconverted_addresses(reg_desc, self.entry.ignoreua['r']), reg_desc)
+            if self.show_warnings:
+                self.format_warn('Register description contains address ({}) not converted to a label:\n{}',
+                                 'Register description contains addresses ({}) not converted to labels:\n{}',
+                                 self.find_unconverted_addresses(reg_desc, self.entry.ignoreua['r']), reg_desc)
             self.write_line(reg_desc)
 
     def print_instruction_prefix(self, instruction, index):
@@ -412,7 +444,7 @@ class AsmWriter:
         if ignores == []:
             return ()
         addresses = set()
-        for match in re.finditer('(\A|\s|\()((?:0x|\$)[0-9A-Fa-f]{4}|[1-9][0-9]{2,4})(?!([0-9A-Za-z]|[./*+][0-9]))', text):
+        for match in RE_ADDRESS.finditer(text):
             addr = match.group(2)
             if addr.startswith(('0x', '$')):
                 address = int(addr[-4:], 16)
@@ -459,12 +491,13 @@ class AsmWriter:
                 elif rowspan == 1:
                     subs['sep'] = ''
                 oline = self.format_template('instruction', subs).rstrip()
-                self.format_warn('Comment at {1} contains address ({0}) not converted to a label:\n{2}',
-                                 'Comment at {1} contains addresses ({0}) not converted to labels:\n{2}',
-                                 self.find_unconverted_addresses(subs['text'], ignoreua), self.pc, oline)
+                if self.show_warnings:
+                    self.format_warn('Comment at {1} contains address ({0}) not converted to a label:\n{2}',
+                                     'Comment at {1} contains addresses ({0}) not converted to labels:\n{2}',
+                                     self.find_unconverted_addresses(subs['text'], ignoreua), self.pc, oline)
+                    if len(oline) > self.line_width:
+                        self.warn('Line is {0} characters long:\n{1}'.format(len(oline), oline))
                 self.write_line(oline)
-                if len(oline) > self.line_width:
-                    self.warn('Line is {0} characters long:\n{1}'.format(len(oline), oline))
                 continue
 
             ignoreua = instruction.ignoreua['i']
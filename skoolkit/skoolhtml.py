@@ -23,13 +23,14 @@ import posixpath
 import os.path
 from os.path import isfile, isdir, basename
 from collections import defaultdict
+from functools import lru_cache
 import re
 from io import StringIO
 
 from skoolkit import skoolmacro, SkoolKitError, SkoolParsingError, evaluate, format_template, parse_int, warn
 from skoolkit.components import get_component, get_image_writer
 from skoolkit.defaults import REF_FILE
-from skoolkit.graphics import Frame, adjust_udgs, build_udg, font_udgs, scr_udgs
+from skoolkit.graphics import Frame, UdgCache, adjust_udgs, font_udgs, scr_udgs
 from skoolkit.refparser import RefParser
 from skoolkit.skoolparser import TableParser, ListParser
 
@@ -75,6 +76,7 @@ class HtmlWriter:
 
         self.snapshot = self.parser.snapshot
         self._snapshots = [(self.snapshot, '')]
+        self._udg_cache = UdgCache()
         self.asm_entry_dicts = {}
         self.map_entry_dicts = {}
         self.nonexistent_entry_dict = defaultdict(lambda: '', exists=0)
@@ -445,6 +447,17 @@ class HtmlWriter:
         if len(self._snapshots) < 2:
             raise SkoolKitError("Cannot pop snapshot when snapshot stack is empty")
         self.snapshot[:] = self._snapshots.pop()[0]
+        self._udg_cache.clear()
+
+    # API
+    def clear_udg_cache(self):
+        """Clear the cache of graphic data and mask data used by the
+        :ref:`UDG` and :ref:`UDGARRAY` macros. This must be done after
+        modifying the contents of the memory snapshot directly (the
+        :ref:`POKES` macro and
+        :meth:`~skoolkit.skoolhtml.HtmlWriter.pop_snapshot` do it
+        automatically)."""
+        self._udg_cache.clear()
 
     # API
     def push_snapshot(self, name=''):
@@ -952,10 +965,9 @@ class HtmlWriter:
         return ''
 
     def _write_image(self, image_path, frames):
-        f = self.file_info.open_file(image_path, mode='wb')
-        content = self.image_writer.write_image(frames, f)
-        fsize = f.tell()
-        f.close()
+        with self.file_info.open_file(image_path, mode='wb') as f:
+            content = self.image_writer.write_image(frames, f)
+            fsize = f.tell()
         if fsize:
             self.file_info.add_image(image_path)
         elif isfile(f.name):
@@ -1073,6 +1085,11 @@ class HtmlWriter:
     def expand_plot(self, text, index, cwd):
         return skoolmacro.parse_plot(text, index, self.fields, self.frames)
 
+    def expand_pokes(self, text, index, cwd):
+        end, rep = skoolmacro.parse_pokes(self, text, index, cwd)
+        self._udg_cache.clear()
+        return end, rep
+
     def expand_r(self, text, index, cwd):
         end, addr_str, address, code_id, anchor, link_text = skoolmacro.parse_r(self.fields, text, index)
         container = self.parser.get_container(address, code_id)
@@ -1110,10 +1127,18 @@ class HtmlWriter:
         end, table = self.table_parser.parse_text(self, text, index, cwd)
         return end, self.build_table(table)
 
+    def _build_udg(self, addr, attr, step, inc, flip, rotate, mask, mask_addr, mask_step):
+        if not mask:
+            mask_addr = None
+        udg = self._udg_cache.get_udg(self.snapshot, attr, addr, step, inc, mask_addr, mask_step)
+        udg.flip(flip)
+        udg.rotate(rotate)
+        return udg
+
     def expand_udg(self, text, index, cwd):
         end, crop_rect, fname, frame, alt, params = skoolmacro.parse_udg(text, index, self.fields)
         addr, attr, scale, step, inc, flip, rotate, mask, tindex, alpha, mask_addr, mask_step = params
-        udgs = lambda: [[build_udg(self.snapshot, addr, attr, step, inc, flip, rotate, mask, mask_addr, mask_step)]]
+        udgs = lambda: [[self._build_udg(addr, attr, step, inc, flip, rotate, mask, mask_addr, mask_step)]]
         if not fname and not frame:
             fname = format_template(self.udg_fname_template, 'UDGFilename', addr=addr, attr=attr, scale=scale)
             if frame == '':
@@ -1129,7 +1154,7 @@ class HtmlWriter:
         if index < len(text) and text[index] == '*':
             return self._expand_udgarray_with_frames(text, index, cwd)
 
-        end, crop_rect, fname, frame, alt, params = skoolmacro.parse_udgarray(text, index, self.snapshot, fields=self.fields)
+        end, crop_rect, fname, frame, alt, params = skoolmacro.parse_udgarray(text, index, self.snapshot, fields=self.fields, udg_cache=self._udg_cache)
         udg_array, scale, flip, rotate, mask, tindex, alpha = params
         udgs = lambda: adjust_udgs(udg_array, flip, rotate)
         frame = Frame(udgs, scale, mask, *crop_rect, name=frame, tindex=tindex, alpha=alpha)
@@ -1158,24 +1183,59 @@ class FileInfo:
         self.odir = join(topdir, game_dir)
         self.replace_images = replace_images
         self.images = set()
+        self.used_images = set()
 
     def open_file(self, *names, mode='w'):
         path = self.odir
         for name in names:
             path = join(path, name)
         if not isdir(os.path.dirname(path)):
-            os.makedirs(os.path.dirname(path))
-        return open(path, mode, encoding=None if 'b' in mode else 'utf8')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if 'b' in mode:
+            return ImageFile(path)
+        return open(path, mode, encoding='utf8')
 
     def add_image(self, image_path):
         self.images.add(image_path)
 
     def need_image(self, image_path):
+        self.used_images.add(image_path)
         return image_path not in self.images if self.replace_images else not self.file_exists(image_path)
 
     def file_exists(self, fname):
         return isfile(join(self.odir, fname))
 
+class ImageFile:
+    # A binary file that is written under a temporary name and moved into place
+    # when closed, so that two or more processes (see skool2html.py --jobs) may
+    # write the same image file concurrently
+    def __init__(self, path):
+        self.name = path
+        self._temp_name = '{}.{}.tmp'.format(path, os.getpid())
+        self._file = open(self._temp_name, 'wb')
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type:
+            self.discard()
+        else:
+            self.close()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            os.replace(self._temp_name, self.name)
+
+    def discard(self):
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._temp_name)
+
 class Bytes:
     def __init__(self, values=()):
         self.values = values
@@ -1189,6 +1249,10 @@ class Bytes:
             bspec, sep, fmt = spec, '', ''
         return '{:{}}'.format(sep.join(v.__format__(bspec) for v in self.values), fmt)
 
+@lru_cache(maxsize=1024)
+def _compile_template_expr(text):
+    return compile(re.sub(r'\[([^0-9][^]]*)\]', r"['\1']", text).strip(' \t'), '<template>', 'eval')
+
 class TemplateFormatter:
     """Initialise the template formatter.
 
@@ -1197,6 +1261,8 @@ class TemplateFormatter:
     # Component API
     def __init__(self, templates):
         self.templates = templates
+        self._lines = {}
+        self._compiled = {}
 
     # Component API
     def format_template(self, page_id, name, fields):
@@ -1207,20 +1273,132 @@ class TemplateFormatter:
         :param fields: A dictionary of replacement field values.
         :return: The text of the formatted template.
         """
+        tname, lines = self._get_lines(page_id, name, fields)
+        if self._compiled is None:
+            nodes = None
+        elif lines in self._compiled:
+            nodes = self._compiled[lines]
+        else:
+            nodes = self._compiled[lines] = self._compile(lines)
+        if nodes is None:
+            lines = self._process_directives(lines, fields)
+        else:
+            t_lines, lines = lines, []
+            try:
+                self._render(nodes, fields, (), lines)
+            except Exception:
+                # Process the template line by line to raise the same error
+                # as it would if it had not been compiled
+                self._process_directives(t_lines, fields)
+                raise
+        return format_template('\n'.join(lines), tname, **fields)
+
+    def _get_lines(self, page_id, name, fields):
+        key = (page_id, name)
+        if key in self._lines:
+            return self._lines[key]
         tname, lines = self._get_template(page_id, name)
         try:
-            lines = self._process_include(page_id, lines, fields)
+            lines, static = self._process_include(page_id, lines, fields)
         except SkoolKitError as e:
             raise SkoolKitError("Invalid include directive: {}".format(e.args[0]))
+        if static:
+            self._lines[key] = (tname, tuple(lines))
+        return tname, tuple(lines)
+
+    def _process_directives(self, lines, fields):
         try:
             lines = self._process_foreach(lines, fields)
         except (skoolmacro.MacroParsingError, NameError, ValueError) as e:
             raise SkoolKitError("Invalid foreach directive: {}".format(e.args[0]))
         try:
-            lines = self._process_if(lines, fields)
+            return self._process_if(lines, fields)
         except (SkoolKitError, skoolmacro.MacroParsingError, NameError, ValueError) as e:
             raise SkoolKitError("Invalid if directive: {}".format(e.args[0]))
-        return format_template('\n'.join(lines), tname, **fields)
+
+    def _compile(self, lines):
+        # Compile the foreach and if directives in a template into a tree of
+        # nodes, each of which is either a line of text, a loop
+        # (varname, seqname, nodes), or a conditional (expr, nodes, nodes).
+        # Return None if the directives are not properly nested, in which
+        # case the template is processed line by line whenever it is used.
+        try:
+            processed = []
+            stack = [processed]
+            for line in lines:
+                directive = self._html_template_directive(line)
+                if directive.startswith('foreach('):
+                    varname, seqname = skoolmacro.parse_strings(directive, 7, 2)[1]
+                    stack.append([])
+                    stack[-2].append((varname, seqname, stack[-1]))
+                elif directive == 'endfor' and len(stack) > 1:
+                    stack.pop()
+                else:
+                    stack[-1].append(line)
+        except (skoolmacro.MacroParsingError, NameError, ValueError) as e:
+            raise SkoolKitError("Invalid foreach directive: {}".format(e.args[0]))
+        if len(stack) == 1:
+            try:
+                return self._compile_if(processed)
+            except skoolmacro.MacroParsingError as e:
+                raise SkoolKitError("Invalid if directive: {}".format(e.args[0]))
+
+    def _compile_if(self, lines):
+        nodes = []
+        stack = [nodes]
+        for line in lines:
+            if isinstance(line, tuple):
+                varname, seqname, loop = line
+                loop = self._compile_if(loop)
+                if loop is None:
+                    return None
+                stack[-1].append((varname, seqname, loop))
+                continue
+            directive = self._html_template_directive(line)
+            if directive.startswith('if('):
+                end, expr = skoolmacro.parse_brackets(directive, 2)
+                node = (expr, [], [])
+                stack[-1].append(node)
+                stack.append(node[1])
+            elif directive == 'else' and len(stack) > 1:
+                node = stack[-2][-1]
+                if stack[-1] is not node[1]:
+                    return None
+                stack[-1] = node[2]
+            elif directive == 'endif' and len(stack) > 1:
+                stack.pop()
+            else:
+                stack[-1].append(line)
+        if len(stack) == 1:
+            return nodes
+
+    def _render(self, nodes, fields, subs, lines):
+        # Like the line-by-line processor, evaluate every loop sequence and
+        # every condition (even in a branch not taken), but add to 'lines'
+        # only the lines in the branches taken (or none if 'lines' is None)
+        for node in nodes:
+            if isinstance(node, str):
+                if lines is not None:
+                    for substr, rep in subs:
+                        node = node.replace(substr, rep)
+                    lines.append(node)
+            elif isinstance(node[1], str):
+                varname, seqname, loop = node
+                for substr, rep in subs:
+                    seqname = seqname.replace(substr, rep)
+                seq = self._eval_template_expr(seqname, fields)
+                for i in range(len(seq)):
+                    self._render(loop, fields, subs + ((varname, '{}[{}]'.format(seqname, i)),), lines)
+            else:
+                expr, if_nodes, else_nodes = node
+                for substr, rep in subs:
+                    expr = expr.replace(substr, rep)
+                if self._eval_template_expr(expr, fields):
+                    self._render(if_nodes, fields, subs, lines)
+                    self._render(else_nodes, fields, subs, None)
+                else:
+                    self._render(if_nodes, fields, subs, None)
+                    self._render(else_nodes, fields, subs, lines)
 
     def _get_template(self, page_id, name):
         tname = page_id
@@ -1236,14 +1414,17 @@ class TemplateFormatter:
             raise SkoolKitError("'{}' template does not exist".format(e.args[0]))
 
     def _process_include(self, page_id, lines, fields):
+        static = True
         while 1:
             done = True
             processed = []
             for line in lines:
                 directive = self._html_template_directive(line)
                 if directive.startswith('include('):
+                    tname = skoolmacro.parse_strings(directive, 7, 1)[1]
+                    static = static and '{' not in tname
                     try:
-                        tname = skoolmacro.parse_strings(directive, 7, 1)[1].format(**fields)
+                        tname = tname.format(**fields)
                     except KeyError as e:
                         raise SkoolKitError("Unrecognised field '{}'".format(e.args[0]))
                     if tname:
@@ -1252,7 +1433,7 @@ class TemplateFormatter:
                 else:
                     processed.append(line)
             if done:
-                return processed
+                return processed, static
             lines = processed
 
     def _process_foreach(self, lines, fields):
@@ -1312,7 +1493,7 @@ class TemplateFormatter:
     def _eval_template_expr(self, expr, fields):
         if expr:
             try:
-                return eval(re.sub('\[([^0-9][^]]*)\]', r"['\1']", expr.format(**fields)), None, fields)
+                return eval(_compile_template_expr(expr.format(**fields)), None, fields)
             except SyntaxError:
                 raise ValueError("Syntax error in expression: '{}'".format(expr))
             except KeyError as e:
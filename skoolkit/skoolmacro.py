@@ -23,7 +23,7 @@ from string import Template
 
 from skoolkit import (BASE_10, BASE_16, CASE_LOWER, CASE_UPPER, VERSION,
                       SkoolKitError, SkoolParsingError, eval_variable, evaluate)
-from skoolkit.graphics import Udg
+from skoolkit.graphics import Udg, UdgCache
 
 _map_cache = {}
 
@@ -475,7 +475,10 @@ def expand_macros(writer, text, *cwd):
     if '#' not in text:
         return text
 
-    index = 0
+    # Expanded text is accumulated in 'output'; 'text' is rebuilt only when a
+    # replacement contains macros and therefore has to be rescanned
+    output = []
+    pos = index = 0
     while 1:
         search = RE_MACRO.search(text, index)
         if not search:
@@ -485,9 +488,13 @@ def expand_macros(writer, text, *cwd):
             raise SkoolParsingError('Found unknown macro: {}'.format(marker))
         index, start = search.span()
 
-        while RE_EXPAND.match(text, start):
-            end, expr = parse_strings(text, start + 1, 1)
-            text = text[:start] + expand_macros(writer, expr, *cwd) + text[end:]
+        if RE_EXPAND.match(text, start):
+            output.append(text[pos:index])
+            text, start = text[index:], start - index
+            pos = index = 0
+            while RE_EXPAND.match(text, start):
+                end, expr = parse_strings(text, start + 1, 1)
+                text = text[:start] + expand_macros(writer, expr, *cwd) + text[end:]
 
         repf = writer.macros[marker]
         try:
@@ -496,11 +503,16 @@ def expand_macros(writer, text, *cwd):
             raise SkoolParsingError('Found unsupported macro: {}'.format(marker))
         except MacroParsingError as e:
             raise SkoolParsingError('Error while parsing {} macro: {}'.format(marker, e.args[0]))
-        text = text[:index] + rep + text[abs(end):]
-        if end < 0:
-            index += len(rep)
+        output.append(text[pos:index])
+        if end < 0 or not RE_MACRO.search(rep + text[end:end + 1]):
+            output.append(rep)
+            pos = index = abs(end)
+        else:
+            text = rep + text[end:]
+            pos = index = 0
 
-    return text
+    output.append(text[pos:])
+    return ''.join(output)
 
 def parse_call(writer, text, index, *cwd):
     # #CALL:methodName(args)
@@ -1029,13 +1041,15 @@ def parse_udg(text, index=0, fields=None):
     end, fname, frame, alt = _parse_image_fname(text, end)
     return end, crop_rect, fname, frame, alt, (addr, attr, scale, step, inc, flip, rotate, mask, tindex, alpha, mask_addr, mask_step)
 
-def parse_udgarray(text, index, snapshot=None, req_fname=True, fields=None):
+def parse_udgarray(text, index, snapshot=None, req_fname=True, fields=None, udg_cache=None):
     # #UDGARRAYwidth[,attr,scale,step,inc,flip,rotate,mask,tindex,alpha];addr[,attr,step,inc][:addr[,step]];...[{x,y,width,height}](fname)
     names = ('width', 'attr', 'scale', 'step', 'inc', 'flip', 'rotate', 'mask', 'tindex', 'alpha')
     defaults = (56, 2, 1, 0, 0, 0, 1, 0, -1)
     end, width, attr, scale, step, inc, flip, rotate, mask, tindex, alpha = parse_ints(text, index, defaults=defaults, names=names, fields=fields)
     udg_array = [[]]
     has_masks = False
+    if snapshot and udg_cache is None:
+        udg_cache = UdgCache()
 
     while end < len(text) and text[end] == ';':
         names = ('attr', 'step', 'inc')
@@ -1048,6 +1062,7 @@ def parse_udgarray(text, index, snapshot=None, req_fname=True, fields=None):
         else:
             udg_attr, udg_step, udg_inc = defaults
         mask_addresses = []
+        mask_step = udg_step
         if end < len(text) and text[end] == ':':
             end, mask_addresses = parse_address_range(text, end + 1, width, fields)
             if mask_addresses is None:
@@ -1056,16 +1071,11 @@ def parse_udgarray(text, index, snapshot=None, req_fname=True, fields=None):
                 mask_addresses = []
             if end < len(text) and text[end] == ',':
                 end, mask_step = parse_ints(text, end + 1, defaults=(udg_step,), names=('step',), fields=fields)
-            else:
-                mask_step = udg_step
         if snapshot:
             has_masks = has_masks or len(mask_addresses) > 0
             mask_addresses += [None] * (len(udg_addresses) - len(mask_addresses))
             for u, m in zip(udg_addresses, mask_addresses):
-                udg_bytes = [(snapshot[u + n * udg_step] + udg_inc) % 256 for n in range(8)]
-                udg = Udg(udg_attr, udg_bytes)
-                if m is not None and mask:
-                    udg.mask = [snapshot[m + n * mask_step] for n in range(8)]
+                udg = udg_cache.get_udg(snapshot, udg_attr, u, udg_step, udg_inc, m, mask_step)
                 if len(udg_array[-1]) == width:
                     udg_array.append([udg])
                 else:
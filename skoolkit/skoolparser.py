@@ -17,6 +17,7 @@
 from collections import defaultdict, namedtuple
 from html import escape
 import re
+from types import MappingProxyType
 
 from skoolkit import (BASE_10, BASE_16, CASE_LOWER, CASE_UPPER, SkoolParsingError,
                       warn, wrap, get_int_param, parse_int, open_file, z80)
@@ -875,7 +876,8 @@ class Mode:
             if self.org != '':
                 instruction.org = self.org
             instruction.nowarn = self.nowarn
-            instruction.ignoreua = {k: self.ignoreua[k] for k in 'im'}
+            if self.ignoreua['i'] is not None or self.ignoreua['m'] is not None:
+                instruction.ignoreua = {k: self.ignoreua[k] for k in 'im'}
 
             parsed = [parse_asm_sub_fix_directive(d) for d in self.subs[max(self.subs)]]
             before = self.compose_instructions(s for s in parsed if s[0].prepend)
@@ -1162,7 +1164,17 @@ class InstructionUtility:
         is_def = instruction.operation.upper().startswith(('DEFB ', 'DEFM ', 'DEFS ', 'DEFW '))
         return int(assemble > 1 or (assemble and is_def)) + int(assemble > 1 and not is_def)
 
+# Shared by every instruction that has no @ignoreua directive
+NO_IGNOREUA = MappingProxyType({'i': None, 'm': None})
+
 class Instruction:
+    # Instructions make up the bulk of a parsed skool file, so their standard
+    # attributes are stored in slots; '__dict__' is retained so that writers
+    # and custom components may still set attributes of their own
+    __slots__ = ('ctl', 'addr_str', 'addr_base', 'address', 'keep', 'operation', 'refs', 'rrefs', 'bytes',
+                 'container', 'reference', 'mid_block_comment', 'comment', 'referrers', 'asm_label', 'org',
+                 'sub', 'nowarn', 'ignoreua', '__dict__')
+
     def __init__(self, ctl, addr_str, operation):
         self.ctl = ctl
         if addr_str.startswith('$'):
@@ -1181,7 +1193,7 @@ class Instruction:
         self.reference = None
         self.mid_block_comment = None
         self.comment = None
-        self.referrers = []
+        self.referrers = ()
         self.asm_label = None
         self.org = addr_str
         # If this instruction has no address, it was inserted between
@@ -1189,13 +1201,15 @@ class Instruction:
         # instruction already
         self.sub = self.address is None    # API (InstructionUtility)
         self.nowarn = None                 # API (InstructionUtility)
-        self.ignoreua = {'i': None, 'm': None}
+        self.ignoreua = NO_IGNOREUA
 
     def set_comment(self, rowspan, text):
         self.comment = Comment(rowspan, text)
 
     def add_referrer(self, routine):
-        if routine not in self.referrers:
+        if not self.referrers:
+            self.referrers = [routine]
+        elif routine not in self.referrers:
             self.referrers.append(routine)
         self.container.add_referrer(routine)
 
@@ -1214,6 +1228,8 @@ class Instruction:
             self.comment.apply_replacements(repf)
 
 class Comment:
+    __slots__ = ('rowspan', 'text')
+
     def __init__(self, rowspan, text):
         self.rowspan = rowspan
         self.text = text
@@ -17,10 +17,10 @@
 import argparse
 from collections import namedtuple
 
-from skoolkit import find_file, info, integer, open_file, VERSION
+from skoolkit import SkoolKitError, find_file, info, integer, open_file, VERSION
 from skoolkit.components import get_component
 from skoolkit.config import get_config, show_config, update_options
-from skoolkit.snactl import write_ctl
+from skoolkit.snactl import read_code_maps, write_code_map, write_ctl
 from skoolkit.snapshot import make_snapshot
 
 END = 65536
@@ -28,6 +28,16 @@ END = 65536
 Config = namedtuple('Config', 'text_chars text_min_length_code text_min_length_data words')
 
 def run(snafile, options, config):
+    code_map = options.code_map
+    if options.save_map:
+        if not code_map:
+            raise SkoolKitError('No code maps to save')
+        merged_map = read_code_maps(code_map, options.save_map.lower().endswith('.prof'))
+        write_code_map(merged_map, options.save_map)
+        code_map = bytearray(map(bool, merged_map))
+    elif code_map and len(code_map) == 1:
+        code_map = code_map[0]
+
     words = set()
     dict_fname = config['Dictionary']
     if dict_fname:
@@ -41,10 +51,10 @@ def run(snafile, options, config):
         else:
             info("Dictionary file '{}' not found".format(dict_fname))
     ctl_config = Config(config['TextChars'], config['TextMinLengthCode'], config['TextMinLengthData'], words)
-    snapshot, start, end = make_snapshot(snafile, options.org, options.start, options.end, options.page)
+    snapshot, start, end = make_snapshot(snafile, options.org, options.start, options.end, options.page, True)
     if options.start is None:
         options.start = 0
-    ctls = get_component('ControlFileGenerator').generate_ctls(snapshot, start, end, options.code_map, ctl_config)
+    ctls = get_component('ControlFileGenerator').generate_ctls(snapshot, start, end, code_map, ctl_config)
     write_ctl(ctls, options.ctl_hex)
 
 def main(args):
@@ -65,12 +75,14 @@ def main(args):
                        help="Set the value of the configuration parameter 'p' to 'v'. This option may be used multiple times.")
     group.add_argument('-l', '--hex-lower', dest='ctl_hex', action='store_const', const=1, default=config['Hex'],
                        help='Write lower case hexadecimal addresses.')
-    group.add_argument('-m', '--map', dest='code_map', metavar='FILE',
-                       help='Use FILE as a code execution map.')
+    group.add_argument('-m', '--map', dest='code_map', metavar='FILE', action='append',
+                       help='Use FILE as a code execution map. This option may be used multiple times.')
     group.add_argument('-o', '--org', dest='org', metavar='ADDR', type=integer,
                        help='Specify the origin address of a binary file (default: 65536 - length).')
     group.add_argument('-p', '--page', dest='page', metavar='PAGE', type=int, choices=list(range(8)),
                        help='Specify the page (0-7) of a 128K snapshot to map to 49152-65535.')
+    group.add_argument('--save-map', dest='save_map', metavar='FILE',
+                       help='Merge the code execution maps and save them in FILE.')
     group.add_argument('--show-config', dest='show_config', action='store_true',
                        help="Show configuration parameter values.")
     group.add_argument('-s', '--start', dest='start', metavar='ADDR', type=integer,
@@ -81,9 +81,9 @@ def _write_image(frame, img_file, animated):
 def run(infile, outfile, options):
     snapshot_reader = get_snapshot_reader()
     if options.binary or options.org is not None or snapshot_reader.can_read(infile):
-        snapshot = make_snapshot(infile, options.org)[0]
+        snapshot = make_snapshot(infile, options.org, memory=True)[0]
     elif infile[-4:].lower() == '.scr':
-        snapshot = make_snapshot(infile, 16384)[0]
+        snapshot = make_snapshot(infile, 16384, memory=True)[0]
     else:
         try:
             snapshot = BinWriter(infile, fix_mode=options.fix_mode).snapshot
@@ -52,7 +52,7 @@ def get_ctl_parser(ctls, infile, start, end, def_start, def_end):
     return ctl_parser
 
 def run(infile, options, config):
-    snapshot, start, end = make_snapshot(infile, options.org, options.start, options.end, options.page)
+    snapshot, start, end = make_snapshot(infile, options.org, options.start, options.end, options.page, True)
     if options.start is None:
         options.start = 0
     ctl_parser = get_ctl_parser(options.ctls, infile, options.start, options.end, start, end)
@@ -16,6 +16,10 @@
 
 import sys
 import os
+import re
+from bisect import bisect_right
+from collections import Counter
+from operator import add, or_
 
 from skoolkit import SkoolKitError, open_file, read_bin_file, write_line, get_address_format
 from skoolkit.ctlparser import CtlParser
@@ -23,10 +27,46 @@ from skoolkit.opcodes import END, decode
 from skoolkit.skoolctl import AD_ORG, AD_START
 from skoolkit.snaskool import Disassembly
 
+RE_NON_BLANK_LINE = re.compile(r'^[^\S\n]*\S', re.M)
+
+RE_FUSE_COUNT = re.compile(',([0-9]+)')
+
 class CodeMapError(SkoolKitError):
     pass
 
-def _get_code_blocks(snapshot, start, end, fname):
+# Byte values that expand each byte of a Z80 map file into 8 flags (one per
+# address, least significant bit first)
+Z80_MAP_BITS = [bytes((b >> i) & 1 for i in range(8)) for b in range(256)]
+
+# Translation table that reduces each byte of a SpecEmu map file to its
+# 'executed' flag (bit 0)
+SPECEMU_MAP_BITS = bytes(b & 1 for b in range(256))
+
+# Size of each chunk of a text-based code map to read and scan at once
+CHUNK_SIZE = 1048576
+
+def _get_code_blocks(snapshot, start, end, code_map):
+    if isinstance(code_map, str):
+        executed = read_code_maps((code_map,))
+    elif isinstance(code_map, (bytes, bytearray)):
+        executed = code_map
+    else:
+        executed = read_code_maps(code_map)
+
+    code_blocks = []
+    address = executed.find(1, start, end)
+    while address >= 0:
+        size = next(decode(snapshot, address, address + 1))[1]
+        if code_blocks and address <= sum(code_blocks[-1]):
+            if address == sum(code_blocks[-1]):
+                code_blocks[-1][1] += size
+        else:
+            code_blocks.append([address, size])
+        address = executed.find(1, address + 1, end)
+
+    return code_blocks
+
+def _read_code_map(fname, code_map):
     if os.path.isdir(fname):
         raise SkoolKitError('{0} is a directory'.format(fname))
     try:
@@ -40,48 +80,104 @@ def _get_code_blocks(snapshot, start, end, fname):
         # Assume this is a Z80 map file
         sys.stderr.write('Reading {0}'.format(fname))
         sys.stderr.flush()
-        addresses = []
-        data = read_bin_file(fname)
-        address = start & 65528
-        for b in data[start // 8:end // 8 + 1]:
-            for i in range(8):
-                if b & 1 and start <= address < end:
-                    addresses.append(address)
-                b >>= 1
-                address += 1
+        code_map.merge(b''.join([Z80_MAP_BITS[b] for b in read_bin_file(fname)]))
     elif size == 65536:
         # Assume this is a SpecEmu map file
         sys.stderr.write('Reading {}'.format(fname))
         sys.stderr.flush()
-        addresses = []
-        data = read_bin_file(fname)
-        for address in range(start, end):
-            if data[address] & 1:
-                addresses.append(address)
+        code_map.merge(read_bin_file(fname).translate(SPECEMU_MAP_BITS))
     else:
         sys.stderr.write('Reading {0}: '.format(fname))
         sys.stderr.flush()
         with open_file(fname) as f:
-            addresses = _get_addresses(f, fname, size, start, end)
+            _get_addresses(f, fname, size, code_map)
     sys.stderr.write('\n')
 
-    code_blocks = []
-    for address in addresses:
-        size = next(decode(snapshot, address, address + 1))[1]
-        if code_blocks and address <= sum(code_blocks[-1]):
-            if address == sum(code_blocks[-1]):
-                code_blocks[-1][1] += size
+class _ExecutedFlags:
+    # Collects the addresses found in code maps as a 65536-byte bitmap of
+    # 'executed' flags
+    counts = False
+
+    def __init__(self):
+        self.data = bytearray(65536)
+
+    def add(self, address, count):
+        self.data[address] = 1
+
+    def update(self, counts):
+        # Add the addresses in a dictionary of execution counts
+        for address in counts:
+            self.data[address] = 1
+
+    def merge(self, executed):
+        # Merge 65536 'executed' flags (0 or 1)
+        self.data[:] = map(or_, self.data, executed)
+
+class _ExecutionCounts:
+    # Collects the addresses found in code maps as a list of 65536 execution
+    # counts
+    counts = True
+
+    def __init__(self):
+        self.data = [0] * 65536
+
+    def add(self, address, count):
+        self.data[address] += count
+
+    def update(self, counts):
+        # Add the addresses in a dictionary of execution counts
+        for address, count in counts.items():
+            self.data[address] += count
+
+    def merge(self, executed):
+        # Merge 65536 'executed' flags (0 or 1)
+        self.data[:] = map(add, self.data, executed)
+
+def _fuse_count(s_line):
+    match = RE_FUSE_COUNT.match(s_line, 6)
+    if match:
+        return int(match.group(1))
+    return 1
+
+class _LogFormat:
+    def __init__(self, address_f, pattern, base=16, ignore_prefixes=(), count_f=None):
+        # A function that extracts the address field from a stripped line
+        self.address_f = address_f
+        # A pattern that matches every well-formed line, and whose group(1)
+        # is the same as the address field (optionally followed by a comma and
+        # the execution count field if 'count_f' is given)
+        self.pattern = re.compile(r'^[^\S\n]*' + pattern, re.M)
+        self.base = base
+        # A function that extracts the execution count from a stripped line
+        # (if None, each line counts as one execution)
+        self.count_f = count_f
+        self.ignore_prefixes = ignore_prefixes
+        if ignore_prefixes:
+            self.ignore = re.compile(r'^[^\S\n]*(?:{})'.format('|'.join(ignore_prefixes)), re.M)
         else:
-            code_blocks.append([address, size])
+            self.ignore = None
 
-    return code_blocks
+def _get_log_format(fname, s_line):
+    if s_line.startswith('0x'):
+        # Fuse profile
+        return _LogFormat(lambda s_line: s_line[2:6], '0x([0-9A-Fa-f]{4}(?:,[0-9]+)?)', count_f=_fuse_count), True
+    if s_line.startswith('PC = '):
+        # Spud log
+        return _LogFormat(lambda s_line: s_line[5:9], 'PC = ([0-9A-Fa-f]{4})'), True
+    if s_line.startswith('PC:'):
+        # SpecEmu log
+        ignore_prefixes = ('PC:', 'IX:', 'HL:', 'DE:', 'BC:', 'AF:')
+        return _LogFormat(lambda s_line: s_line[:4], '([0-9A-Fa-f]{4})', ignore_prefixes=ignore_prefixes), False
+    if s_line.endswith('decimal'):
+        # Zero log
+        address_f = lambda s_line: s_line[:s_line.find('\t')]
+        if s_line.endswith('in decimal'):
+            return _LogFormat(address_f, r'([0-9]{1,5})\t(?=[^\n]*\S)', 10), False
+        return _LogFormat(address_f, r'([0-9A-Fa-f]{1,4})\t(?=[^\n]*\S)'), False
+    raise CodeMapError('{0}: Unrecognised format'.format(fname))
 
-def _get_addresses(f, fname, size, start, end):
-    addresses = set()
-    base = 16
+def _get_addresses(f, fname, size, code_map):
     i = 1
-    rewind = True
-    ignore_prefixes = ()
 
     s_line = ''
     while 1:
@@ -93,56 +189,81 @@ def _get_addresses(f, fname, size, start, end):
         if s_line:
             break
 
-    if s_line.startswith('0x'):
-        # Fuse profile
-        address_f = lambda s_line: s_line[2:6]
-    elif s_line.startswith('PC = '):
-        # Spud log
-        address_f = lambda s_line: s_line[5:9]
-    elif s_line.startswith('PC:'):
-        # SpecEmu log
-        address_f = lambda s_line: s_line[:4]
-        ignore_prefixes = ('PC:', 'IX:', 'HL:', 'DE:', 'BC:', 'AF:')
-        rewind = False
-    elif s_line.endswith('decimal'):
-        # Zero log
-        if s_line.endswith('in decimal'):
-            base = 10
-        address_f = lambda s_line: s_line[:s_line.find('\t')]
-        rewind = False
-    else:
-        raise CodeMapError('{0}: Unrecognised format'.format(fname))
+    log_format, rewind = _get_log_format(fname, s_line)
 
     if rewind:
         f.seek(0)
         i = 1
 
+    progress = None
     while 1:
-        line = f.readline()
-        if not line:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
             break
-        progress_msg = '{0}%'.format((100 * f.tell()) // size)
-        sys.stderr.write(progress_msg + chr(8) * len(progress_msg))
-        sys.stderr.flush()
+        if not chunk.endswith('\n'):
+            chunk += f.readline()
+        num_lines = chunk.count('\n') + int(not chunk.endswith('\n'))
+        if not _scan_chunk(log_format, chunk, code_map):
+            _parse_lines(log_format, chunk, code_map, fname, i)
+        i += num_lines
+        percent = (100 * f.tell()) // size
+        if percent != progress:
+            progress = percent
+            progress_msg = '{0}%'.format(percent)
+            sys.stderr.write(progress_msg + chr(8) * len(progress_msg))
+            sys.stderr.flush()
+
+def _scan_chunk(log_format, chunk, code_map):
+    # Collect the addresses from a chunk of a log file in bulk; return False
+    # (and leave 'code_map' unchanged) if any non-blank line in the chunk is not
+    # well-formed, so that the chunk can be parsed line by line instead
+    found = log_format.pattern.findall(chunk)
+    matched = len(found)
+    if log_format.ignore:
+        matched += len(log_format.ignore.findall(chunk))
+    if matched != len(RE_NON_BLANK_LINE.findall(chunk)):
+        return False
+    if not code_map.counts:
+        # Each address needs to be added only once, so the counts are ignored
+        values = dict.fromkeys({int(f.partition(',')[0], log_format.base) for f in set(found)}, 1)
+    elif log_format.count_f:
+        values = Counter()
+        for field, n in Counter(found).items():
+            address, sep, count = field.partition(',')
+            values[int(address, log_format.base)] += int(count or 1) * n
+    else:
+        values = Counter()
+        for field, n in Counter(found).items():
+            values[int(field, log_format.base)] += n
+    if values and max(values) > 65535:
+        return False
+    code_map.update(values)
+    return True
+
+def _parse_lines(log_format, chunk, code_map, fname, i):
+    lines = chunk.split('\n')
+    if not lines[-1]:
+        lines.pop()
+    for line in lines:
         s_line = line.strip()
         if s_line:
-            address_str = address_f(s_line)
+            address_str = log_format.address_f(s_line)
             address = None
             if address_str:
                 try:
-                    address = int(address_str, base)
+                    address = int(address_str, log_format.base)
                 except ValueError:
-                    if not (ignore_prefixes and s_line.startswith(ignore_prefixes)):
+                    if not (log_format.ignore_prefixes and s_line.startswith(log_format.ignore_prefixes)):
                         raise CodeMapError('{0}, line {1}: Cannot parse address: {2}'.format(fname, i, s_line))
                 if address is not None:
                     if address < 0 or address > 65535:
                         raise CodeMapError('{0}, line {1}: Address out of range: {2}'.format(fname, i, s_line))
-                    if start <= address < end:
-                        addresses.add(address)
+                    if log_format.count_f:
+                        code_map.add(address, log_format.count_f(s_line))
+                    else:
+                        code_map.add(address, 1)
         i += 1
 
-    return sorted(addresses)
-
 def _find_terminal_instruction(snapshot, ctls, start, end, ctl=None):
     address = start
     while address < end:
@@ -186,6 +307,7 @@ def _generate_ctls_with_code_map(snapshot, start, end, config, code_map):
 
     # (1) Mark all executed blocks as 'c' and unexecuted blocks as 'U'
     # (unknown)
+    text_finder = _TextFinder(snapshot, config)
     ctls = {start: 'U', end: 'i'}
     for address, length in _get_code_blocks(snapshot, start, end, code_map):
         ctls[address] = 'c'
@@ -267,7 +389,7 @@ def _generate_ctls_with_code_map(snapshot, start, end, config, code_map):
     for ctl, b_start, b_end in _get_blocks(ctls):
         if ctl == 'U':
             ctls[b_start] = 'b'
-            for t_start, t_end in _get_text_blocks(snapshot, b_start, b_end, config):
+            for t_start, t_end in text_finder.get_text_blocks(b_start, b_end):
                 ctls[t_start] = 't'
                 if t_end < b_end:
                     ctls[t_end] = 'b'
@@ -290,26 +412,38 @@ def _check_text(t_blocks, t_start, t_end, text, min_length, words):
                 return
         t_blocks.append((t_start, t_end))
 
-def _get_text_blocks(snapshot, start, end, config, data=True):
-    if data:
-        min_length = config.text_min_length_data
-    else:
-        min_length = config.text_min_length_code
-    t_blocks = []
-    if end - start >= min_length:
-        text = ''
-        for address in range(start, end):
-            char = chr(snapshot[address])
-            if char in config.text_chars:
-                if not text:
-                    t_start = address
-                text += char
-            elif text:
-                _check_text(t_blocks, t_start, address, text, min_length, config.words)
-                text = ''
-        if text:
-            _check_text(t_blocks, t_start, end, text, min_length, config.words)
-    return t_blocks
+class _TextFinder:
+    def __init__(self, snapshot, config):
+        # Scan the whole snapshot once for runs of characters eligible for
+        # being marked as text (ignoring runs too short to be marked as text
+        # in any block), using a table that maps each byte value to 1
+        # (eligible) or 0 (not eligible)
+        self.config = config
+        self.data = bytes(snapshot)
+        text_chars = bytes(int(chr(b) in config.text_chars) for b in range(256))
+        min_length = max(min(config.text_min_length_data, config.text_min_length_code), 1)
+        pattern = re.compile(b'\x01{%d,}' % min_length)
+        self.runs = [m.span() for m in pattern.finditer(self.data.translate(text_chars))]
+        self.run_ends = [r[1] for r in self.runs]
+
+    def get_text_blocks(self, start, end, data=True):
+        if data:
+            min_length = self.config.text_min_length_data
+        else:
+            min_length = self.config.text_min_length_code
+        t_blocks = []
+        if end - start >= min_length:
+            i = bisect_right(self.run_ends, start)
+            while i < len(self.runs):
+                t_start, t_end = self.runs[i]
+                if t_start >= end:
+                    break
+                t_start, t_end = max(t_start, start), min(t_end, end)
+                if t_end - t_start >= min_length:
+                    text = self.data[t_start:t_end].decode('latin-1')
+                    _check_text(t_blocks, t_start, t_end, text, min_length, self.config.words)
+                i += 1
+        return t_blocks
 
 def _catch_data(ctls, ctl_addr, count, max_count, addr, op_bytes):
     if count >= max_count > 0:
@@ -373,16 +507,17 @@ def _generate_ctls_without_code_map(snapshot, start, end, config):
             prev_addr, prev_ctl = addr, ctl
 
     # Look for text
+    text_finder = _TextFinder(snapshot, config)
     edges = sorted(ctls)
     for i in range(len(edges) - 1):
         start, end = edges[i], edges[i + 1]
         if ctls[start] == 'b':
-            for t_start, t_end in _get_text_blocks(snapshot, start, end, config):
+            for t_start, t_end in text_finder.get_text_blocks(start, end):
                 ctls[t_start] = 't'
                 if t_end < end:
                     ctls[t_end] = 'b'
         elif ctls[start] == 'c':
-            text_blocks = _get_text_blocks(snapshot, start, end, config, False)
+            text_blocks = text_finder.get_text_blocks(start, end, False)
             if text_blocks:
                 ctls[start] = 'b'
                 for t_start, t_end in text_blocks:
@@ -394,6 +529,46 @@ def _generate_ctls_without_code_map(snapshot, start, end, config):
 
     return ctls
 
+def read_code_maps(fnames, counts=False):
+    """Read one or more code maps and merge them.
+
+    :param fnames: The code map filenames.
+    :param counts: Whether to sum the execution counts instead of merely
+                   marking each executed address.
+    :return: A list of 65536 execution counts, one for each address, if
+             `counts` is `True`; otherwise a 65536-byte bytearray in which each
+             executed address is marked by a 1.
+    """
+    if counts:
+        code_map = _ExecutionCounts()
+    else:
+        code_map = _ExecutedFlags()
+    for fname in fnames:
+        _read_code_map(fname, code_map)
+    return code_map.data
+
+def write_code_map(counts, fname):
+    """Write a code map. If the filename ends with '.prof', a Fuse profile
+    (which preserves the execution counts) is written; otherwise a Z80 map file
+    is written.
+
+    :param counts: A list of 65536 execution counts, or a 65536-byte bytearray
+                   of 'executed' flags, one for each address.
+    :param fname: The code map filename.
+    """
+    if fname.lower().endswith('.prof'):
+        with open_file(fname, 'w') as f:
+            for address, count in enumerate(counts):
+                if count:
+                    f.write('0x{:04X},{}\n'.format(address, count))
+    else:
+        map_data = bytearray(8192)
+        for address, count in enumerate(counts):
+            if count:
+                map_data[address // 8] |= 1 << (address % 8)
+        with open_file(fname, 'wb') as f:
+            f.write(map_data)
+
 def write_ctl(ctls, ctl_hex):
     addr_fmt = get_address_format(ctl_hex, ctl_hex == 1)
     start = addr_fmt.format(min(ctls))
@@ -406,12 +581,15 @@ def write_ctl(ctls, ctl_hex):
 def generate_ctls(snapshot, start, end, code_map, config):
     """Generate control directives from a snapshot.
 
-    :param snapshot: The snapshot.
+    :param snapshot: The snapshot (a 65536-byte bytearray, or a list of 65536
+                     byte values).
     :param start: Start address. No control directives should be generated
                   before this address.
     :param end: End address. No control directives should be generated after
                 this address.
-    :param code_map: Code map filename (may be `None`).
+    :param code_map: Code map filename, list of code map filenames to merge,
+                     or a 65536-byte bytearray in which each executed address
+                     is marked by a 1 (may be `None`).
     :param config: Configuration object with the following attributes:
 
                    * `text_chars` - string of characters eligible for being
@@ -15,12 +15,13 @@
 # SkoolKit. If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
+from collections import defaultdict
 
-from skoolkit import SkoolKitError, get_dword, get_int_param, get_word, integer, read_bin_file, VERSION
+from skoolkit import SkoolKitError, get_dword, get_int_param, get_word, integer, open_file, read_bin_file, VERSION
 from skoolkit.basic import BasicLister, VariableLister, get_char
 from skoolkit.config import get_config, show_config, update_options
 from skoolkit.opcodes import END, decode
-from skoolkit.snapshot import make_snapshot
+from skoolkit.snapshot import is_128k, make_snapshot, make_snapshots
 from skoolkit.sna2skool import get_ctl_parser
 from skoolkit.snaskool import Disassembly
 
@@ -409,7 +410,7 @@ def _call_graph(snapshot, ctlfiles, prefix, start, end, config):
             print('{} -> {{{}}}'.format(node_id, ' '.join(ref_ids)))
     print('}')
 
-def _find(snapshot, byte_seq, base_addr=16384):
+def _parse_byte_seq(byte_seq):
     steps = '1'
     if '-' in byte_seq:
         byte_seq, steps = byte_seq.split('-', 1)
@@ -425,13 +426,72 @@ def _find(snapshot, byte_seq, base_addr=16384):
             steps = [get_int_param(steps, True)]
     except ValueError:
         raise SkoolKitError('Invalid distance: {}'.format(steps))
-    for step in steps:
-        offset = step * len(byte_values)
-        for a in range(base_addr, 65537 - offset):
-            if snapshot[a:a + offset:step] == byte_values:
-                print("{0}-{1}-{2} {0:04X}-{1:04X}-{2:X}: {3}".format(a, a + offset - step, step, byte_seq))
-
-def _find_tile(snapshot, coords):
+    return byte_seq, byte_values, steps
+
+def _search(snapshot, patterns, base_addr=16384):
+    # Search for each (byte_values, steps) pattern, scanning RAM once for each
+    # distinct step, and return a list of {step: addresses} dictionaries
+    ram = bytes(snapshot[base_addr:65536])
+    results = [{} for p in patterns]
+    searches = defaultdict(list)
+    for i, (byte_values, steps) in enumerate(patterns):
+        for step in steps:
+            searches[step].append((i, byte_values))
+    for step, step_searches in searches.items():
+        if step > 0:
+            # Every sequence that starts at address a with this step lies in
+            # the view of RAM that starts at base_addr + (a - base_addr) % step
+            views = [ram[r::step] for r in range(step)]
+        for i, byte_values in step_searches:
+            offset = step * len(byte_values)
+            if step > 0:
+                addresses = results[i][step] = []
+                if all(0 <= b < 256 for b in byte_values):
+                    seq = bytes(byte_values)
+                    limit = 65536 - offset - base_addr
+                    for r, view in enumerate(views):
+                        j = view.find(seq)
+                        while 0 <= j and r + j * step <= limit:
+                            addresses.append(base_addr + r + j * step)
+                            j = view.find(seq, j + 1)
+                    addresses.sort()
+            else:
+                results[i][step] = [a for a in range(base_addr, 65537 - offset) if snapshot[a:a + offset:step] == byte_values]
+    return results
+
+def _search_pages(snapshots, patterns, base_addr=16384):
+    # Search each (page, snapshot) pair and return a list of (address, step,
+    # page) tuples for each pattern; a match that lies wholly below 49152 is
+    # reported for the first snapshot only, and without a page number
+    results = [_search(snapshot, patterns, base_addr) for page, snapshot in snapshots]
+    matches = []
+    for i, (byte_values, steps) in enumerate(patterns):
+        matches.append([])
+        for step in steps:
+            step_matches = []
+            for n, (page, snapshot) in enumerate(snapshots):
+                for a in results[n][i][step]:
+                    if page is not None and a + (len(byte_values) - 1) * step > 49151:
+                        step_matches.append((a, page))
+                    elif n == 0:
+                        step_matches.append((a, -1))
+            matches[-1].extend((a, step, None if page < 0 else page) for a, page in sorted(step_matches))
+    return matches
+
+def _page_suffix(page):
+    if page is None:
+        return ''
+    return ' (page {})'.format(page)
+
+def _find(snapshots, byte_seqs, base_addr=16384):
+    specs = [_parse_byte_seq(b) for b in byte_seqs]
+    patterns = [(byte_values, steps) for byte_seq, byte_values, steps in specs]
+    for (byte_seq, byte_values, steps), matches in zip(specs, _search_pages(snapshots, patterns, base_addr)):
+        offset = len(byte_values)
+        for a, step, page in matches:
+            print("{0}-{1}-{2} {0:04X}-{1:04X}-{2:X}: {3}{4}".format(a, a + offset * step - step, step, byte_seq, _page_suffix(page)))
+
+def _find_tile(snapshots, coords):
     steps = '1'
     if '-' in coords:
         coords, steps = coords.split('-', 1)
@@ -442,17 +502,25 @@ def _find_tile(snapshot, coords):
     except ValueError:
         raise SkoolKitError('Invalid tile coordinates: {}'.format(coords))
     df_addr = 16384 + 2048 * (y // 8) + 32 * (y & 7) + x
-    byte_seq = snapshot[df_addr:df_addr + 2048:256]
+    byte_seq = snapshots[0][1][df_addr:df_addr + 2048:256]
     for b in byte_seq:
         print('|{:08b}|'.format(b).replace('0', ' ').replace('1', '*'))
-    _find(snapshot, '{}-{}'.format(','.join([str(b) for b in byte_seq]), steps), 23296)
+    _find(snapshots, ['{}-{}'.format(','.join([str(b) for b in byte_seq]), steps)], 23296)
 
-def _find_text(snapshot, text):
+def _find_text(snapshots, text):
     size = len(text)
     byte_values = [ord(c) for c in text]
-    for a in range(16384, 65536 - size + 1):
-        if snapshot[a:a + size] == byte_values:
-            print("{0}-{1} {0:04X}-{1:04X}: {2}".format(a, a + size - 1, text))
+    for a, step, page in _search_pages(snapshots, [(byte_values, [1])])[0]:
+        print("{0}-{1} {0:04X}-{1:04X}: {2}{3}".format(a, a + size - 1, text, _page_suffix(page)))
+
+def _read_byte_seqs(fname):
+    with open_file(fname) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def _get_snapshots(infile, options, snapshot):
+    if options.all_pages and is_128k(infile):
+        return list(enumerate(make_snapshots(infile, options.org, range(8), True)))
+    return [(None, snapshot)]
 
 def _peek(snapshot, specs, fmt):
     for addr1, addr2, step in _get_address_ranges(specs):
@@ -468,15 +536,17 @@ def _word(snapshot, specs, fmt):
             print(fmt.format(address=a, value=value))
 
 def run(infile, options, config):
-    if any((options.find, options.tile, options.text, options.call_graph, options.peek,
+    if any((options.find, options.find_file, options.tile, options.text, options.call_graph, options.peek,
             options.word, options.basic, options.variables)):
-        snapshot, start, end = make_snapshot(infile, options.org, page=options.page)
+        snapshot, start, end = make_snapshot(infile, options.org, page=options.page, memory=True)
+        if options.find_file:
+            options.find = (options.find or []) + _read_byte_seqs(options.find_file)
         if options.find:
-            _find(snapshot, options.find)
+            _find(_get_snapshots(infile, options, snapshot), options.find)
         elif options.tile:
-            _find_tile(snapshot, options.tile)
+            _find_tile(_get_snapshots(infile, options, snapshot), options.tile)
         elif options.text:
-            _find_text(snapshot, options.text)
+            _find_text(_get_snapshots(infile, options, snapshot), options.text)
         elif options.call_graph:
             _call_graph(snapshot, options.ctlfiles, infile, start, end, config)
         elif options.peek:
@@ -506,13 +576,18 @@ def main(args):
     )
     parser.add_argument('infile', help=argparse.SUPPRESS, nargs='?')
     group = parser.add_argument_group('Options')
+    group.add_argument('--all-pages', dest='all_pages', action='store_true',
+                       help='When searching a 128K snapshot, search with each RAM page mapped to 49152-65535 in turn.')
     group.add_argument('-b', '--basic', action='store_true',
                        help='List the BASIC program.')
     group.add_argument('-c', '--ctl', dest='ctlfiles', metavar='PATH', action='append', default=[],
                        help="When generating a call graph, specify a control file to use, or a directory from which to read control files. "
                             "PATH may be '-' for standard input. This option may be used multiple times.")
-    group.add_argument('-f', '--find', metavar='A[,B...[-M[-N]]]',
-                       help='Search for the byte sequence A,B... with distance ranging from M to N (default=1) between bytes.')
+    group.add_argument('-f', '--find', metavar='A[,B...[-M[-N]]]', action='append',
+                       help='Search for the byte sequence A,B... with distance ranging from M to N (default=1) between bytes. '
+                            'This option may be used multiple times.')
+    group.add_argument('-F', '--find-file', dest='find_file', metavar='FILE',
+                       help='Search for the byte sequences listed in FILE (one per line, in the same format as for --find).')
     group.add_argument('-g', '--call-graph', action='store_true',
                        help='Generate a call graph in DOT format.')
     group.add_argument('-I', '--ini', dest='params', metavar='p=v', action='append', default=[],
@@ -14,12 +14,18 @@
 # You should have received a copy of the GNU General Public License along with
 # SkoolKit. If not, see <http://www.gnu.org/licenses/>.
 
+import re
 import textwrap
 import zlib
 
 from skoolkit import SkoolKitError, get_int_param, parse_int, read_bin_file
 from skoolkit.components import get_snapshot_reader, get_value
 
+# Matches (in order of precedence) a run of two or more ED bytes, a single ED
+# byte and the byte that follows it (which must not be compressed), and a run of
+# five or more identical bytes
+RE_Z80_RUN = re.compile(rb'\xed\xed+|\xed.|(.)\1{4,}', re.S)
+
 # https://worldofspectrum.net/features/faq/reference/z80format.htm
 Z80_REGISTERS = {
     'a': 0,
@@ -69,37 +75,89 @@ def get_snapshot(fname, page=None):
                  This is relevant only when reading a 128K snapshot file.
     :return: A 65536-element list of byte values.
     """
+    return list(get_memory(fname, page))
+
+# Component API (optional)
+def get_memory(fname, page=None):
+    """
+    Read a snapshot file and produce a 65536-byte bytearray. This works in the
+    same way as :meth:`get_snapshot`, but avoids creating a list.
+
+    :param fname: The snapshot filename.
+    :param page: The page number to map to addresses 49152-65535 (C000-FFFF).
+                 This is relevant only when reading a 128K snapshot file.
+    :return: A 65536-byte bytearray.
+    """
+    return _get_memory(_read_banks(fname), page)
+
+# Component API (optional)
+def get_memories(fname, pages):
+    """
+    Read a snapshot file and produce a 65536-byte bytearray for each of a
+    sequence of pages. This works in the same way as calling :meth:`get_memory`
+    once for each page, but reads the snapshot file only once, and decompresses
+    each RAM bank at most once.
+
+    :param fname: The snapshot filename.
+    :param pages: The page numbers to map to addresses 49152-65535 (C000-FFFF).
+    :return: A list of 65536-byte bytearrays.
+    """
+    banks = _read_banks(fname)
+    return [_get_memory(banks, page) for page in pages]
+
+def is_128k(fname):
+    # Return whether the file format and header of a SNA, SZX or Z80 file
+    # indicate a 128K snapshot
+    return can_read(fname) and _read_banks(fname).paged is not None
+
+def _read_banks(fname):
     if not can_read(fname):
         raise SnapshotError("{}: Unknown file type".format(fname))
     data = read_bin_file(fname)
     ext = fname[-4:].lower()
     if ext == '.sna':
-        ram = _read_sna(data, page)
-    elif ext == '.z80':
-        ram = _read_z80(data, page)
-    elif ext == '.szx':
-        ram = _read_szx(data, page)
+        return _read_sna(data)
+    if ext == '.z80':
+        return _read_z80(data)
+    return _read_szx(data)
+
+def _get_memory(banks, page):
+    ram = banks.get_ram(page)
     if len(ram) != 49152:
         raise SnapshotError("RAM size is {0}".format(len(ram)))
-    mem = [0] * 16384
+    mem = bytearray(16384)
     mem.extend(ram)
     return mem
 
-def make_snapshot(fname, org, start=None, end=65536, page=None):
+def make_snapshot(fname, org, start=None, end=65536, page=None, memory=False):
     snapshot_reader = get_snapshot_reader()
     if snapshot_reader.can_read(fname):
         if start is None:
             start = parse_int(get_value('DefaultDisassemblyStartAddress'), 16384)
+        if memory and hasattr(snapshot_reader, 'get_memory'):
+            return snapshot_reader.get_memory(fname, page), start, end
         return snapshot_reader.get_snapshot(fname, page), start, end
     if start is None:
         start = 0
     ram = read_bin_file(fname, 65536)
     if org is None:
         org = 65536 - len(ram)
-    mem = [0] * 65536
+    if memory:
+        mem = bytearray(65536)
+    else:
+        mem = [0] * 65536
     mem[org:org + len(ram)] = ram
     return mem, max(org, start), min(end, org + len(ram))
 
+def make_snapshots(fname, org, pages, memory=False):
+    snapshot_reader = get_snapshot_reader()
+    if snapshot_reader.can_read(fname) and hasattr(snapshot_reader, 'get_memories'):
+        memories = snapshot_reader.get_memories(fname, pages)
+        if memory:
+            return memories
+        return [list(m) for m in memories]
+    return [make_snapshot(fname, org, page=page, memory=memory)[0] for page in pages]
+
 def set_z80_registers(z80, *specs):
     for spec in specs:
         reg, sep, val = spec.lower().partition('=')
@@ -180,39 +238,53 @@ Set a hardware state attribute. Recognised names and their default values are:
   im     - interrupt mode (default=1)
 """.format(', '.join(options)).strip())
 
-def make_z80_ram_block(data, page):
-    block = []
-    prev_b = None
-    count = 0
-    for b in data:
-        if b == prev_b or prev_b is None:
-            prev_b = b
-            if count < 255:
-                count += 1
-                continue
-        if count > 4 or (count > 1 and prev_b == 237):
-            block.extend((237, 237, count, prev_b))
-        elif prev_b == 237:
-            block.extend((237, b))
-            prev_b = None
-            count = 0
-            continue
+def _compress_z80_block(data):
+    data = bytes(data)
+    size = len(data)
+    pieces = []
+    i = 0
+    while 1:
+        match = RE_Z80_RUN.search(data, i)
+        if match is None:
+            pieces.append(data[i:])
+            break
+        start, end = match.span()
+        pieces.append(data[i:start])
+        b = data[start]
+        if b == 237 and data[start + 1] != 237:
+            # A single ED byte followed by a byte that must not be compressed
+            pieces.append(data[start:end])
         else:
-            block.extend((prev_b,) * count)
-        prev_b = b
-        count = 1
-    if count > 4 or (count > 1 and prev_b == 237):
-        block.extend((237, 237, count, prev_b))
-    else:
-        block.extend((prev_b,) * count)
-    length = len(block)
-    return [length % 256, length // 256, page] + block
+            count, rem = divmod(end - start, 255)
+            if count:
+                pieces.append(bytes((237, 237, 255, b)) * count)
+            if rem > 4 or (rem > 1 and b == 237):
+                pieces.append(bytes((237, 237, rem, b)))
+            elif rem == 1 and b == 237 and end < size:
+                # A single ED byte left over at the end of a run of ED bytes
+                pieces.append(data[end - 1:end + 1])
+                end += 1
+            else:
+                pieces.append(data[start:start + rem])
+        i = end
+    return b''.join(pieces)
 
-def make_z80v3_ram_blocks(ram):
+def _make_z80v3_ram_blocks(ram):
     blocks = []
     for bank, data in ((5, ram[:16384]), (1, ram[16384:32768]), (2, ram[32768:49152])):
-        blocks.extend(make_z80_ram_block(data, bank + 3))
-    return blocks
+        block = _compress_z80_block(data)
+        length = len(block)
+        blocks.append(bytes((length % 256, length // 256, bank + 3)))
+        blocks.append(block)
+    return b''.join(blocks)
+
+def make_z80_ram_block(data, page):
+    block = _compress_z80_block(data)
+    length = len(block)
+    return [length % 256, length // 256, page] + list(block)
+
+def make_z80v3_ram_blocks(ram):
+    return list(_make_z80v3_ram_blocks(ram))
 
 def write_z80v3(fname, ram, registers, state):
     z80 = [0] * 86
@@ -220,7 +292,7 @@ def write_z80v3(fname, ram, registers, state):
     set_z80_registers(z80, 'i=63', 'iy=23610', *registers)
     set_z80_state(z80, 'iff=1', 'im=1', *state)
     with open(fname, 'wb') as f:
-        f.write(bytes(z80 + make_z80v3_ram_blocks(ram)))
+        f.write(bytes(z80) + _make_z80v3_ram_blocks(ram))
 
 def move(snapshot, param_str):
     params = param_str.split(',', 2)
@@ -257,22 +329,62 @@ def poke(snapshot, param_str):
     for a in range(addr1, addr2 + 1, step):
         snapshot[a] = poke_f(snapshot[a])
 
-def _read_sna(data, page=None):
-    if len(data) <= 49179 or page is None:
-        return data[27:49179]
-    paged_bank = data[49181] & 7
-    banks = [5, 2, paged_bank]
+class _Banks:
+    # The RAM banks of a snapshot. The block containing each bank is located
+    # when the snapshot is read, but is not decompressed until the bank is
+    # first needed, after which the decompressed bank is kept.
+    def __init__(self, banks=(5, 2, 0), paged=None, extension=b''):
+        self.banks = banks
+        self.paged = paged
+        self.extension = extension
+        self.paged_error = None
+        self.blocks = {}
+        self.cache = {}
+
+    def __getitem__(self, bank):
+        ram = self.cache.get(bank)
+        if ram is None:
+            if bank not in self.blocks:
+                raise SnapshotError("Page {0} not found".format(bank))
+            ram = self.cache[bank] = self.blocks[bank]()
+        return ram
+
+    def get_ram(self, page=None):
+        if self.paged is None:
+            banks = self.banks
+        elif page is None:
+            if self.paged_error:
+                raise SnapshotError(self.paged_error)
+            banks = (5, 2, self.paged) # 128K
+        else:
+            banks = (5, 2, page) # 128K
+        return b''.join([self[bank] for bank in banks] + [self.extension])
+
+def _view(data):
+    return lambda: data
+
+def _read_sna(data):
+    data = memoryview(data)
+    banks = _Banks()
+    if len(data) <= 49179:
+        ram = data[27:49179]
+        for i, bank in enumerate(banks.banks):
+            banks.blocks[bank] = _view(ram[i * 16384:(i + 1) * 16384])
+        return banks
+    banks.paged = data[49181] & 7
+    indexes = [5, 2, banks.paged]
     for i in range(8):
-        if i not in banks:
-            banks.append(i)
-    page_index = banks.index(page)
-    if page_index < 3:
-        index = 27 + page_index * 16384
-    else:
-        index = 49183 + (page_index - 3) * 16384
-    return data[27:32795] + data[index:index + 16384]
+        if i not in indexes:
+            indexes.append(i)
+    for i, bank in enumerate(indexes):
+        if i < 3:
+            index = 27 + i * 16384
+        else:
+            index = 49183 + (i - 3) * 16384
+        banks.blocks[bank] = _view(data[index:index + 16384])
+    return banks
 
-def _read_z80(data, page=None):
+def _read_z80(data):
     if sum(data[6:8]) > 0:
         version = 1
     else:
@@ -283,58 +395,73 @@ def _read_z80(data, page=None):
         header_size = 32 + data[30]
     header = data[:header_size]
     if version == 1:
+        # All 48K of RAM is in one block, which is treated here as bank 5
+        banks = _Banks((5,))
         if header[12] & 32:
-            return _decompress_block(data[header_size:-4])
-        return data[header_size:]
+            banks.blocks[5] = _z80_block(data[header_size:-4])
+        else:
+            banks.blocks[5] = _view(data[header_size:])
+        return banks
     machine_id = data[34]
-    extension = ()
     if (version == 2 and machine_id < 2) or (version == 3 and machine_id in (0, 1, 3)):
         if data[37] & 128:
-            banks = (5,) # 16K
-            extension = [0] * 32768
+            banks = _Banks((5,), extension=bytes(32768)) # 16K
         else:
-            banks = (5, 1, 2) # 48K
+            banks = _Banks((5, 1, 2)) # 48K
     else:
-        if page is None:
-            page = data[35] & 7
-        banks = (5, 2, page) # 128K
-    return _decompress(data[header_size:], banks, extension)
+        banks = _Banks(paged=data[35] & 7) # 128K
+    # Uncompressed pages are left as views of the snapshot data
+    ramz = memoryview(data)
+    j = header_size
+    while j < len(ramz):
+        length = ramz[j] + 256 * ramz[j + 1]
+        page = ramz[j + 2] - 3
+        if length == 65535:
+            banks.blocks[page] = _view(ramz[j + 3:j + 16387])
+            j += 16387
+        else:
+            banks.blocks[page] = _z80_block(ramz[j + 3:j + 3 + length])
+            j += 3 + length
+    return banks
 
-def _read_szx(data, page=None):
-    extension = ()
+def _z80_block(ramz):
+    return lambda: _decompress_block(ramz)
+
+def _read_szx(data):
     machine_id = data[6]
     if machine_id == 0:
-        banks = (5,) # 16K
-        extension = [0] * 32768
+        banks = _Banks((5,), extension=bytes(32768)) # 16K
     elif machine_id == 1:
-        banks = (5, 2, 0) # 48K
+        banks = _Banks() # 48K
     else:
-        if page is None:
-            specregs = _get_zxstblock(data, 8, 'SPCR')[1]
-            if specregs is None:
-                raise SnapshotError("SPECREGS (SPCR) block not found")
-            page = specregs[1] & 7
-        banks = (5, 2, page) # 128K
-    pages = {}
-    for bank in banks:
-        pages[bank] = None
+        banks = _Banks(paged=-1) # 128K
+        specregs = _get_zxstblock(data, 8, 'SPCR')[1]
+        if specregs is None:
+            # This is an error only if the paged bank is needed
+            banks.paged_error = "SPECREGS (SPCR) block not found"
+        else:
+            banks.paged = specregs[1] & 7
     i = 8
     while 1:
         i, rampage = _get_zxstblock(data, i, 'RAMP')
         if rampage is None:
             break
+        banks.blocks[rampage[2]] = _szx_block(rampage)
+    return banks
+
+def _szx_block(rampage):
+    def decompress():
         page = rampage[2]
-        if page in pages:
-            ram = rampage[3:]
-            if rampage[0] & 1:
-                try:
-                    ram = zlib.decompress(ram)
-                except zlib.error as e:
-                    raise SnapshotError("Error while decompressing page {0}: {1}".format(page, e.args[0]))
-            if len(ram) != 16384:
-                raise SnapshotError("Page {0} is {1} bytes (should be 16384)".format(page, len(ram)))
-            pages[page] = ram
-    return _concatenate_pages(pages, banks, extension)
+        ram = rampage[3:]
+        if rampage[0] & 1:
+            try:
+                ram = zlib.decompress(ram)
+            except zlib.error as e:
+                raise SnapshotError("Error while decompressing page {0}: {1}".format(page, e.args[0]))
+        if len(ram) != 16384:
+            raise SnapshotError("Page {0} is {1} bytes (should be 16384)".format(page, len(ram)))
+        return ram
+    return decompress
 
 def _get_zxstblock(data, index, block_id):
     block = None
@@ -346,53 +473,21 @@ def _get_zxstblock(data, index, block_id):
         index += 8 + size
     return index, block
 
-def _concatenate_pages(pages, banks, extension):
-    ram = []
-    for bank in banks:
-        if pages[bank] is None:
-            raise SnapshotError("Page {0} not found".format(bank))
-        ram.extend(pages[bank])
-    ram.extend(extension)
-    return ram
-
-def _decompress(ramz, banks, extension):
-    pages = {}
-    for bank in banks:
-        pages[bank] = None
-    j = 0
-    while j < len(ramz):
-        length = ramz[j] + 256 * ramz[j + 1]
-        page = ramz[j + 2] - 3
-        if length == 65535:
-            if page in pages:
-                pages[page] = ramz[j + 3:j + 16387]
-            j += 16387
-        else:
-            if page in pages:
-                pages[page] = _decompress_block(ramz[j + 3:j + 3 + length])
-            j += 3 + length
-    return _concatenate_pages(pages, banks, extension)
-
 def _decompress_block(ramz):
-    block = []
+    ramz = bytes(ramz)
+    block = bytearray()
     i = 0
-    while i < len(ramz):
-        b = ramz[i]
-        i += 1
-        if b == 237:
-            c = ramz[i]
-            i += 1
-            if c == 237:
-                length, byte = ramz[i], ramz[i + 1]
-                if length == 0:
-                    raise SnapshotError("Found ED ED 00 {0:02X}".format(byte))
-                block += [byte] * length
-                i += 2
-            else:
-                block += [b, c]
-        else:
-            block.append(b)
-    return block
+    while True:
+        j = ramz.find(b'\xed\xed', i)
+        if j < 0:
+            block += ramz[i:]
+            return block
+        block += ramz[i:j]
+        length, byte = ramz[j + 2], ramz[j + 3]
+        if length == 0:
+            raise SnapshotError("Found ED ED 00 {0:02X}".format(byte))
+        block += bytes((byte,)) * length
+        i = j + 4
 
 # API (SnapshotReader)
 class SnapshotError(SkoolKitError):
@@ -17,11 +17,24 @@
 import sys
 import os
 import argparse
+import copy
+import hashlib
+import io
+import json
+import multiprocessing
 import tempfile
+import time
 import zipfile
+from urllib.error import HTTPError
 from urllib.request import Request, urlopen
 from urllib.parse import urlparse
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
 from skoolkit import (SkoolKitError, get_dword, get_int_param, get_word,
                       get_word3, integer, open_file, write_line, VERSION)
 from skoolkit.snapshot import move, poke, print_reg_help, print_state_help, write_z80v3
@@ -127,15 +140,211 @@ SYSVARS = (
 )
 
 class SkoolKitArgumentParser(argparse.ArgumentParser):
+    # When set, an invalid argument raises TapeError instead of exiting (so
+    # that a bad line in a batch file does not stop the whole batch)
+    batch = False
+
+    def error(self, message):
+        if self.batch:
+            raise TapeError(message)
+        super().error(message)
+
     def convert_arg_line_to_args(self, arg_line):
         for arg in arg_line.split():
             if arg in (';', '#'):
                 break
             yield arg
 
+# Number of bytes to read from a remote file at a time
+CHUNK_SIZE = 1048576
+
 class TapeError(Exception):
     pass
 
+class _CacheLock:
+    # An exclusive lock on the '.lock' file in the cache directory, held by a
+    # process while it stores or evicts files, or opens a cached file, so that
+    # several processes (e.g. those started by --jobs) can share the cache
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.f = open(os.path.join(self.path, '.lock'), 'a+b')
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        else:
+            self.f.seek(0)
+            while 1:
+                try:
+                    msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 seconds, so try again
+                    pass
+        return self
+
+    def __exit__(self, *args):
+        if not fcntl:
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+        self.f.close()
+
+def _remove(fname):
+    # Remove a file that another process may already have removed, or (on
+    # Windows) may have open; return whether the file is now gone
+    try:
+        os.remove(fname)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return False
+    return True
+
+class DownloadCache:
+    # The cache directory contains a 'urls' subdirectory with one JSON file
+    # (named after the SHA-256 digest of the URL) for each URL, and a 'data'
+    # subdirectory with one file (named after the SHA-256 digest of its
+    # contents) for each downloaded file; the modification time of a URL's
+    # JSON file is the time it was last used
+    def __init__(self, path, max_size=0, offline=False):
+        self.path = path
+        self.urls_dir = os.path.join(path, 'urls')
+        self.data_dir = os.path.join(path, 'data')
+        self.max_size = max_size
+        self.offline = offline
+
+    def _url_fname(self, url):
+        return os.path.join(self.urls_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def _data_fname(self, digest):
+        return os.path.join(self.data_dir, digest)
+
+    def _read_entry(self, fname):
+        try:
+            with open(fname) as f:
+                entry = json.load(f)
+            if os.path.isfile(self._data_fname(entry['sha256'])):
+                return entry
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def open(self, url, user_agent):
+        url_fname = self._url_fname(url)
+        entry = self._read_entry(url_fname)
+        if self.offline:
+            if entry is None:
+                raise TapeError('{} is not in the download cache'.format(url))
+            u = None
+        else:
+            headers = {'User-Agent': user_agent}
+            if entry and entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry and entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            try:
+                u = urlopen(Request(url, headers=headers), timeout=30)
+            except HTTPError as e:
+                if entry is None or e.code != 304:
+                    raise
+                u = None
+        if u is None:
+            with _CacheLock(self.path):
+                f = self._open_cached(url_fname, entry)
+            if f:
+                write_line('Using cached copy of {}'.format(url))
+                return f
+            # The cached copy was evicted by another process after it was
+            # revalidated
+            if self.offline:
+                raise TapeError('{} is not in the download cache'.format(url))
+            u = urlopen(Request(url, headers={'User-Agent': user_agent}), timeout=30)
+        write_line('Downloading {}'.format(url))
+        tmp_fname, digest = self._download(u)
+        with _CacheLock(self.path):
+            entry = self._store(url, url_fname, u, tmp_fname, digest)
+            self._evict(url_fname)
+            return open(self._data_fname(entry['sha256']), 'rb')
+
+    def _open_cached(self, url_fname, entry):
+        try:
+            f = open(self._data_fname(entry['sha256']), 'rb')
+            os.utime(url_fname)
+            return f
+        except OSError:
+            pass
+
+    def _download(self, u):
+        os.makedirs(self.data_dir, exist_ok=True)
+        sha256 = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=self.data_dir, prefix='tmp', delete=False) as f:
+            while 1:
+                data = u.read(CHUNK_SIZE)
+                if not data:
+                    break
+                sha256.update(data)
+                f.write(data)
+        return f.name, sha256.hexdigest()
+
+    def _store(self, url, url_fname, u, tmp_fname, digest):
+        os.makedirs(self.urls_dir, exist_ok=True)
+        entry = {
+            'url': url,
+            'sha256': digest,
+            'etag': u.headers.get('ETag'),
+            'last_modified': u.headers.get('Last-Modified')
+        }
+        os.replace(tmp_fname, self._data_fname(digest))
+        with tempfile.NamedTemporaryFile('w', dir=self.urls_dir, prefix='tmp', delete=False) as f:
+            json.dump(entry, f)
+        os.replace(f.name, url_fname)
+        return entry
+
+    def _evict(self, keep):
+        # Remove the least recently used entries (and any files no longer
+        # referenced by an entry) until the cache is no bigger than the limit;
+        # files that disappear during the scan are skipped, and no file
+        # modified since the scan started is removed
+        if self.max_size < 1:
+            return
+        scan_start = time.time()
+        sizes = {}
+        for name in os.listdir(self.data_dir):
+            if not name.startswith('tmp'):
+                try:
+                    stat = os.stat(self._data_fname(name))
+                except OSError:
+                    continue
+                if stat.st_mtime < scan_start:
+                    sizes[name] = stat.st_size
+        total = sum(sizes.values())
+        if total <= self.max_size:
+            return
+        entries = []
+        refs = dict.fromkeys(sizes, 0)
+        for name in os.listdir(self.urls_dir):
+            if name.endswith('.json'):
+                fname = os.path.join(self.urls_dir, name)
+                entry = self._read_entry(fname)
+                try:
+                    mtime = os.path.getmtime(fname)
+                except OSError:
+                    continue
+                if entry and entry['sha256'] in refs:
+                    refs[entry['sha256']] += 1
+                    if mtime < scan_start:
+                        entries.append((mtime, fname, entry['sha256']))
+        for digest in [d for d, count in refs.items() if count == 0]:
+            if _remove(self._data_fname(digest)):
+                total -= sizes[digest]
+        for mtime, fname, digest in sorted(entries):
+            if total <= self.max_size:
+                break
+            if fname != keep and _remove(fname):
+                refs[digest] -= 1
+                if refs[digest] == 0 and _remove(self._data_fname(digest)):
+                    total -= sizes[digest]
+
 def _write_z80(ram, options, fname):
     parent_dir = os.path.dirname(fname)
     if parent_dir and not os.path.isdir(parent_dir):
@@ -166,6 +375,10 @@ def _load_block(snapshot, block, start, length=None, step=None, offset=None, inc
         offset = 0
     if inc is None:
         inc = 0
+    if step == 1 and offset == 0 and 0 <= start <= 65536 - len(data):
+        # Contiguous load that does not wrap around the 64K boundary
+        snapshot[start:start + len(data)] = data
+        return len(data)
     i = start
     for b in data:
         snapshot[(i + offset) & 65535] = b
@@ -200,7 +413,7 @@ def _load(snapshot, counters, blocks, param_str):
     counters[block_num] += length
 
 def _get_ram(blocks, options):
-    snapshot = [0] * 65536
+    snapshot = bytearray(65536)
 
     operations = []
     standard_load = True
@@ -244,7 +457,7 @@ def _get_ram(blocks, options):
         elif op_type == 'sysvars':
             snapshot[23552:23755] = SYSVARS
 
-    return snapshot[16384:]
+    return memoryview(snapshot)[16384:]
 
 def _get_tzx_block(data, i):
     # https://worldofspectrum.net/features/TZXformat.html
@@ -362,19 +575,22 @@ def _get_tape_blocks(tape_type, tape):
         return _get_tzx_blocks(tape)
     return _get_tap_blocks(tape)
 
-def _get_tape(urlstring, user_agent, member=None):
+def _get_tape(urlstring, user_agent, member=None, cache=None):
     url = urlparse(urlstring)
     if url.scheme:
-        write_line('Downloading {0}'.format(urlstring))
-        r = Request(urlstring, headers={'User-Agent': user_agent})
-        u = urlopen(r, timeout=30)
-        f = tempfile.NamedTemporaryFile(prefix='tap2sna-')
-        while 1:
-            data = bytearray(u.read(4096))
-            if data:
-                f.write(data)
-            else:
-                break
+        if cache:
+            f = cache.open(urlstring, user_agent)
+        else:
+            write_line('Downloading {0}'.format(urlstring))
+            r = Request(urlstring, headers={'User-Agent': user_agent})
+            u = urlopen(r, timeout=30)
+            f = tempfile.NamedTemporaryFile(prefix='tap2sna-')
+            while 1:
+                data = u.read(CHUNK_SIZE)
+                if data:
+                    f.write(data)
+                else:
+                    break
     elif url.path:
         f = open_file(url.path, 'rb')
 
@@ -473,15 +689,130 @@ initialise the system variables.
   suitable for a 48K ZX Spectrum.
 """.lstrip())
 
+def _get_download_cache(options):
+    if options.cache_dir:
+        return DownloadCache(options.cache_dir, options.cache_size, options.offline)
+    if options.offline:
+        raise TapeError('--offline requires --cache-dir')
+
 def make_z80(url, options, z80):
-    tape_type, tape = _get_tape(url, options.user_agent)
+    tape_type, tape = _get_tape(url, options.user_agent, cache=_get_download_cache(options))
     tape_blocks = _get_tape_blocks(tape_type, tape)
     ram = _get_ram(tape_blocks, options)
     _write_z80(ram, options, z80)
 
+def _get_z80_fname(options, z80):
+    if options.output_dir:
+        z80 = os.path.join(options.output_dir, z80)
+    if options.stack is not None:
+        options.reg = options.reg + ['sp={}'.format(options.stack)]
+    if options.start is not None:
+        options.reg = options.reg + ['pc={}'.format(options.start)]
+    return z80
+
+def _is_up_to_date(url, z80):
+    if not os.path.isfile(z80):
+        return False
+    if urlparse(url).scheme:
+        return True
+    try:
+        return os.path.getmtime(z80) >= os.path.getmtime(url)
+    except OSError:
+        return False
+
+def _convert(task):
+    line_no, url, options, z80 = task
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    start = time.time()
+    try:
+        make_z80(url, options, z80)
+        error = None
+    except Exception as e:
+        error = str(e.args[0] if e.args else e)
+    finally:
+        sys.stdout = stdout
+    return line_no, z80, time.time() - start, error
+
+def _get_batch_tasks(parser, namespace, fname):
+    tasks, skipped, failures = [], [], []
+    parser.batch = True
+    with open_file(fname) as f:
+        for line_no, line in enumerate(f, 1):
+            args = list(parser.convert_arg_line_to_args(line))
+            if not args:
+                continue
+            try:
+                options, unknown_args = parser.parse_known_args(args, copy.copy(namespace))
+            except TapeError as e:
+                failures.append((line_no, None, e.args[0]))
+                continue
+            if unknown_args or len(options.args) != 2:
+                failures.append((line_no, None, 'Invalid arguments: {}'.format(' '.join(args))))
+                continue
+            url, z80 = options.args
+            z80 = _get_z80_fname(options, z80)
+            if options.force or not _is_up_to_date(url, z80):
+                tasks.append((line_no, url, options, z80))
+            else:
+                skipped.append(z80)
+    parser.batch = False
+    return tasks, skipped, failures
+
+def _run_batch(parser, namespace, fname):
+    start = time.time()
+    tasks, skipped, failures = _get_batch_tasks(parser, namespace, fname)
+    for z80 in skipped:
+        write_line('Skipped {} (up to date)'.format(z80))
+    jobs = namespace.jobs
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        jobs = 1
+    jobs = min(jobs, len(tasks))
+    if jobs > 1:
+        pool = multiprocessing.get_context('fork').Pool(jobs)
+        results = pool.imap_unordered(_convert, tasks)
+    else:
+        pool = None
+        results = map(_convert, tasks)
+    times = []
+    for line_no, z80, elapsed, error in results:
+        if error is None:
+            write_line('Wrote {} ({:0.2f}s)'.format(z80, elapsed))
+            times.append((elapsed, z80))
+        else:
+            write_line('Failed to write {}: {}'.format(z80, error))
+            failures.append((line_no, z80, error))
+    if pool:
+        pool.close()
+        pool.join()
+
+    summary = '{} written, {} up to date, {} failed in {:0.2f}s'.format(len(times), len(skipped), len(failures), time.time() - start)
+    if times:
+        slowest = max(times)
+        summary += ' (mean {:0.2f}s per snapshot; slowest: {}, {:0.2f}s)'.format(sum(t[0] for t in times) / len(times), slowest[1], slowest[0])
+    write_line(summary)
+    if failures:
+        for line_no, z80, error in sorted(failures):
+            if z80:
+                write_line('  {}, line {}: {}: {}'.format(fname, line_no, z80, error))
+            else:
+                write_line('  {}, line {}: {}'.format(fname, line_no, error))
+        raise SkoolKitError('Failed to write {} of {} snapshots'.format(len(failures), len(times) + len(skipped) + len(failures)))
+
+def _size(arg):
+    try:
+        multiplier = 1024 ** ('KMG'.index(arg[-1].upper()) + 1)
+        arg = arg[:-1]
+    except (IndexError, ValueError):
+        multiplier = 1
+    try:
+        return int(arg) * multiplier
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid size: '{}'".format(arg))
+
 def main(args):
     parser = SkoolKitArgumentParser(
-        usage='\n  tap2sna.py [options] INPUT snapshot.z80\n  tap2sna.py @FILE',
+        usage='\n  tap2sna.py [options] INPUT snapshot.z80\n  tap2sna.py @FILE\n  tap2sna.py [options] --batch FILE',
         description="Convert a TAP or TZX file (which may be inside a zip archive) into a Z80 snapshot. "
                     "INPUT may be the full URL to a remote zip archive or TAP/TZX file, or the path to a local file. "
                     "Arguments may be read from FILE instead of (or as well as) being given on the command line.",
@@ -490,10 +821,21 @@ def main(args):
     )
     parser.add_argument('args', help=argparse.SUPPRESS, nargs='*')
     group = parser.add_argument_group('Options')
+    group.add_argument('--batch', dest='batch', metavar='FILE',
+                       help="Convert every tape listed in FILE (one line of arguments per tape).")
+    group.add_argument('--cache-dir', dest='cache_dir', metavar='DIR',
+                       help="Keep a cache of downloaded files in this directory.")
+    group.add_argument('--cache-size', dest='cache_size', metavar='SIZE', type=_size, default='500M',
+                       help="Limit the size of the download cache (default: 500M). "
+                            "SIZE may have a K, M or G suffix; 0 means no limit.")
     group.add_argument('-d', '--output-dir', dest='output_dir', metavar='DIR',
                        help="Write the snapshot file in this directory.")
     group.add_argument('-f', '--force', action='store_true',
                        help="Overwrite an existing snapshot.")
+    group.add_argument('--jobs', dest='jobs', metavar='N', type=int, default=1,
+                       help="Convert tapes in parallel using N processes (with --batch).")
+    group.add_argument('--offline', action='store_true',
+                       help="Use only the files in the download cache instead of downloading anything.")
     group.add_argument('-p', '--stack', dest='stack', metavar='STACK', type=integer,
                        help="Set the stack pointer.")
     group.add_argument('--ram', dest='ram_ops', metavar='OPERATION', action='append', default=[],
@@ -521,15 +863,13 @@ def main(args):
     if 'help' in namespace.state:
         print_state_help()
         return
+    if namespace.batch and not (unknown_args or namespace.args):
+        _run_batch(parser, namespace, namespace.batch)
+        return
     if unknown_args or len(namespace.args) != 2:
         parser.exit(2, parser.format_help())
     url, z80 = namespace.args
-    if namespace.output_dir:
-        z80 = os.path.join(namespace.output_dir, z80)
-    if namespace.stack is not None:
-        namespace.reg.append('sp={}'.format(namespace.stack))
-    if namespace.start is not None:
-        namespace.reg.append('pc={}'.format(namespace.start))
+    z80 = _get_z80_fname(namespace, z80)
     if namespace.force or not os.path.isfile(z80):
         try:
             make_z80(url, namespace, z80)
@@ -903,6 +903,14 @@ class CommonSkoolMacroTest:
         self.assertEqual(writer.expand('#FORMAT(1+1)({vars[bar$]})'), 'HELLO')
         self.assertEqual(writer.expand('#FORMAT(#EVAL(1+1))({vars[bar$]})'), 'HELLO')
 
+    def test_macro_replacement_text_is_expanded(self):
+        writer = self._get_writer()
+        writer.fields['vars'].update({'m': '#EVAL10,16', 'h': '#'})
+
+        self.assertEqual(writer.expand('(#FORMAT0({vars[m]}))'), '(A)')
+        self.assertEqual(writer.expand('#FORMAT0({vars[h]})EVAL11,16;#EVAL12,16'), 'B;C')
+        self.assertEqual(writer.expand('#EVAL1 #FORMAT0(#EVAL2) #EVAL(3)'), '1 2 3')
+
     def test_macro_format_invalid(self):
         writer = self._get_writer()
         prefix = ERROR_PREFIX.format('FORMAT')
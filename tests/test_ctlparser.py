@@ -1216,6 +1216,28 @@ class CtlParserTest(SkoolKitTestCase):
         }
         self._check_ignoreua_directives(exp_entry_directives, exp_other_directives, blocks)
 
+    def test_many_entries(self):
+        ctl = []
+        for a in range(30000, 38000, 4):
+            ctl.extend((
+                'c {} Routine at {}'.format(a, a),
+                '@ {} label=R{}'.format(a, a),
+                '@ {} nowarn'.format(a + 1),
+                '@ {} ignoreua:m'.format(a + 2),
+                'N {} Mid-block comment above {}.'.format(a + 2, a + 2),
+                '@ {} ignoreua:i'.format(a + 3),
+                '  {},1 Instruction-level comment at {}'.format(a + 3, a + 3)
+            ))
+        blocks = self._get_ctl_parser('\n'.join(ctl), max_address=38000).get_blocks()
+
+        self.assertEqual(len(blocks), 2000)
+        for b in blocks:
+            a = b.start
+            self.assertEqual(b.end, a + 4)
+            self.assertEqual([(s.start, s.end) for s in b.blocks], [(a, a + 2), (a + 2, a + 3), (a + 3, a + 4)])
+            self.assertEqual([s.asm_directives for s in b.blocks], [{a: ['label=R{}'.format(a)], a + 1: ['nowarn']}, {}, {}])
+            self.assertEqual([s.ignoreua_directives for s in b.blocks], [{}, {a + 2: {'m': ''}}, {a + 3: {'i': ''}}])
+
     def test_ignoreua_directives_with_values(self):
         ctl = """
             @ 30000 ignoreua:t=30000
@@ -1885,6 +1885,22 @@ class DisassemblerTest(SkoolKitTestCase):
             operations = tuple([inst[1] for inst in instructions])
             self.assertEqual(operations, ops)
 
+    def test_bytearray_snapshot(self):
+        sna_prefix = [0] * 16384
+        for hex_bytes, ops in ASM.items():
+            snapshot = sna_prefix + [int(hex_bytes[i:i + 2], 16) for i in range(0, len(hex_bytes), 2)]
+            exp_instructions = self._get_disassembler(snapshot).disassemble(16384, len(snapshot), 'n')
+            instructions = self._get_disassembler(bytearray(snapshot)).disassemble(16384, len(snapshot), 'n')
+            self.assertEqual(exp_instructions, [(a, op, list(data)) for a, op, data in instructions])
+
+        snapshot = [(n * 37) % 256 for n in range(65536)]
+        disassembler = self._get_disassembler(snapshot)
+        ba_disassembler = self._get_disassembler(bytearray(snapshot))
+        for method in ('defb_range', 'defm_range', 'defw_range', 'defs_range'):
+            exp_instructions = getattr(disassembler, method)(32768, 32800, ((32, 'n'),))
+            instructions = getattr(ba_disassembler, method)(32768, 32800, ((32, 'n'),))
+            self.assertEqual(exp_instructions, [(a, op, list(data)) for a, op, data in instructions], method)
+
     def test_boundary_asm(self):
         for start, data, op in BOUNDARY_ASM:
             instructions = self._get_instructions(start, data)
@@ -2186,3 +2202,28 @@ class DisassemblerTest(SkoolKitTestCase):
 
         instructions = disassembler.defm_range(0, 1, ((0, 'c'),))
         self.assertEqual([(0, "DEFM 'A'", [65])], instructions)
+
+    def test_all_instructions_with_prefixes_in_every_base(self):
+        data = [0xDD, 0x36, 0x80, 0x10, 0xFD, 0xCB, 0x7F, 0x06, 0xED, 0x43, 0x34, 0x12, 0xCB, 0x47, 0x18, 0xFE, 0xC7]
+        exp_operations = {
+            'n': ('LD (IX-128),16', 'RLC (IY+127)', 'LD (4660),BC', 'BIT 0,A', 'JR 32782', 'RST 0'),
+            'h': ('LD (IX-$80),$10', 'RLC (IY+$7F)', 'LD ($1234),BC', 'BIT 0,A', 'JR $800E', 'RST $00'),
+            'b': ('LD (IX-%10000000),%00010000', 'RLC (IY+%01111111)', 'LD (%0001001000110100),BC', 'BIT 0,A', 'JR %1000000000001110', 'RST %00000000')
+        }
+        snapshot = self._get_snapshot(32768, data)
+        disassembler = self._get_disassembler(snapshot)
+        for base, exp_ops in exp_operations.items():
+            instructions = disassembler.disassemble(32768, 32768 + len(data), base)
+            self.assertEqual(exp_ops, tuple(i[1] for i in instructions))
+
+    def test_subclass_with_custom_decoder(self):
+        class CustomDisassembler(Disassembler):
+            def nop(self, template, a, base):
+                return template.format(a), 1
+            ops = dict(Disassembler.ops)
+            ops[0x00] = (nop, 'NOP ; {}')
+
+        config = Config(False, False, 8, 66, 2, False)
+        disassembler = CustomDisassembler([0, 201, 0], config)
+        instructions = disassembler.disassemble(0, 3, 'n')
+        self.assertEqual([(0, 'NOP ; 0', [0]), (1, 'RET', [201]), (2, 'NOP ; 2', [0])], instructions)
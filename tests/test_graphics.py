@@ -1,5 +1,5 @@
 from skoolkittest import SkoolKitTestCase
-from skoolkit.graphics import Udg, flip_udgs, rotate_udgs, font_udgs
+from skoolkit.graphics import Udg, UdgCache, flip_udgs, rotate_udgs, font_udgs, overlay_udgs
 
 class UdgTest(SkoolKitTestCase):
     def test_flip(self):
@@ -207,3 +207,83 @@ class GraphicsTest(SkoolKitTestCase):
         for i, udg in enumerate(font_udg_array[0]):
             self.assertEqual(udg.attr, attr)
             self.assertEqual(udg.data, chars[i])
+
+    def test_overlay_udgs_with_x_and_y_shifts(self):
+        bg = [[Udg(56, [0] * 8), Udg(56, [0] * 8)], [Udg(56, [0] * 8), Udg(56, [0] * 8)]]
+        fg = [[Udg(1, [255, 129, 129, 129, 129, 129, 129, 255])]]
+        overlay_udgs(bg, fg, 3, 2)
+        exp_bg = [
+            [Udg(56, [0, 0, 31, 16, 16, 16, 16, 16]), Udg(56, [0, 0, 224, 32, 32, 32, 32, 32])],
+            [Udg(56, [16, 31, 0, 0, 0, 0, 0, 0]), Udg(56, [32, 224, 0, 0, 0, 0, 0, 0])]
+        ]
+        self.assertEqual(exp_bg, bg)
+        self.assertEqual([[Udg(1, [255, 129, 129, 129, 129, 129, 129, 255])]], fg)
+
+    def test_overlay_udgs_with_x_shift_and_or_and_mask(self):
+        bg = [[Udg(56, [170] * 8), Udg(56, [85] * 8)]]
+        fg = [[Udg(1, [240] * 8, [15] * 8)]]
+        overlay_udgs(bg, fg, 4, 0, 1)
+        self.assertEqual([[Udg(56, [160] * 8), Udg(56, [85] * 8)]], bg)
+
+    def test_overlay_udgs_with_x_shift_and_and_or_mask(self):
+        bg = [[Udg(56, [170] * 8), Udg(56, [85] * 8)]]
+        fg = [[Udg(1, [240] * 8, [15] * 8)]]
+        overlay_udgs(bg, fg, 4, 0, 2)
+        self.assertEqual([[Udg(56, [175] * 8), Udg(56, [85] * 8)]], bg)
+
+class UdgCacheTest(SkoolKitTestCase):
+    def test_get_udg(self):
+        snapshot = list(range(256)) * 2
+        udg_cache = UdgCache()
+        self.assertEqual(udg_cache.get_udg(snapshot, 56, 8), Udg(56, list(range(8, 16))))
+        self.assertEqual(udg_cache.get_udg(snapshot, 7, 8, 2, 1), Udg(7, list(range(9, 25, 2))))
+        self.assertEqual(udg_cache.get_udg(snapshot, 1, 252, 1, 4, 16, 2), Udg(1, [0, 1, 2, 3, 4, 5, 6, 7], list(range(16, 32, 2))))
+
+    def test_get_udg_returns_independent_copies(self):
+        snapshot = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16]
+        udg_cache = UdgCache()
+        udg1 = udg_cache.get_udg(snapshot, 56, 0, mask_addr=8)
+        udg1.flip(2)
+        udg1.data[0] = 0
+        udg1.mask[0] = 0
+        udg2 = udg_cache.get_udg(snapshot, 7, 0, mask_addr=8)
+        self.assertEqual(udg2, Udg(7, snapshot[:8], snapshot[8:]))
+        self.assertIsNot(udg1.data, udg2.data)
+        self.assertIsNot(udg1.mask, udg2.mask)
+
+    def test_get_udg_at_top_of_memory(self):
+        snapshot = list(range(256)) * 256
+        udg_cache = UdgCache()
+        self.assertEqual(udg_cache.get_udg(snapshot, 56, 65528, 1, 1), Udg(56, list(range(249, 256)) + [0]))
+        with self.assertRaises(IndexError):
+            udg_cache.get_udg(snapshot, 56, 65529)
+
+    def test_get_udg_from_bytearray(self):
+        snapshot = bytearray(range(16))
+        udg_cache = UdgCache()
+        udg = udg_cache.get_udg(snapshot, 56, 0, mask_addr=8)
+        self.assertEqual(udg, Udg(56, list(range(8)), list(range(8, 16))))
+        self.assertIsInstance(udg.data, list)
+        self.assertIsInstance(udg.mask, list)
+
+    def test_get_udg_from_another_snapshot(self):
+        udg_cache = UdgCache()
+        self.assertEqual(udg_cache.get_udg([0] * 8, 56, 0).data, [0] * 8)
+        self.assertEqual(udg_cache.get_udg([255] * 8, 56, 0).data, [255] * 8)
+
+    def test_clear(self):
+        snapshot = [0] * 8
+        udg_cache = UdgCache()
+        self.assertEqual(udg_cache.get_udg(snapshot, 56, 0).data, [0] * 8)
+        snapshot[:] = [255] * 8
+        self.assertEqual(udg_cache.get_udg(snapshot, 56, 0).data, [0] * 8)
+        udg_cache.clear()
+        self.assertEqual(udg_cache.get_udg(snapshot, 56, 0).data, [255] * 8)
+
+    def test_max_size(self):
+        snapshot = list(range(256)) * 2
+        udg_cache = UdgCache()
+        udg_cache.max_size = 4
+        for addr in range(10):
+            self.assertEqual(udg_cache.get_udg(snapshot, 56, addr).data, list(range(addr, addr + 8)))
+            self.assertLessEqual(len(udg_cache._tiles), 4)
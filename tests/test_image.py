@@ -1,9 +1,14 @@
+import os
 import zlib
 from io import BytesIO
+from unittest.mock import patch
 
 from skoolkittest import SkoolKitTestCase
+
 from skoolkit.image import (ImageWriter, PNG_COMPRESSION_LEVEL,
-                            PNG_ENABLE_ANIMATION, PNG_ALPHA)
+                            PNG_ENABLE_ANIMATION, PNG_ALPHA, IMAGE_CACHE,
+                            IMAGE_CACHE_SIZE, AndOrMask, NoMask, OrAndMask)
+from skoolkit.pngwriter import PngWriter
 from skoolkit.graphics import Udg, Frame
 
 TRANSPARENT = [0, 254, 0]
@@ -96,11 +101,101 @@ class ImageWriterOptionsTest(SkoolKitTestCase):
         self.assertEqual(image_writer.options[PNG_COMPRESSION_LEVEL], 9)
         self.assertEqual(image_writer.options[PNG_ENABLE_ANIMATION], 1)
         self.assertEqual(image_writer.options[PNG_ALPHA], 255)
+        self.assertEqual(image_writer.options[IMAGE_CACHE], '')
+        self.assertEqual(image_writer.options[IMAGE_CACHE_SIZE], 65536)
+        self.assertIsNone(image_writer.cache)
 
     def test_invalid_option_value(self):
         image_writer = ImageWriter({PNG_COMPRESSION_LEVEL: 'NaN'})
         self.assertEqual(image_writer.options[PNG_COMPRESSION_LEVEL], 9)
 
+class ImageCacheTest(SkoolKitTestCase):
+    def _write_image(self, cache_dir, frames, config=None, palette=None):
+        iw_config = {IMAGE_CACHE: cache_dir}
+        iw_config.update(config or {})
+        img_stream = BytesIO()
+        ImageWriter(iw_config, palette).write_image(frames, img_stream)
+        return img_stream.getvalue()
+
+    def _get_cache_files(self, cache_dir):
+        return sorted(f for f in os.listdir(cache_dir) if f.endswith('.png'))
+
+    def test_cache_miss_and_hit(self):
+        cache_dir = self.make_directory()
+        frames = [Frame([[Udg(56, (170,) * 8)]], 2)]
+        img_stream = BytesIO()
+        ImageWriter().write_image(frames, img_stream)
+        exp_img_data = img_stream.getvalue()
+
+        self.assertEqual(exp_img_data, self._write_image(cache_dir, frames))
+        cache_files = self._get_cache_files(cache_dir)
+        self.assertEqual(len(cache_files), 1)
+        with open(os.path.join(cache_dir, cache_files[0]), 'rb') as f:
+            self.assertEqual(exp_img_data, f.read())
+
+        with patch.object(PngWriter, 'write_image') as mock_write_image:
+            self.assertEqual(exp_img_data, self._write_image(cache_dir, frames))
+        mock_write_image.assert_not_called()
+
+    def test_cache_keys(self):
+        cache_dir = self.make_directory()
+        udg = Udg(56, (170,) * 8)
+        self._write_image(cache_dir, [Frame([[udg]])])
+        self._write_image(cache_dir, [Frame([[Udg(57, (170,) * 8)]])])
+        self._write_image(cache_dir, [Frame([[Udg(56, (171,) * 8)]])])
+        self._write_image(cache_dir, [Frame([[Udg(56, (170,) * 8, (1,) * 8)]], mask=1)])
+        self._write_image(cache_dir, [Frame([[udg]], 2)])
+        self._write_image(cache_dir, [Frame([[udg]], 2, width=12)])
+        self._write_image(cache_dir, [Frame([[udg]]), Frame([[udg]], delay=1)])
+        self._write_image(cache_dir, [Frame([[udg]])], {PNG_COMPRESSION_LEVEL: 1})
+        self._write_image(cache_dir, [Frame([[udg]])], palette={'WHITE': (255, 255, 255)})
+        self.assertEqual(len(self._get_cache_files(cache_dir)), 9)
+
+        self._write_image(cache_dir, [Frame([[Udg(56, [170] * 8)]])])
+        self.assertEqual(len(self._get_cache_files(cache_dir)), 9)
+
+    def test_cache_eviction(self):
+        cache_dir = self.make_directory()
+        images = []
+        for attr in range(1, 7):
+            udgs = [[Udg(attr, [(attr * x * y * j) % 251 for j in range(8)]) for x in range(8)] for y in range(8)]
+            frames = [Frame(udgs)]
+            images.append(self._write_image(cache_dir, frames, {IMAGE_CACHE_SIZE: 1}))
+            cache_files = self._get_cache_files(cache_dir)
+            cache_size = sum(os.path.getsize(os.path.join(cache_dir, f)) for f in cache_files)
+            self.assertLessEqual(cache_size, 1024)
+        self.assertLess(len(cache_files), 6)
+
+        with patch.object(PngWriter, 'write_image') as mock_write_image:
+            self.assertEqual(images[-1], self._write_image(cache_dir, frames, {IMAGE_CACHE_SIZE: 1}))
+        mock_write_image.assert_not_called()
+
+class MaskUsageTest(SkoolKitTestCase):
+    def _test_usage(self, mask, udg_byte, mask_byte):
+        udg = Udg(0, [udg_byte] * 8, None if mask_byte is None else [mask_byte] * 8)
+        pixels = mask.apply(udg, 0, 'p', 'i', 't')
+        usage = mask.usage(udg, 0, 8)
+        for name, shift in (('i', 0), ('p', 8), ('t', 16)):
+            exp_bits = int(''.join('1' if p == name else '0' for p in pixels), 2)
+            self.assertEqual((usage >> shift) & 255, exp_bits)
+        self.assertEqual(mask.usage(udg, 3, 3), 0)
+
+    def test_no_mask(self):
+        for udg_byte in range(256):
+            self._test_usage(NoMask(), udg_byte, None)
+
+    def test_or_and_mask(self):
+        for udg_byte in range(256):
+            self._test_usage(OrAndMask(), udg_byte, None)
+            for mask_byte in range(0, 256, 7):
+                self._test_usage(OrAndMask(), udg_byte, mask_byte)
+
+    def test_and_or_mask(self):
+        for udg_byte in range(256):
+            self._test_usage(AndOrMask(), udg_byte, None)
+            for mask_byte in range(0, 256, 7):
+                self._test_usage(AndOrMask(), udg_byte, mask_byte)
+
 class ImageWriterTest:
     def _get_num(self, stream, index):
         return index + 1, stream[index]
@@ -902,6 +997,66 @@ class ImageWriterTest:
         frames = [frame1, frame2]
         self._test_animated_image(frames)
 
+    def test_animation_with_partial_changes(self):
+        # 3 frames, 16x16; only the top-right UDG changes in frame 2, and only
+        # the bottom row of UDGs changes in frame 3
+        udgs1 = [[Udg(56, [n] * 8) for n in (1, 2)], [Udg(56, [n] * 8) for n in (3, 4)]]
+        udgs2 = [[Udg(56, [n] * 8) for n in (1, 5)], [Udg(56, [n] * 8) for n in (3, 4)]]
+        udgs3 = [[Udg(56, [n] * 8) for n in (1, 5)], [Udg(56, [n] * 8) for n in (6, 7)]]
+        frames = [Frame(udgs1, delay=10), Frame(udgs2, delay=20), Frame(udgs3, delay=30)]
+        exp_frames = [(0, 10, None), (1, 20, (8, 0, 8, 8)), (2, 30, (0, 8, 16, 8))]
+        self._test_animated_image(frames, exp_frames=exp_frames)
+
+    def test_animation_with_partial_changes_scaled(self):
+        udgs1 = [[Udg(56, [n] * 8) for n in (1, 2, 3)] for r in range(3)]
+        udgs2 = [[Udg(56, [n] * 8) for n in (1, 2, 3)] for r in range(3)]
+        udgs2[1][1] = Udg(1, [85] * 8)
+        frames = [Frame(udgs1, 2), Frame(udgs2, 2, delay=5)]
+        exp_frames = [(0, 32, None), (1, 5, (16, 16, 16, 16))]
+        self._test_animated_image(frames, exp_frames=exp_frames)
+
+    def test_animation_with_partial_changes_cropped(self):
+        # 2 frames, cropped to 13x10 at (3,2); only the bottom-right UDG
+        # changes, and it is cropped too
+        udgs1 = [[Udg(56, [n] * 8) for n in (1, 2)], [Udg(56, [n] * 8) for n in (3, 4)]]
+        udgs2 = [[Udg(56, [n] * 8) for n in (1, 2)], [Udg(56, [n] * 8) for n in (3, 170)]]
+        frames = [Frame(udgs1, 1, 0, 3, 2, 13, 10), Frame(udgs2, 1, 0, 3, 2, 13, 10)]
+        exp_frames = [(0, 32, None), (1, 32, (5, 6, 8, 4))]
+        self._test_animated_image(frames, exp_frames=exp_frames)
+
+    def test_animation_with_partial_changes_masked(self):
+        iw_args = {'config': self.alpha_option}
+        udgs1 = [[Udg(56, [15] * 8, [207] * 8), Udg(56, [0] * 8)]]
+        udgs2 = [[Udg(56, [15] * 8, [207] * 8), Udg(49, [240] * 8, [243] * 8)]]
+        frames = [Frame(udgs1, mask=1), Frame(udgs2, mask=1)]
+        exp_frames = [(0, 32, None), (1, 32, (8, 0, 8, 8))]
+        self._test_animated_image(frames, iw_args, exp_frames)
+
+    def test_animation_with_identical_frames(self):
+        # Frames 2 and 4 are the same as frames 1 and 3
+        udg1, udg2 = Udg(6, (128,) * 8), Udg(6, (64,) * 8)
+        frames = [
+            Frame([[udg1]], delay=10),
+            Frame([[udg1.copy()]], delay=20),
+            Frame([[udg2]], delay=30),
+            Frame([[udg2.copy()]], delay=40)
+        ]
+        exp_frames = [(0, 30, None), (2, 70, None)]
+        self._test_animated_image(frames, exp_frames=exp_frames)
+
+    def test_animation_with_all_frames_identical(self):
+        udg = Udg(6, (128,) * 8)
+        frames = [Frame([[udg]], delay=10), Frame([[udg]], delay=20)]
+        self._test_animated_image(frames, exp_frames=[(0, 30, None)])
+
+    def test_animation_with_identical_frames_and_long_delays(self):
+        # The delays of identical frames are not merged if their sum would not
+        # fit in the fcTL chunk
+        udg = Udg(6, (128,) * 8)
+        frames = [Frame([[udg]], delay=40000), Frame([[udg]], delay=30000), Frame([[udg]], delay=20000)]
+        exp_frames = [(0, 40000, None), (1, 50000, None)]
+        self._test_animated_image(frames, exp_frames=exp_frames)
+
 class PngWriterTest(SkoolKitTestCase, ImageWriterTest):
     def setUp(self):
         SkoolKitTestCase.setUp(self)
@@ -1162,7 +1317,7 @@ class PngWriterTest(SkoolKitTestCase, ImageWriterTest):
         # IEND
         self.assertEqual(img_bytes[i:], IEND_CHUNK)
 
-    def _test_animated_image(self, frames, iw_args=None):
+    def _test_animated_image(self, frames, iw_args=None, exp_frames=None):
         image_writer = ImageWriter(**(iw_args or {}))
         img_bytes = self._get_animated_image_data(image_writer, frames)
 
@@ -1211,8 +1366,28 @@ class PngWriterTest(SkoolKitTestCase, ImageWriterTest):
             if alpha < 255:
                 i = self._check_trns(img_bytes, i, alpha)
 
+        # Each expected frame is (index, delay, rect), where rect is the part of
+        # the frame that is written (if not the whole frame)
+        if exp_frames:
+            exp_frame_data = []
+            for n, delay, rect in exp_frames:
+                width, height, pixels, d, x_offset, y_offset = frame_data[n]
+                if rect:
+                    x, y, width, height = rect
+                    pixels = [row[x:x + width] for row in pixels[y:y + height]]
+                    x_offset += x
+                    y_offset += y
+                exp_frame_data.append((width, height, pixels, delay, x_offset, y_offset))
+            frame_data = exp_frame_data
+
+        if len(frame_data) == 1:
+            # Still image
+            i = self._check_idat(img_bytes, i, exp_bit_depth, palette, frame_data[0][2], exp_width)
+            self.assertEqual(img_bytes[i:], IEND_CHUNK)
+            return
+
         # acTL
-        i = self._check_actl(img_bytes, i, len(frames))
+        i = self._check_actl(img_bytes, i, len(frame_data))
 
         # Frames
         seq_num = 0
@@ -1227,3 +1402,27 @@ class PngWriterTest(SkoolKitTestCase, ImageWriterTest):
 
         # IEND
         self.assertEqual(img_bytes[i:], IEND_CHUNK)
+
+    def test_chunk_crcs(self):
+        # Every chunk CRC must match the value given by the table-driven
+        # algorithm in the PNG specification
+        udgs = [[Udg(n, [n * k & 255 for k in range(8)]) for n in range(1, 9)] for m in range(3)]
+        frames = [Frame(udgs, 2), Frame(udgs, 2, x=4, y=4, width=20, height=20, delay=10)]
+        img_bytes = self._get_animated_image_data(ImageWriter(), frames)
+        i = len(PNG_SIGNATURE)
+        num_chunks = 0
+        while i < len(img_bytes):
+            i, length = self._get_dword(img_bytes, i)
+            i, crc = self._get_dword(img_bytes, i + length + 4)
+            self.assertEqual(crc, self._get_crc(img_bytes[i - length - 8:i - 4]))
+            num_chunks += 1
+        self.assertGreater(num_chunks, 5)
+
+        png_writer = PngWriter()
+        for data in (b'IDAT', b'IDAT' + bytes(range(256)) * 4):
+            img_file = BytesIO()
+            png_writer._write_img_data_chunk(img_file, data)
+            chunk = img_file.getvalue()
+            self.assertEqual(chunk[:4], (len(data) - 4).to_bytes(4, 'big'))
+            self.assertEqual(chunk[4:-4], data)
+            self.assertEqual(chunk[-4:], self._get_crc(data).to_bytes(4, 'big'))
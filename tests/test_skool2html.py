@@ -162,6 +162,8 @@ class Skool2HtmlTest(SkoolKitTestCase):
         self.assertEqual(options.output_dir, '.')
         self.assertEqual(options.params, [])
         self.assertEqual(options.variables, [])
+        self.assertFalse(options.incremental)
+        self.assertEqual(options.jobs, 1)
         self.assertEqual(config['EntryLabel'], 'L{address}')
         self.assertEqual(config['EntryPointLabel'], '{main}_{index}')
 
@@ -177,6 +179,8 @@ class Skool2HtmlTest(SkoolKitTestCase):
             CreateLabels=1
             EntryLabel=L_{{address}}
             EntryPointLabel={{main}}__{{index}}
+            Incremental=1
+            Jobs=4
             JoinCss=css.css
             OutputDir={}
             Quiet=1
@@ -193,6 +197,8 @@ class Skool2HtmlTest(SkoolKitTestCase):
         self.assertTrue(options.asm_labels)
         self.assertTrue(options.asm_one_page)
         self.assertTrue(options.create_labels)
+        self.assertTrue(options.incremental)
+        self.assertEqual(options.jobs, 4)
         self.assertEqual(options.single_css, 'css.css')
         self.assertEqual(options.search, ['this', 'that'])
         self.assertEqual(options.themes, ['dark', 'wide'])
@@ -1065,6 +1071,302 @@ class Skool2HtmlTest(SkoolKitTestCase):
             with self.assertRaisesRegex(SkoolKitError, error_msg):
                 self.run_skool2html('{} {} -d {} {}'.format(option, single_css, self.odir, skoolfile))
 
+    def _read_files(self, odir):
+        files = {}
+        for root, dirs, fnames in os.walk(odir):
+            for fname in fnames:
+                path = os.path.join(root, fname)
+                with open(path, 'rb') as f:
+                    files[os.path.relpath(path, odir)] = f.read()
+        return files
+
+    def _test_option_jobs(self, options, skool, ref, other_skool, exp_pages, exp_processes=True):
+        other_skoolfile = self.write_text_file(dedent(other_skool).strip(), suffix='.skool')
+        reffile = self._write_ref_file(ref.format(other_skoolfile))
+        skoolfile = self.write_text_file(dedent(skool).strip(), '{}.skool'.format(reffile[:-4]))
+        serial_odir = self.make_directory()
+        output, error = self.run_skool2html('{} -d {} {}'.format(options, serial_odir, skoolfile))
+        self.assertEqual(error, '')
+        exp_files = self._read_files(serial_odir)
+        self.assertTrue(any(f.endswith('.png') for f in exp_files))
+
+        for jobs in (2, 3, 20):
+            parallel_odir = self.make_directory()
+            output, error = self.run_skool2html('{} --jobs {} -d {} {}'.format(options, jobs, parallel_odir, skoolfile))
+            self.assertEqual(error, '')
+            if exp_processes:
+                self.assertIn('Writing {} pages using {} processes\n'.format(exp_pages, min(jobs, exp_pages)), output)
+            else:
+                self.assertIn('Writing {} pages\n'.format(exp_pages), output)
+            files = self._read_files(parallel_odir)
+            self.assertEqual(sorted(exp_files), sorted(files))
+            for fname, contents in exp_files.items():
+                self.assertEqual(contents, files[fname], fname)
+
+    def test_option_jobs(self):
+        ref = """
+            [OtherCode:other]
+            Source={}
+            [Page:Custom]
+            PageContent=#UDG32768(udg)
+        """
+        skool = """
+            ; Routine at 32768
+            ;
+            ; #UDG32768(udg) #UDG32769,56(udg2)
+            c32768 LD A,(32772)  ; #R32772
+             32771 RET
+
+            ; Data at 32772
+            ;
+            ; #UDG32768(udg) #UDGARRAY2;32768-32769(array)
+            b32772 DEFB 1,2,3,4,5,6,7,8,9
+
+            ; Message at 32781
+            ;
+            ; #SCR1(scr)
+            t32781 DEFM "Hi"
+        """
+        other_skool = "; Other code routine\nc49152 JP 49152"
+        self._test_option_jobs('', skool, ref, other_skool, 10)
+
+    def test_option_jobs_asm_one_page(self):
+        ref = """
+            [OtherCode:other]
+            Source={}
+        """
+        skool = """
+            ; Routine at 32768
+            ;
+            ; #UDG32768(udg)
+            c32768 JP 32771
+
+            ; Data at 32771
+            ;
+            ; #UDG32768(udg)
+            b32771 DEFB 0
+        """
+        other_skool = "; Other code routine\nc49152 JP 49152"
+        self._test_option_jobs('-1', skool, ref, other_skool, 6)
+
+    def test_option_jobs_with_pokes_macro(self):
+        ref = """
+            [OtherCode:other]
+            Source={}
+        """
+        skool = """
+            ; Routine at 32768
+            ;
+            ; #POKES32771,255 #UDG32771(udg)
+            c32768 JP 32771
+
+            ; Data at 32771
+            ;
+            ; #UDG32771(udg2)
+            b32771 DEFB 0,0,0,0,0,0,0,0
+        """
+        other_skool = "; Other code routine\nc49152 JP 49152"
+        self._test_option_jobs('', skool, ref, other_skool, 7, False)
+
+    def test_option_jobs_with_frames_defined_on_another_page(self):
+        ref = """
+            [OtherCode:other]
+            Source={}
+            [Page:Custom]
+            PageContent=#UDGARRAY*foo(anim)
+        """
+        skool = """
+            ; Routine at 32768
+            ;
+            ; #UDG32771(*foo)
+            c32768 JP 32771
+
+            ; Data at 32771
+            b32771 DEFB 1,2,3,4,5,6,7,8
+        """
+        other_skool = "; Other code routine\nc49152 JP 49152"
+        self._test_option_jobs('', skool, ref, other_skool, 8, False)
+
+    def test_option_jobs_with_let_and_def_macros_used_on_another_page(self):
+        ref = """
+            [OtherCode:other]
+            Source={}
+        """
+        skool = """
+            ; Routine at 32768
+            ;
+            ; #LET(foo=5)#DEF(#BAR #EVAL5) #UDG32771(udg)
+            c32768 JP 32771
+
+            ; Data at 32771
+            ;
+            ; #IF({foo}==5)(five,other) and #BAR
+            b32771 DEFB 0,0,0,0,0,0,0,0
+        """
+        other_skool = "; Other code routine\nc49152 JP 49152"
+        self._test_option_jobs('', skool, ref, other_skool, 7, False)
+
+    def _write_html_writer_module(self, name, body):
+        module_dir = self.make_directory()
+        writer_module = """
+            from skoolkit.skoolhtml import HtmlWriter
+            class TestHtmlWriter(HtmlWriter):
+                {}
+        """.format(body)
+        self.write_text_file(dedent(writer_module).strip(), path=os.path.join(module_dir, name + '.py'))
+        return '{}:{}.TestHtmlWriter'.format(module_dir, name)
+
+    def test_option_jobs_with_parallel_html_writer_class(self):
+        ref = """
+            [OtherCode:other]
+            Source={}
+        """
+        skool = """
+            ; Routine at 32768
+            ;
+            ; #UDG32768(udg)
+            c32768 RET
+        """
+        other_skool = "; Other code routine\nc49152 JP 49152"
+        writer = self._write_html_writer_module('parallelmod', 'parallel_pages = True')
+        self._test_option_jobs('-W {}'.format(writer), skool, ref, other_skool, 5)
+
+    def test_option_jobs_with_undeclared_html_writer_class(self):
+        ref = """
+            [OtherCode:other]
+            Source={}
+        """
+        skool = """
+            ; Routine at 32768
+            ;
+            ; #UDG32768(udg)
+            c32768 RET
+        """
+        other_skool = "; Other code routine\nc49152 JP 49152"
+        writer = self._write_html_writer_module('serialmod', 'pass')
+        self._test_option_jobs('-W {}'.format(writer), skool, ref, other_skool, 5, False)
+
+    def _run_incremental(self, skool, odir, exp_written, exp_skipped, options=''):
+        self.write_text_file(dedent(skool).strip(), 'game.skool')
+        output, error = self.run_skool2html('{} --incremental -d {} game.skool'.format(options, odir))
+        self.assertEqual(error, '')
+        self.assertIn('Pages written: {}; pages skipped: {}\n'.format(exp_written, exp_skipped), output)
+
+    def test_option_incremental(self):
+        skool = """
+            ; Routine at 32768
+            ;
+            ; #UDG32768(udg)
+            c32768 JP 32771
+
+            ; Data at 32771
+            ;
+            ; #UDG32768,56(udg2)
+            b32771 DEFB 0
+        """
+        odir = self.make_directory()
+        self._run_incremental(skool, odir, 5, 0)
+        self.assertTrue(os.path.isfile('{}/game/.skool2html.json'.format(odir)))
+        self._run_incremental(skool, odir, 0, 5)
+
+        # Changing a comment rewrites the entry's page and the memory maps
+        new_skool = skool.replace('JP 32771', 'JP 32771 ; Jump')
+        self._run_incremental(new_skool, odir, 4, 1)
+        self._run_incremental(new_skool, odir, 0, 5)
+        exp_odir = self.make_directory()
+        self.run_skool2html('-d {} game.skool'.format(exp_odir))
+        files = self._read_files('{}/game'.format(odir))
+        del files['.skool2html.json']
+        self.assertEqual(self._read_files('{}/game'.format(exp_odir)), files)
+
+        # Removing an image rewrites the page that uses it
+        os.remove('{}/game/images/udgs/udg2.png'.format(odir))
+        self._run_incremental(new_skool, odir, 1, 4)
+        self.assertTrue(os.path.isfile('{}/game/images/udgs/udg2.png'.format(odir)))
+
+    def test_option_incremental_with_rebuild_images(self):
+        skool = """
+            ; Routine at 32768
+            ;
+            ; #UDG32768(udg)
+            c32768 RET
+        """
+        odir = self.make_directory()
+        self._run_incremental(skool, odir, 3, 0)
+        self._run_incremental(skool, odir, 3, 0, '-o')
+        self._run_incremental(skool, odir, 0, 3)
+
+    def test_option_incremental_rewrites_neighbouring_entries(self):
+        skool = """
+            ; Routine at 32768
+            c32768 JP 32771
+
+            ; Data at 32771
+            b32771 DEFB 0
+
+            ; Data at 32772
+            b32772 DEFB 0
+        """
+        odir = self.make_directory()
+        self._run_incremental(skool, odir, 6, 0)
+
+        # Changing an entry's title rewrites its page, the page of the
+        # previous entry (which links to it), and the memory maps
+        new_skool = skool.replace('Data at 32772', 'Table at 32772')
+        self._run_incremental(new_skool, odir, 5, 1)
+        exp_odir = self.make_directory()
+        self.run_skool2html('-d {} game.skool'.format(exp_odir))
+        files = self._read_files('{}/game'.format(odir))
+        del files['.skool2html.json']
+        self.assertEqual(self._read_files('{}/game'.format(exp_odir)), files)
+
+    def test_option_incremental_with_pokes_macro(self):
+        skool = """
+            ; Routine at 32768
+            ;
+            ; #POKES32771,1 #UDG32771(udg)
+            c32768 RET
+
+            ; Data at 32771
+            b32771 DEFB 0
+        """
+        odir = self.make_directory()
+        self._run_incremental(skool, odir, 5, 0)
+        self._run_incremental(skool, odir, 5, 0)
+
+    def test_option_incremental_with_let_macro_used_on_another_page(self):
+        skool = """
+            ; Routine at 32768
+            ;
+            ; #LET(foo=5)
+            c32768 RET
+
+            ; Data at 32769
+            b32769 DEFB 0
+
+            ; Data at 32770
+            b32770 DEFB 0
+
+            ; Data at 32771
+            ;
+            ; Uses #IF({foo}==5)(five,other)
+            b32771 DEFB 0
+        """
+        odir = self.make_directory()
+        self._run_incremental(skool, odir, 7, 0)
+
+        # Changing the value of the field rewrites every page, including the
+        # one that uses the field (which is not next to the one that sets it)
+        new_skool = skool.replace('foo=5', 'foo=6')
+        self._run_incremental(new_skool, odir, 7, 0)
+        with open('{}/game/asm/32771.html'.format(odir)) as f:
+            self.assertIn('Uses other', f.read())
+        exp_odir = self.make_directory()
+        self.run_skool2html('-d {} game.skool'.format(exp_odir))
+        files = self._read_files('{}/game'.format(odir))
+        del files['.skool2html.json']
+        self.assertEqual(self._read_files('{}/game'.format(exp_odir)), files)
+
     @patch.object(skool2html, 'get_object', Mock(return_value=TestHtmlWriter))
     @patch.object(skool2html, 'SkoolParser', MockSkoolParser)
     @patch.object(skool2html, 'write_disassembly', mock_write_disassembly)
@@ -1375,6 +1677,8 @@ class Skool2HtmlTest(SkoolKitTestCase):
             CreateLabels=0
             EntryLabel=L{address}
             EntryPointLabel={main}_{index}
+            Incremental=0
+            Jobs=1
             JoinCss=
             OutputDir=.
             Quiet=0
@@ -1405,6 +1709,8 @@ class Skool2HtmlTest(SkoolKitTestCase):
             CreateLabels=0
             EntryLabel=L{address}
             EntryPointLabel={main}_{index}
+            Incremental=0
+            Jobs=1
             JoinCss=
             OutputDir=html
             Quiet=1
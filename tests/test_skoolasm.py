@@ -1,11 +1,12 @@
 import re
 from textwrap import dedent, wrap
+from unittest.mock import patch
 
 from skoolkittest import SkoolKitTestCase
 from macrotest import CommonSkoolMacroTest, nest_macros
-from skoolkit import SkoolParsingError, BASE_10, BASE_16
+from skoolkit import SkoolKitError, SkoolParsingError, BASE_10, BASE_16
 from skoolkit.config import COMMANDS
-from skoolkit.skoolasm import AsmWriter
+from skoolkit.skoolasm import AsmWriter, BUFFER_SIZE
 from skoolkit.skoolparser import SkoolParser, CASE_LOWER, CASE_UPPER
 
 ERROR_PREFIX = 'Error while parsing #{0} macro'
@@ -1189,6 +1190,32 @@ class AsmWriterTest(SkoolKitTestCase, CommonSkoolMacroTest):
         warnings = self.err.getvalue()
         self.assertEqual(warnings, '')
 
+    def test_suppress_warnings_skips_address_checks(self):
+        skool = """
+            @start
+            ; Routine at 24576
+            ;
+            ; Used by the routine at 24576.
+            ;
+            ; A Value at 24576
+            c24576 JP 24576 ; Jump to 24576
+            ; Jump to 24576 again.
+             24579 JP 24576 ; {Jump to 24576
+             24582 JP 24576 ; once more}
+            ; Return from 24576.
+        """
+        with patch.object(AsmWriter, 'find_unconverted_addresses') as mock_find:
+            self._get_asm(skool, warn=False)
+        mock_find.assert_not_called()
+        self.assertEqual(self.err.getvalue(), '')
+
+    def test_output_longer_than_buffer(self):
+        skool = '@start\n; Data\nb32768 DEFB 0\n' + ''.join(' {} DEFB {}\n'.format(32769 + i, i % 256) for i in range(BUFFER_SIZE * 2))
+        exp_asm = ['; Data', '  DEFB 0'] + ['  DEFB {}'.format(i % 256) for i in range(BUFFER_SIZE * 2)] + ['']
+        for crlf, end in ((False, '\n'), (True, '\r\n')):
+            asm = self._get_asm(skool, crlf=crlf)
+            self.assertEqual(asm, end.join(exp_asm) + end)
+
     def test_option_crlf(self):
         skool = """
             @start
@@ -2698,6 +2725,27 @@ class AsmWriterTest(SkoolKitTestCase, CommonSkoolMacroTest):
         """
         self._test_asm(skool, exp_asm, templates=templates)
 
+    def test_custom_template_with_unknown_field(self):
+        templates = {'label': '{label}{suffix} ; {address}'}
+        skool = """
+            @start
+            ; Routine
+            @label=START
+            c60000 RET
+        """
+        with self.assertRaisesRegex(SkoolKitError, "^Unknown field 'address' in label template$"):
+            self._get_asm(skool, templates=templates)
+
+    def test_custom_template_with_invalid_format(self):
+        templates = {'comment': '; {text:X}'}
+        skool = """
+            @start
+            ; Routine
+            c60000 RET
+        """
+        with self.assertRaisesRegex(SkoolKitError, "^Failed to format comment template: Unknown format code 'X' for object of type 'str'$"):
+            self._get_asm(skool, templates=templates)
+
     def test_custom_label_template(self):
         templates = {'label': '.{label}:'}
         skool = """
@@ -1,4 +1,5 @@
 import html
+import os
 from io import StringIO
 from os.path import basename, isdir, isfile
 from posixpath import join
@@ -403,6 +404,17 @@ class HtmlWriterTest(HtmlWriterTestCase):
         writer = self._get_writer(ref=ref)
         self.assertNotIn('Bar', writer.get_page_ids())
 
+    def test_image_file_is_discarded_on_error(self):
+        writer = self._get_writer(snapshot=[0] * 8)
+        def write_image(frames, img_file):
+            img_file.write(b'partial')
+            raise ValueError('Image writer failed')
+        writer.image_writer.write_image = write_image
+        with self.assertRaisesRegex(ValueError, '^Image writer failed$'):
+            writer.expand('#UDG0(foo)', ASMDIR)
+        images_dir = '{}/{}/images/udgs'.format(self.odir, GAMEDIR)
+        self.assertEqual([], os.listdir(images_dir))
+
     def test_unexpandable_macros_in_Game_section(self):
         self._test_unexpandable_macros_in_ref_file_section('Game', 'Logo')
 
@@ -1183,6 +1195,43 @@ class MethodTest(HtmlWriterTestCase):
         """
         self._test_format_template(ref, 'elses', fields, exp_output)
 
+    def test_format_template_if_overlapping_foreach(self):
+        ref = """
+            [Template:overlap]
+            <# if({flag}) #>
+            <# foreach(item,list) #>
+            {item}
+            <# endif #>
+            <# endfor #>
+            Done
+        """
+        writer = self._get_writer(ref=ref)
+        for flag, exp_output in ((0, 'b\n<# endif #>\nDone'), (1, 'a\nb\n<# endif #>\nDone')):
+            output = writer.format_template('overlap', {'flag': flag, 'list': ('a', 'b')})
+            self.assertEqual(exp_output, output)
+
+    def test_format_template_reused(self):
+        ref = """
+            [Template:loop]
+            <# foreach(item,list) #>
+            <# if(item[1]) #>
+            {item[0]}
+            <# else #>
+            -
+            <# endif #>
+            <# endfor #>
+            <# include({template}) #>
+            [Template:t1]
+            T1
+            [Template:t2]
+            T2
+        """
+        writer = self._get_writer(ref=ref)
+        output = writer.format_template('loop', {'list': (('a', 1), ('b', 0)), 'template': 't1'})
+        self.assertEqual('a\n-\nT1', output)
+        output = writer.format_template('loop', {'list': (('c', 0), ('d', 1), ('e', 1)), 'template': 't2'})
+        self.assertEqual('-\nd\ne\nT2', output)
+
     def test_format_template_if_missing_parameter(self):
         ref = """
             [Template:if]
@@ -1233,6 +1282,82 @@ class MethodTest(HtmlWriterTestCase):
         with self.assertRaisesRegex(SkoolKitError, "^Invalid if directive: Syntax error in expression: '\(1;\)'$"):
             self._get_writer(ref=ref).format_template('if', {})
 
+    def _test_format_template_error(self, ref, name, fields, exp_error):
+        writer = self._get_writer(ref=ref)
+        for i in range(2):
+            with self.assertRaises(SkoolKitError) as cm:
+                writer.format_template(name, fields)
+            self.assertEqual(cm.exception.args[0], exp_error)
+
+    def test_format_template_foreach_error_reported_before_if_error(self):
+        ref = """
+            [Template:t]
+            <# if(nonexistent) #>
+            Content
+            <# endif #>
+            <# foreach(item,0) #>
+            {item}
+            <# endfor #>
+        """
+        self._test_format_template_error(ref, 't', {}, "Invalid foreach directive: '0' is not a list")
+
+    def test_format_template_invalid_foreach_in_unused_if_branch(self):
+        ref = """
+            [Template:t]
+            <# if(0) #>
+            <# foreach(item,0) #>
+            {item}
+            <# endfor #>
+            <# endif #>
+        """
+        self._test_format_template_error(ref, 't', {}, "Invalid foreach directive: '0' is not a list")
+
+    def test_format_template_invalid_foreach_in_unused_else_branch(self):
+        ref = """
+            [Template:t]
+            <# if(1) #>
+            Content
+            <# else #>
+            <# foreach(item,nonexistent) #>
+            {item}
+            <# endfor #>
+            <# endif #>
+        """
+        self._test_format_template_error(ref, 't', {}, "Invalid foreach directive: name 'nonexistent' is not defined")
+
+    def test_format_template_invalid_if_in_unused_if_branch(self):
+        ref = """
+            [Template:t]
+            <# if(0) #>
+            <# if(nonexistent) #>
+            Content
+            <# endif #>
+            <# endif #>
+        """
+        self._test_format_template_error(ref, 't', {}, "Invalid if directive: name 'nonexistent' is not defined")
+
+    def test_format_template_invalid_if_in_foreach(self):
+        ref = """
+            [Template:t]
+            <# foreach(item,items) #>
+            <# if({nonexistent}) #>
+            {item}
+            <# endif #>
+            <# endfor #>
+        """
+        self._test_format_template_error(ref, 't', {'items': [1, 2]}, "Invalid if directive: Unrecognised field 'nonexistent'")
+
+    def test_format_template_nested_foreach_noniterable_parameter(self):
+        ref = """
+            [Template:t]
+            <# foreach(item,items) #>
+            <# foreach(subitem,item) #>
+            {subitem}
+            <# endfor #>
+            <# endfor #>
+        """
+        self._test_format_template_error(ref, 't', {'items': [[1], 2]}, "Invalid foreach directive: 'items[1]' is not a list")
+
     def test_format_template_include(self):
         ref = """
             [Template:t1]
@@ -4046,6 +4171,62 @@ class SkoolMacroTest(HtmlWriterTestCase, CommonSkoolMacroTest):
         exp_udgs = [[udg]]
         self._test_image_macro(snapshot, macro, exp_image_path, exp_udgs, scale=2, mask=2)
 
+    def test_macro_udgarray_with_repeated_udgs(self):
+        snapshot = [1, 2, 4, 8, 16, 32, 64, 128]
+        fname = 'repeated'
+        macro = '#UDGARRAY2,flip=2;0x2({})'.format(fname)
+        exp_image_path = '{}/{}.png'.format(UDGDIR, fname)
+        exp_udgs = [[Udg(56, snapshot[::-1]), Udg(56, snapshot[::-1])]]
+        self._test_image_macro(snapshot, macro, exp_image_path, exp_udgs)
+
+    def test_macro_udgarray_after_pokes_and_pops(self):
+        writer = self._get_writer(snapshot=[0] * 8, mock_file_info=True)
+        for macros, exp_data in (
+                ('#UDGARRAY1,flip=2;0(a)', [0] * 8),
+                ('#PUSHS #POKES0,1,8 #UDGARRAY1;0(b)', [1] * 8),
+                ('#POKES0,2 #UDGARRAY1;0(c)', [2] + [1] * 7),
+                ('#POPS #UDGARRAY1;0(d)', [0] * 8)
+        ):
+            writer.expand(macros, ASMDIR)
+            self._check_image(writer, [[Udg(56, exp_data)]], path='{}/{}.png'.format(UDGDIR, macros[-2]))
+
+    def test_macro_udg_after_pokes_and_pops(self):
+        writer = self._get_writer(snapshot=[0] * 16, mock_file_info=True)
+        for macros, exp_data in (
+                ('#UDG0,flip=2:8(a)', [0] * 8),
+                ('#PUSHS #POKES0,1,8 #UDG0:8(b)', [1] * 8),
+                ('#POKES0,2 #UDG0:8(c)', [2] + [1] * 7),
+                ('#POPS #UDG0:8(d)', [0] * 8)
+        ):
+            writer.expand(macros, ASMDIR)
+            self._check_image(writer, [[Udg(56, exp_data, [0] * 8)]], scale=4, mask=1, path='{}/{}.png'.format(UDGDIR, macros[-2]))
+
+    def test_macro_udg_after_direct_snapshot_writes_and_clear_udg_cache(self):
+        writer = self._get_writer(snapshot=[0] * 16, mock_file_info=True)
+        writer.expand('#UDG0:8(a)', ASMDIR)
+        self._check_image(writer, [[Udg(56, [0] * 8, [0] * 8)]], scale=4, mask=1, path='{}/a.png'.format(UDGDIR))
+        writer.snapshot[0:16] = [3] * 8 + [4] * 8
+        writer.clear_udg_cache()
+        writer.expand('#UDG0:8(b)', ASMDIR)
+        self._check_image(writer, [[Udg(56, [3] * 8, [4] * 8)]], scale=4, mask=1, path='{}/b.png'.format(UDGDIR))
+
+    def test_macro_udgarray_after_direct_snapshot_writes_and_clear_udg_cache(self):
+        writer = self._get_writer(snapshot=[0] * 16, mock_file_info=True)
+        for data, exp_data in (([5] * 8, [6] * 8), ([7] * 8, [8] * 8)):
+            writer.snapshot[0:8] = data
+            writer.clear_udg_cache()
+            writer.expand('#UDGARRAY1;0,,,1(f{})'.format(data[0]), ASMDIR)
+            self._check_image(writer, [[Udg(56, exp_data)]], path='{}/f{}.png'.format(UDGDIR, data[0]))
+
+    def test_macros_udg_and_udgarray_after_snapshot_is_replaced(self):
+        writer = self._get_writer(snapshot=[0] * 16, mock_file_info=True)
+        writer.expand('#UDG0:8(a) #UDGARRAY1;0(b)', ASMDIR)
+        writer.snapshot = [1] * 8 + [2] * 8
+        writer.expand('#UDG0:8(c)', ASMDIR)
+        self._check_image(writer, [[Udg(56, [1] * 8, [2] * 8)]], scale=4, mask=1, path='{}/c.png'.format(UDGDIR))
+        writer.expand('#UDGARRAY1;0(d)', ASMDIR)
+        self._check_image(writer, [[Udg(56, [1] * 8)]], path='{}/d.png'.format(UDGDIR))
+
     def test_macro_udgarray_frames(self):
         udg1 = Udg(23, [101] * 8)
         udg2 = Udg(47, [35] * 8)
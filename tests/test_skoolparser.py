@@ -1651,6 +1651,21 @@ class SkoolParserTest(SkoolKitTestCase):
         self.assertEqual(['Mid-block comment.'], entry.instructions[1].mid_block_comment)
         self.assertEqual('Done.', entry.instructions[1].comment.text)
 
+    def test_instruction_attributes(self):
+        skool = """
+            @start
+            ; Routine
+            c32768 JR 32770
+             32770 RET
+        """
+        parser = self._get_parser(skool, asm_mode=1)
+        inst1, inst2 = parser.get_entry(32768).instructions
+        self.assertEqual(len(inst1.referrers), 0)
+        self.assertEqual(inst2.referrers, [parser.get_entry(32768)])
+        self.assertEqual(inst1.ignoreua, {'i': None, 'm': None})
+        inst1.custom = 'foo'
+        self.assertEqual(inst1.custom, 'foo')
+
     def test_snapshot(self):
         skool = """
             ; Test snapshot building
@@ -4,7 +4,7 @@ from textwrap import dedent
 from unittest.mock import patch, Mock
 
 from skoolkittest import SkoolKitTestCase
-from skoolkit import components, sna2ctl, snapshot, SkoolKitError, VERSION
+from skoolkit import components, sna2ctl, snactl, snapshot, SkoolKitError, VERSION
 from skoolkit.config import COMMANDS
 
 # Binary data designed to test the static code analysis algorithm that is used
@@ -143,10 +143,10 @@ c 65498
 i 65499
 """
 
-def mock_make_snapshot(fname, org, start, end, page):
+def mock_make_snapshot(fname, org, start, end, page, memory):
     global make_snapshot_args
     make_snapshot_args = fname, org, start, end, page
-    return [0] * 65536, 16384 if start is None else start, end
+    return bytearray(65536), 16384 if start is None else start, end
 
 def mock_run(*args):
     global run_args
@@ -233,6 +233,7 @@ class Sna2CtlTest(SkoolKitTestCase):
         self.assertIsNone(options.org)
         self.assertIsNone(options.page)
         self.assertEqual([], options.params)
+        self.assertIsNone(options.save_map)
 
     @patch.object(sna2ctl, 'run', mock_run)
     def test_config_read_from_file(self):
@@ -894,6 +895,21 @@ class Sna2CtlTest(SkoolKitTestCase):
         exp_ctl = "c 65533"
         self._test_generation(data, exp_ctl, code_map)
 
+    def test_option_m_with_text_adjacent_to_code(self):
+        code_map = [65529, 65530]
+        data = [
+            72, 101, 108, 108, 111, # 65524 DEFM "Hello"
+            65,                     # 65529 LD B,C
+            201,                    # 65530 RET
+            87, 111, 114, 108, 100  # 65531 DEFM "World"
+        ]
+        exp_ctl = """
+            t 65524
+            c 65529
+            t 65531
+        """
+        self._test_generation(data, exp_ctl, code_map)
+
     def _test_option_m(self, code_map, option, map_file=False):
         binfile = self.write_bin_file(TEST_MAP_BIN, suffix='.bin')
         if map_file:
@@ -953,6 +969,21 @@ class Sna2CtlTest(SkoolKitTestCase):
         code_map = ['All numbers are in hexadecimal', '8000\t11111\tNOP', invalid_line, '8002\t11117\tNOP']
         self._test_option_m_invalid_map(code_map, 3, invalid_line, 'Address out of range')
 
+    @patch.object(snactl, 'CHUNK_SIZE', 16)
+    def test_option_m_read_in_chunks(self):
+        for code_map in (
+                self._create_fuse_profile(TEST_MAP),
+                self._create_specemu_log(TEST_MAP),
+                self._create_zero_log(TEST_MAP, True)
+        ):
+            self._test_option_m(code_map, '-m')
+
+    @patch.object(snactl, 'CHUNK_SIZE', 16)
+    def test_option_m_unparseable_address_in_later_chunk(self):
+        invalid_line = '0xABCG,4'
+        code_map = ['0xABCF,8', '', '0xABD0,4', '0xABD1,4', '0xABD2,4', invalid_line, '0xABD3,5']
+        self._test_option_m_invalid_map(code_map, 6, invalid_line, 'Cannot parse address')
+
     @patch.object(snapshot, 'read_bin_file', Mock(return_value=[]))
     def test_option_m_unrecognised_format(self):
         for code_map in ('', 'PC=FEDC'):
@@ -960,6 +991,18 @@ class Sna2CtlTest(SkoolKitTestCase):
             with self.assertRaisesRegex(SkoolKitError, '{}: Unrecognised format'.format(code_map_file)):
                 self.run_sna2ctl('-m {} test-unrecognised-map.bin'.format(code_map_file))
 
+    def test_option_m_multiple_maps(self):
+        binfile = self.write_bin_file(TEST_MAP_BIN, suffix='.bin')
+        z80_map = self.write_bin_file(self._create_z80_map(TEST_MAP[:20]), suffix='.map')
+        profile = self.write_text_file('\n'.join(self._create_fuse_profile(TEST_MAP[10:])), suffix='.prof')
+        spud_log = self.write_text_file('\n'.join(self._create_spud_log(TEST_MAP[-3:])), suffix='.log')
+        output, error = self.run_sna2ctl('-m {} --map {} -m {} -o {} {}'.format(z80_map, profile, spud_log, TEST_MAP_BIN_ORG, binfile))
+        exp_error = 'Reading {}\nReading {}: .*100%\x08\x08\x08\x08\nReading {}: .*100%\x08\x08\x08\x08\n'.format(z80_map, profile, spud_log)
+        match = re.match(exp_error, error)
+        self.assertIsNotNone(match)
+        self.assertEqual(match.group(), error)
+        self.assertEqual(TEST_MAP_CTL_G, output)
+
     @patch.object(snapshot, 'read_bin_file', Mock(return_value=[201]))
     def test_option_o(self):
         for option, value in (('-o', 49152), ('--org', 32768)):
@@ -988,6 +1031,37 @@ class Sna2CtlTest(SkoolKitTestCase):
             page = make_snapshot_args[4]
             self.assertEqual(page, exp_page)
 
+    def test_option_save_map(self):
+        binfile = self.write_bin_file(TEST_MAP_BIN, suffix='.bin')
+        profile = self.write_text_file('\n'.join(self._create_fuse_profile(TEST_MAP[:20])), suffix='.prof')
+        specemu_map = self.write_bin_file(self._create_specemu_map(TEST_MAP[10:]), suffix='.map')
+        map_file = '{}/merged.map'.format(self.make_directory())
+        output, error = self.run_sna2ctl('-m {} -m {} --save-map {} -o {} {}'.format(profile, specemu_map, map_file, TEST_MAP_BIN_ORG, binfile))
+        self.assertEqual(TEST_MAP_CTL_G, output)
+        self.assertTrue(error.endswith('Reading {}\n'.format(specemu_map)))
+        self.assertNotIn(map_file, error)
+        with open(map_file, 'rb') as f:
+            self.assertEqual(bytes(self._create_z80_map(TEST_MAP)), f.read())
+
+        output, error = self.run_sna2ctl('-m {} -o {} {}'.format(map_file, TEST_MAP_BIN_ORG, binfile))
+        self.assertEqual(TEST_MAP_CTL_G, output)
+
+    def test_option_save_map_as_fuse_profile(self):
+        binfile = self.write_bin_file(TEST_MAP_BIN, suffix='.bin')
+        profile = self.write_text_file('0x{:04X},5\n0x{:04X},2\n0x{:04X}\n'.format(*TEST_MAP[:3]), suffix='.prof')
+        zero_log = self.write_text_file('\n'.join(self._create_zero_log(TEST_MAP[1:] + TEST_MAP[2:4], True)), suffix='.log')
+        map_file = '{}/merged.prof'.format(self.make_directory())
+        output, error = self.run_sna2ctl('-m {} -m {} --save-map {} -o {} {}'.format(profile, zero_log, map_file, TEST_MAP_BIN_ORG, binfile))
+        self.assertEqual(TEST_MAP_CTL_G, output)
+        exp_counts = [5, 3, 3, 2] + [1] * (len(TEST_MAP) - 4)
+        exp_profile = ''.join('0x{:04X},{}\n'.format(a, c) for a, c in zip(TEST_MAP, exp_counts))
+        with open(map_file) as f:
+            self.assertEqual(exp_profile, f.read())
+
+    def test_option_save_map_without_option_m(self):
+        with self.assertRaisesRegex(SkoolKitError, '^No code maps to save$'):
+            self.run_sna2ctl('--save-map out.map test.bin')
+
     @patch.object(sna2ctl, 'get_config', mock_config)
     def test_option_show_config(self):
         output, error = self.run_sna2ctl('--show-config', catch_exit=0)
@@ -1073,6 +1147,42 @@ class Sna2CtlTest(SkoolKitTestCase):
         exp_ctl = "b 65534"
         self._test_generation(data, exp_ctl)
 
+    def test_generate_ctls_from_bytearray(self):
+        data = [33, 0, 64, 17, 1, 64, 1, 255, 23, 54, 0, 237, 176, 201]
+        data.extend(b'Hello there, this is some text.')
+        data.extend((0, 1, 2, 3, 205, 0, 128, 195, 0, 128, 255, 255, 24, 238))
+        snapshot = [0] * 32768 + data + [0] * (32768 - len(data))
+        config = sna2ctl.Config(' ,.', 12, 2, set())
+        for code_map in (None, self.write_bin_file(self._create_z80_map([32768, 32771, 32774, 32777, 32779]))):
+            exp_ctls = snactl.generate_ctls(snapshot, 32768, 32820, code_map, config)
+            ctls = snactl.generate_ctls(bytearray(snapshot), 32768, 32820, code_map, config)
+            self.assertEqual(exp_ctls, ctls)
+            self.assertIn('t', ctls.values())
+
+    def test_generate_ctls_from_merged_code_map(self):
+        snapshot = [0] * 65536
+        snapshot[TEST_MAP_BIN_ORG:TEST_MAP_BIN_ORG + len(TEST_MAP_BIN)] = TEST_MAP_BIN
+        config = sna2ctl.Config(' ,.', 12, 2, set())
+        profile = self.write_text_file('\n'.join(self._create_fuse_profile(TEST_MAP[:20])), suffix='.prof')
+        z80_map = self.write_bin_file(self._create_z80_map(TEST_MAP[10:]), suffix='.map')
+        end = TEST_MAP_BIN_ORG + len(TEST_MAP_BIN)
+        code_map = snactl.read_code_maps((profile, z80_map))
+        self.assertIsInstance(code_map, bytearray)
+        self.assertEqual(set(TEST_MAP), {a for a, b in enumerate(code_map) if b})
+        self.assertEqual(set(code_map), {0, 1})
+        exp_ctls = snactl.generate_ctls(snapshot, TEST_MAP_BIN_ORG, end, [profile, z80_map], config)
+        self.assertEqual(exp_ctls, snactl.generate_ctls(snapshot, TEST_MAP_BIN_ORG, end, code_map, config))
+
+    def test_read_code_maps_with_counts(self):
+        zero_log = 'All numbers are in hexadecimal\n\nff\t47\tNOP\nFF\t51\tNOP\n00fF\t55\tNOP\n100\t59\tNOP\n'
+        profile = '0x00FF,4\n0x0100\n0x00FF,2\n'
+        fnames = (self.write_text_file(zero_log, suffix='.log'), self.write_text_file(profile, suffix='.prof'))
+        counts = snactl.read_code_maps(fnames, True)
+        self.assertEqual(len(counts), 65536)
+        self.assertEqual({255: 9, 256: 2}, {a: c for a, c in enumerate(counts) if c})
+        executed = snactl.read_code_maps(fnames)
+        self.assertEqual(bytearray(map(bool, counts)), executed)
+
     @patch.object(components, 'SK_CONFIG', None)
     def test_custom_default_disassembly_start_address(self):
         ini = "[skoolkit]\nDefaultDisassemblyStartAddress=32768"
@@ -6,8 +6,8 @@ from skoolkittest import SkoolKitTestCase
 from skoolkit import components, sna2skool, snapshot, SkoolKitError, VERSION
 from skoolkit.config import COMMANDS
 
-def mock_make_snapshot(fname, org, start, end, page):
-    return [0] * 65536, 16384 if start is None else start, end
+def mock_make_snapshot(fname, org, start, end, page, memory):
+    return bytearray(65536), 16384 if start is None else start, end
 
 class MockCtlParser:
     def __init__(self, ctls=None):
@@ -585,7 +585,7 @@ class Sna2SkoolTest(SkoolKitTestCase):
         data = [1, 2, 3]
         binfile = self.write_bin_file(data, suffix='.qux')
         self.run_sna2skool(binfile)
-        self.assertEqual(data, mock_skool_writer.snapshot[65533:65536])
+        self.assertEqual(bytearray(data), mock_skool_writer.snapshot[65533:65536])
         self.assertTrue(mock_skool_writer.wrote_skool)
 
     @patch.object(sna2skool, 'make_snapshot', mock_make_snapshot)
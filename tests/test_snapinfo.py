@@ -810,7 +810,7 @@ class SnapinfoTest(SkoolKitTestCase):
             output, error = self.run_snapinfo('{} {}'.format(option, snafile))
             self.assertEqual(error, '')
             self.assertEqual('BASIC DONE!\n', output)
-            self.assertEqual(exp_snapshot, mock_basic_lister.snapshot)
+            self.assertEqual(bytearray(exp_snapshot), mock_basic_lister.snapshot)
             mock_basic_lister.snapshot = None
 
     @patch.object(snapinfo, 'VariableLister', MockVariableLister)
@@ -822,7 +822,7 @@ class SnapinfoTest(SkoolKitTestCase):
             output, error = self.run_snapinfo('{} {}'.format(option, snafile))
             self.assertEqual(error, '')
             self.assertEqual('VARIABLES DONE!\n', output)
-            self.assertEqual(exp_snapshot, mock_variable_lister.snapshot)
+            self.assertEqual(bytearray(exp_snapshot), mock_variable_lister.snapshot)
             mock_variable_lister.snapshot = None
 
     @patch.object(snapinfo, 'BasicLister', MockBasicLister)
@@ -835,8 +835,8 @@ class SnapinfoTest(SkoolKitTestCase):
             output, error = self.run_snapinfo('{} {}'.format(option, snafile))
             self.assertEqual(error, '')
             self.assertEqual('BASIC DONE!\nVARIABLES DONE!\n', output)
-            self.assertEqual(exp_snapshot, mock_basic_lister.snapshot)
-            self.assertEqual(exp_snapshot, mock_variable_lister.snapshot)
+            self.assertEqual(bytearray(exp_snapshot), mock_basic_lister.snapshot)
+            self.assertEqual(bytearray(exp_snapshot), mock_variable_lister.snapshot)
             mock_basic_lister.snapshot = None
             mock_variable_lister.snapshot = None
 
@@ -1005,6 +1005,89 @@ class SnapinfoTest(SkoolKitTestCase):
         exp_output = '47983-48035-26 BB6F-BBA3-1A: {}'.format(seq_str)
         self._test_sna(ram, exp_output, '-f {}-0x{:02x}-0x{:02x}'.format(seq_str, step, step + 1))
 
+    def test_option_find_multiple_times(self):
+        ram = [0] * 49152
+        ram[20000 - 16384:20003 - 16384] = (1, 2, 3)
+        ram[30000 - 16384:30006 - 16384:2] = (4, 5, 6)
+        ram[40000 - 16384:40003 - 16384] = (1, 2, 3)
+        exp_output = """
+            20000-20002-1 4E20-4E22-1: 1,2,3
+            40000-40002-1 9C40-9C42-1: 1,2,3
+            30000-30004-2 7530-7534-2: 4,5,6
+        """
+        self._test_sna(ram, exp_output, '-f 1,2,3 --find 4,5,6-1-2')
+
+    def test_option_find_file(self):
+        ram = [0] * 49152
+        ram[20000 - 16384:20003 - 16384] = (1, 2, 3)
+        ram[30000 - 16384:30009 - 16384:3] = (4, 5, 6)
+        ram[50000 - 16384:50002 - 16384] = (7, 8)
+        seqfile = self.write_text_file('4,5,6-3\n\n1,2,3\n')
+        exp_output = """
+            50000-50001-1 C350-C351-1: 7,8
+            30000-30006-3 7530-7536-3: 4,5,6
+            20000-20002-1 4E20-4E22-1: 1,2,3
+        """
+        for option in ('-F', '--find-file'):
+            self._test_sna(ram, exp_output, '-f 7,8 {} {}'.format(option, seqfile))
+
+    def test_option_find_with_all_pages(self):
+        ram = [0] * 49152
+        ram[30000 - 16384:30003 - 16384] = (1, 2, 3)
+        header2 = [0] * 4         # Bank 0 mapped to 49152-65535
+        banks = [0] * (5 * 16384) # Banks 1, 3, 4, 6, 7
+        ram[32766:32768] = (1, 2)                  # Bank 2 (49150-49151)
+        banks[16384 + 100:16384 + 103] = (1, 2, 3) # Bank 3
+        banks[2 * 16384] = 3                       # Bank 4
+        exp_output = """
+            30000-30002-1 7530-7532-1: 1,2,3
+            49150-49152-1 BFFE-C000-1: 1,2,3 (page 4)
+            49252-49254-1 C064-C066-1: 1,2,3 (page 3)
+            62768-62770-1 F530-F532-1: 1,2,3 (page 5)
+        """
+        self._test_sna(ram + header2 + banks, exp_output, '--all-pages -f 1,2,3')
+
+    def test_option_find_with_all_pages_on_128k_snapshot_with_identical_pages(self):
+        bank = [0] * 16384
+        bank[100:103] = (1, 2, 3)
+        exp_output = """
+            16484-16486-1 4064-4066-1: 1,2,3
+            32868-32870-1 8064-8066-1: 1,2,3
+            49252-49254-1 C064-C066-1: 1,2,3 (page 0)
+            49252-49254-1 C064-C066-1: 1,2,3 (page 1)
+            49252-49254-1 C064-C066-1: 1,2,3 (page 2)
+            49252-49254-1 C064-C066-1: 1,2,3 (page 3)
+            49252-49254-1 C064-C066-1: 1,2,3 (page 4)
+            49252-49254-1 C064-C066-1: 1,2,3 (page 5)
+            49252-49254-1 C064-C066-1: 1,2,3 (page 6)
+            49252-49254-1 C064-C066-1: 1,2,3 (page 7)
+        """
+        pages = {p: bank for p in (1, 3, 4, 6, 7)}
+        z80file = self.write_z80_file(None, bank * 3, machine_id=4, pages=pages)
+        szxfile = self.write_szx(bank * 3, machine_id=2, pages=pages)
+        self._test_sna(bank * 3 + [0] * 4 + bank * 5, exp_output, '--all-pages -f 1,2,3')
+        for snapshot in (z80file, szxfile):
+            output, error = self.run_snapinfo('--all-pages -f 1,2,3 {}'.format(snapshot))
+            self.assertEqual(error, '')
+            self.assertEqual(dedent(exp_output).lstrip(), output)
+
+    def test_option_find_with_all_pages_on_48k_z80_and_szx_snapshots(self):
+        ram = [0] * 49152
+        ram[-3:] = (1, 2, 3)
+        exp_output = '65533-65535-1 FFFD-FFFF-1: 1,2,3\n'
+        z80file = self.write_z80_file(None, ram, machine_id=0)
+        szxfile = self.write_szx(ram, machine_id=1)
+        for snapshot in (z80file, szxfile):
+            output, error = self.run_snapinfo('--all-pages -f 1,2,3 {}'.format(snapshot))
+            self.assertEqual(error, '')
+            self.assertEqual(exp_output, output)
+
+    def test_option_find_with_all_pages_on_48k_snapshot(self):
+        ram = [0] * 49152
+        ram[-3:] = (1, 2, 3)
+        exp_output = '65533-65535-1 FFFD-FFFF-1: 1,2,3'
+        self._test_sna(ram, exp_output, '--all-pages -f 1,2,3')
+
     def test_option_find_with_nonexistent_byte_sequence(self):
         ram = [0] * 49152
         exp_output = ''
@@ -1,5 +1,9 @@
+from unittest.mock import patch
+
 from skoolkittest import SkoolKitTestCase
-from skoolkit.snapshot import get_snapshot, make_z80_ram_block, SnapshotError
+from skoolkit import snapshot
+from skoolkit.snapshot import (get_memories, get_memory, get_snapshot, make_snapshot,
+                              make_snapshots, make_z80_ram_block, SnapshotError)
 
 class SnapshotTest(SkoolKitTestCase):
     def _check_ram(self, ram, exp_ram, model, out_7ffd, pages, page):
@@ -175,6 +179,21 @@ class Z80CompressionTest(SkoolKitTestCase):
         exp_data = [2, 0, 0, 0, 237]
         self.assertEqual(exp_data, make_z80_ram_block(data, 0))
 
+    def test_run_longer_than_255_bytes(self):
+        data = [0] * 300
+        exp_data = [8, 0, 0, 237, 237, 255, 0, 237, 237, 45, 0]
+        self.assertEqual(exp_data, make_z80_ram_block(data, 0))
+
+    def test_run_longer_than_255_bytes_with_short_remainder(self):
+        data = [1] * 258 + [2]
+        exp_data = [8, 0, 0, 237, 237, 255, 1, 1, 1, 1, 2]
+        self.assertEqual(exp_data, make_z80_ram_block(data, 0))
+
+    def test_two_ED_bytes(self):
+        data = [1, 237, 237, 1]
+        exp_data = [6, 0, 0, 1, 237, 237, 2, 237, 1]
+        self.assertEqual(exp_data, make_z80_ram_block(data, 0))
+
 class SZXTest(SnapshotTest):
     def _test_szx(self, exp_ram, compress, machine_id=1, ch7ffd=0, pages={}, page=None):
         tmp_szx = self.write_szx(exp_ram, compress, machine_id, ch7ffd, pages)
@@ -244,3 +263,115 @@ class SZXTest(SnapshotTest):
         exp_ram = [(n + 173) & 255 for n in range(49152)]
         pages = {1: [(n + 19) & 255 for n in range(16384)]}
         self._test_szx(exp_ram, False, machine_id=2, pages=pages, page=1)
+
+class MemoryTest(SnapshotTest):
+    def _test_memory(self, snafile, page=None):
+        memory = get_memory(snafile, page)
+        self.assertIsInstance(memory, bytearray)
+        self.assertEqual(list(memory), get_snapshot(snafile, page))
+        return memory
+
+    def test_sna_128k_page_3(self):
+        ram = [(n + 5) & 255 for n in range(49152)]
+        pages = [[n] * 16384 for n in range(8)]
+        sna = [0] * 27 + ram + [0, 0, 4, 0] + [b for n in (0, 1, 3, 4, 6, 7) for b in pages[n]]
+        memory = self._test_memory(self.write_bin_file(sna, suffix='.sna'), 3)
+        self.assertEqual(memory[49152:], bytes(pages[3]))
+
+    def test_z80v3_128k_compressed(self):
+        exp_ram = [1] * 4000 + [237, 237, 7] + [2] * 12000 + [3] * (49152 - 16003)
+        pages = {6: [237] * 5 + [(n * 3) & 255 for n in range(16379)]}
+        model, tmp_z80 = self.write_z80(exp_ram, 3, True, 4, pages=pages)
+        memory = self._test_memory(tmp_z80, 6)
+        self.assertEqual(memory[16384:49152], bytes(exp_ram[:32768]))
+        self.assertEqual(memory[49152:], bytes(pages[6]))
+
+    def test_szx_16k_compressed(self):
+        exp_ram = [(n + 11) & 255 for n in range(16384)] + [0] * 32768
+        memory = self._test_memory(self.write_szx(exp_ram, True, 0))
+        self.assertEqual(memory[16384:], bytes(exp_ram))
+
+    def test_szx_128k_with_bad_page_not_needed(self):
+        exp_ram = [(n + 3) & 255 for n in range(49152)]
+        szx = self._get_szx_header(2)
+        for bank, data in ((5, exp_ram[:16384]), (2, exp_ram[16384:32768]), (0, exp_ram[32768:])):
+            szx.extend(self._get_zxstrampage(bank, True, data))
+        szx.extend(self._get_zxstrampage(7, False, [0] * 3)) # Bad page size
+        tmp_szx = self.write_bin_file(szx, suffix='.szx')
+        self.assertEqual(get_memory(tmp_szx)[16384:], bytes(exp_ram))
+        with self.assertRaisesRegex(SnapshotError, r'^Page 7 is 3 bytes \(should be 16384\)$'):
+            get_memory(tmp_szx, 7)
+
+    def test_szx_128k_no_specregs_with_page(self):
+        szx = self._get_szx_header(2, specregs=False)
+        for bank in (5, 2, 4):
+            szx.extend(self._get_zxstrampage(bank, True, [bank] * 16384))
+        memory = get_memory(self.write_bin_file(szx, suffix='.szx'), 4)
+        self.assertEqual(memory[16384:], bytes([5] * 16384 + [2] * 16384 + [4] * 16384))
+
+class MemoriesTest(SnapshotTest):
+    def _test_memories(self, snafile, pages=range(8)):
+        memories = get_memories(snafile, pages)
+        self.assertEqual(len(memories), len(pages))
+        for page, memory in zip(pages, memories):
+            self.assertIsInstance(memory, bytearray)
+            self.assertEqual(memory, get_memory(snafile, page))
+        return memories
+
+    def test_sna_48k(self):
+        ram = [(n + 9) & 255 for n in range(49152)]
+        sna = self.write_bin_file([0] * 27 + ram, suffix='.sna')
+        for memory in self._test_memories(sna, (None, 3)):
+            self.assertEqual(memory[16384:], bytes(ram))
+
+    def test_sna_128k(self):
+        ram = [(n + 5) & 255 for n in range(49152)]
+        pages = [[n] * 16384 for n in range(8)]
+        sna = [0] * 27 + ram + [0, 0, 4, 0] + [b for n in (0, 1, 3, 6, 7) for b in pages[n]]
+        memories = self._test_memories(self.write_bin_file(sna, suffix='.sna'))
+        self.assertEqual(memories[4][49152:], bytes(ram[32768:]))
+        self.assertEqual(memories[6][49152:], bytes(pages[6]))
+
+    def test_z80v3_48k_compressed(self):
+        exp_ram = [1] * 4000 + [2] * 12000 + [3] * (49152 - 16000)
+        tmp_z80 = self.write_z80(exp_ram, 3, True)[1]
+        for memory in self._test_memories(tmp_z80, (None, 0, 7)):
+            self.assertEqual(memory[16384:], bytes(exp_ram))
+
+    def test_z80v3_128k_compressed(self):
+        exp_ram = [(n * 7) & 255 for n in range(49152)]
+        pages = {n: [n] * 16384 for n in (0, 1, 4, 6, 7)}
+        tmp_z80 = self.write_z80(exp_ram, 3, True, 4, out_7ffd=3, pages=pages)[1]
+        with patch.object(snapshot, '_decompress_block', wraps=snapshot._decompress_block) as mock_decompress:
+            memories = self._test_memories(tmp_z80, (None,) + tuple(range(8)))
+            # Each of the eight banks is decompressed once by get_memories(),
+            # and three banks (or two, for pages 2 and 5) are decompressed by
+            # each call to get_memory()
+            self.assertEqual(mock_decompress.call_count, 8 + 25)
+        self.assertEqual(memories[0][16384:], bytes(exp_ram))
+        self.assertEqual(memories[1][49152:], bytes(pages[0]))
+        self.assertEqual(memories[8][49152:], bytes(pages[7]))
+
+    def test_szx_128k_compressed(self):
+        exp_ram = [(n + 1) & 255 for n in range(49152)]
+        pages = {n: [n * 3] * 16384 for n in (1, 3, 4, 6, 7)}
+        tmp_szx = self.write_szx(exp_ram, True, 2, 0, pages)
+        memories = self._test_memories(tmp_szx)
+        self.assertEqual(memories[0][16384:], bytes(exp_ram))
+        self.assertEqual(memories[7][49152:], bytes(pages[7]))
+
+    def test_make_snapshots(self):
+        exp_ram = [(n + 2) & 255 for n in range(49152)]
+        pages = {n: [n] * 16384 for n in (1, 3, 4, 6, 7)}
+        tmp_szx = self.write_szx(exp_ram, True, 2, 0, pages)
+        snapshots = make_snapshots(tmp_szx, None, (0, 3))
+        self.assertEqual(snapshots, [get_snapshot(tmp_szx, 0), get_snapshot(tmp_szx, 3)])
+        memories = make_snapshots(tmp_szx, None, (0, 3), True)
+        self.assertEqual(memories, get_memories(tmp_szx, (0, 3)))
+
+    def test_make_snapshot_from_binary_file(self):
+        binfile = self.write_bin_file([1, 2, 3], suffix='.bin')
+        memory, start, end = make_snapshot(binfile, 32768, memory=True)
+        self.assertIsInstance(memory, bytearray)
+        self.assertEqual(memory[32767:32771], bytes((0, 1, 2, 3)))
+        self.assertEqual((start, end), (32768, 32771))
@@ -1,6 +1,10 @@
+import hashlib
 import os
 import textwrap
+import threading
+import time
 import urllib
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from zipfile import ZipFile
 from io import BytesIO
 from unittest.mock import patch, Mock
@@ -17,7 +21,28 @@ def mock_make_z80(*args):
 
 def mock_write_z80(ram, namespace, z80):
     global snapshot
-    snapshot = [0] * 16384 + ram
+    snapshot = [0] * 16384 + list(ram)
+
+class TapeRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        etag = self.headers.get('If-None-Match')
+        self.server.requests.append((self.path, etag))
+        if self.path not in self.server.files:
+            self.send_error(404)
+            return
+        data, file_etag = self.server.files[self.path]
+        if etag == file_etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', file_etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
 
 class Tap2SnaTest(SkoolKitTestCase):
     def _write_tap(self, blocks, zip_archive=False, tap_name=None):
@@ -73,6 +98,11 @@ class Tap2SnaTest(SkoolKitTestCase):
         self.assertIsNone(options.start)
         self.assertEqual([], options.state)
         self.assertEqual(options.user_agent, '')
+        self.assertIsNone(options.batch)
+        self.assertEqual(options.jobs, 1)
+        self.assertIsNone(options.cache_dir)
+        self.assertEqual(options.cache_size, 524288000)
+        self.assertFalse(options.offline)
 
     def test_no_arguments(self):
         output, error = self.run_tap2sna(catch_exit=2)
@@ -85,6 +115,272 @@ class Tap2SnaTest(SkoolKitTestCase):
             self.assertEqual(output, '')
             self.assertTrue(error.startswith('usage:'))
 
+    def _write_batch_file(self, lines):
+        return self.write_text_file('\n'.join(lines), suffix='.txt')
+
+    def test_option_batch(self):
+        odir = self.make_directory()
+        tapfile1 = self._write_tap([create_tap_data_block([1, 2, 3])])
+        tapfile2 = self._write_tap([create_tap_data_block([4, 5])], zip_archive=True)
+        batch_file = self._write_batch_file((
+            '; Comment',
+            '{} one.z80 --ram load=1,32768 --ram poke=32771,6 # Comment'.format(tapfile1),
+            '',
+            '{} two.z80 --ram load=1,49152 --start 49152'.format(tapfile2)
+        ))
+        output, error = self.run_tap2sna('--batch {} -d {}'.format(batch_file, odir))
+        self.assertEqual(error, '')
+        self.assertRegex(output, (
+            r'^Wrote {0}/one\.z80 \(\d+\.\d\ds\)\n'
+            r'Wrote {0}/two\.z80 \(\d+\.\d\ds\)\n'
+            r'2 written, 0 up to date, 0 failed in \d+\.\d\ds \(mean \d+\.\d\ds per snapshot; slowest: {0}/(one|two)\.z80, \d+\.\d\ds\)\n$'
+        ).format(odir))
+        snapshot = get_snapshot('{}/one.z80'.format(odir))
+        self.assertEqual([1, 2, 3, 6], snapshot[32768:32772])
+        with open('{}/two.z80'.format(odir), 'rb') as f:
+            z80_header = f.read(34)
+        self.assertEqual(z80_header[32:34], bytes((0, 192)))
+        snapshot = get_snapshot('{}/two.z80'.format(odir))
+        self.assertEqual([4, 5], snapshot[49152:49154])
+
+    def test_option_batch_skips_up_to_date_snapshots(self):
+        odir = self.make_directory()
+        tapfile1 = self._write_tap([create_tap_data_block([1])])
+        tapfile2 = self._write_tap([create_tap_data_block([2])])
+        batch_file = self._write_batch_file((
+            '{} one.z80 --ram load=1,32768'.format(tapfile1),
+            '{} two.z80 --ram load=1,32768'.format(tapfile2)
+        ))
+        self.run_tap2sna('--batch {} -d {}'.format(batch_file, odir))
+        z80file1, z80file2 = ['{}/{}.z80'.format(odir, n) for n in ('one', 'two')]
+        os.utime(tapfile1, (1000, 1000))
+        os.utime(z80file1, (2000, 2000))
+        os.utime(tapfile2, (3000, 3000))
+        os.utime(z80file2, (2000, 2000))
+
+        output, error = self.run_tap2sna('--batch {} -d {}'.format(batch_file, odir))
+        self.assertEqual(error, '')
+        self.assertRegex(output, (
+            r'^Skipped {0} \(up to date\)\n'
+            r'Wrote {1} \(\d+\.\d\ds\)\n'
+            r'1 written, 1 up to date, 0 failed in \d+\.\d\ds'
+        ).format(z80file1, z80file2))
+
+        output, error = self.run_tap2sna('--batch {} -d {} --force'.format(batch_file, odir))
+        self.assertEqual(error, '')
+        self.assertIn('2 written, 0 up to date, 0 failed', output)
+
+    def test_option_batch_with_failures(self):
+        odir = self.make_directory()
+        tapfile = self._write_tap([create_tap_data_block([1])])
+        batch_file = self._write_batch_file((
+            '{} one.z80 --ram load=2,32768'.format(tapfile),
+            '{} two.z80 --ram load=1,32768'.format(tapfile),
+            '{}'.format(tapfile),
+            '{} four.z80 --stack X'.format(tapfile)
+        ))
+        with self.assertRaises(SkoolKitError) as cm:
+            self.run_tap2sna('--batch {} -d {}'.format(batch_file, odir))
+        self.assertEqual(cm.exception.args[0], 'Failed to write 3 of 4 snapshots')
+        self.assertRegex(self.out.getvalue(), (
+            r'^Failed to write {0}/one\.z80: Block 2 not found\n'
+            r'Wrote {0}/two\.z80 \(\d+\.\d\ds\)\n'
+            r'1 written, 0 up to date, 3 failed in .*\n'
+            r'  {1}, line 1: {0}/one\.z80: Block 2 not found\n'
+            r'  {1}, line 3: Invalid arguments: {2}\n'
+            r"  {1}, line 4: argument -p/--stack: invalid integer: 'X'\n$"
+        ).format(odir, batch_file, tapfile))
+        self.assertEqual(self.err.getvalue(), '')
+        self.assertFalse(os.path.isfile('{}/one.z80'.format(odir)))
+        self.assertTrue(os.path.isfile('{}/two.z80'.format(odir)))
+
+    def test_option_batch_with_option_jobs(self):
+        odir = self.make_directory()
+        lines = []
+        for i in range(1, 5):
+            tapfile = self._write_tap([create_tap_data_block([i])])
+            lines.append('{} {}.z80 --ram load=1,32768'.format(tapfile, i))
+        batch_file = self._write_batch_file(lines)
+        output, error = self.run_tap2sna('--batch {} -d {} --jobs 2'.format(batch_file, odir))
+        self.assertEqual(error, '')
+        self.assertIn('\n4 written, 0 up to date, 0 failed in ', output)
+        for i in range(1, 5):
+            snapshot = get_snapshot('{}/{}.z80'.format(odir, i))
+            self.assertEqual(i, snapshot[32768])
+
+    def _start_http_server(self):
+        server = HTTPServer(('127.0.0.1', 0), TapeRequestHandler)
+        server.files = {}
+        server.requests = []
+        thread = threading.Thread(target=server.serve_forever, args=(0.01,))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, 'http://127.0.0.1:{}'.format(server.server_port)
+
+    def _cached_url_fname(self, cache_dir, url):
+        return '{}/urls/{}.json'.format(cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    @patch.object(tap2sna, '_write_z80', mock_write_z80)
+    def test_option_cache_dir(self):
+        server, base_url = self._start_http_server()
+        server.files['/game.tap'] = (bytes(create_tap_data_block([1, 2])), '"v1"')
+        url = base_url + '/game.tap'
+        cache_dir = self.make_directory()
+        odir = self.make_directory()
+        args = '--cache-dir {} --ram load=1,32768 {} {}/game.z80'.format(cache_dir, url, odir)
+
+        output, error = self.run_tap2sna(args)
+        self.assertEqual(output, 'Downloading {}\n'.format(url))
+        self.assertEqual(error, '')
+        self.assertEqual([1, 2], snapshot[32768:32770])
+
+        output, error = self.run_tap2sna(args)
+        self.assertEqual(output, 'Using cached copy of {}\n'.format(url))
+        self.assertEqual([1, 2], snapshot[32768:32770])
+
+        server.files['/game.tap'] = (bytes(create_tap_data_block([3, 4])), '"v2"')
+        output, error = self.run_tap2sna(args)
+        self.assertEqual(output, 'Downloading {}\n'.format(url))
+        self.assertEqual([3, 4], snapshot[32768:32770])
+
+        self.assertEqual([('/game.tap', None), ('/game.tap', '"v1"'), ('/game.tap', '"v1"')], server.requests)
+
+    @patch.object(tap2sna, '_write_z80', mock_write_z80)
+    def test_option_cache_size(self):
+        server, base_url = self._start_http_server()
+        urls = []
+        for name in 'abc':
+            server.files['/{}.tap'.format(name)] = (bytes(create_tap_data_block([ord(name)] * 98)), '"{}"'.format(name))
+            urls.append('{}/{}.tap'.format(base_url, name))
+        cache_dir = self.make_directory()
+        odir = self.make_directory()
+        args = '--cache-dir {} --cache-size 250 --ram load=1,32768 {} {}/game.z80'
+        for mtime, url in enumerate(urls[:2], 1):
+            self.run_tap2sna(args.format(cache_dir, url, odir))
+            os.utime(self._cached_url_fname(cache_dir, url), (mtime, mtime))
+
+        # Use 'a' (so that 'b' becomes the least recently used entry)
+        output, error = self.run_tap2sna(args.format(cache_dir, urls[0], odir))
+        self.assertTrue(output.startswith('Using cached copy of {}\n'.format(urls[0])))
+
+        # Download 'c' (which evicts 'b')
+        self.run_tap2sna(args.format(cache_dir, urls[2], odir))
+        for url, cached in zip(urls, (True, False, True)):
+            self.assertEqual(cached, os.path.isfile(self._cached_url_fname(cache_dir, url)))
+        self.assertEqual(2, len(os.listdir('{}/data'.format(cache_dir))))
+
+    @patch.object(tap2sna, '_write_z80', mock_write_z80)
+    def test_option_cache_dir_with_cached_copy_evicted_after_revalidation(self):
+        server, base_url = self._start_http_server()
+        server.files['/game.tap'] = (bytes(create_tap_data_block([1, 2])), '"v1"')
+        url = base_url + '/game.tap'
+        cache_dir = self.make_directory()
+        odir = self.make_directory()
+        args = '--cache-dir {} --ram load=1,32768 {} {}/game.z80'.format(cache_dir, url, odir)
+        self.run_tap2sna(args)
+        self.assertTrue(os.path.isfile('{}/.lock'.format(cache_dir)))
+
+        def evict_and_urlopen(*args, **kwargs):
+            # Simulate another process evicting the cached copy after it has
+            # been found but before it is opened
+            for name in os.listdir('{}/data'.format(cache_dir)):
+                os.remove('{}/data/{}'.format(cache_dir, name))
+            return urlopen(*args, **kwargs)
+
+        urlopen = tap2sna.urlopen
+        with patch.object(tap2sna, 'urlopen', evict_and_urlopen):
+            output, error = self.run_tap2sna(args)
+        self.assertEqual(output, 'Downloading {}\n'.format(url))
+        self.assertEqual(error, '')
+        self.assertEqual([1, 2], snapshot[32768:32770])
+        self.assertEqual([('/game.tap', None), ('/game.tap', '"v1"'), ('/game.tap', None)], server.requests)
+
+    @patch.object(tap2sna, '_write_z80', mock_write_z80)
+    def test_option_cache_size_with_files_removed_by_another_process(self):
+        server, base_url = self._start_http_server()
+        urls = []
+        for name in 'abc':
+            server.files['/{}.tap'.format(name)] = (bytes(create_tap_data_block([ord(name)] * 98)), '"{}"'.format(name))
+            urls.append('{}/{}.tap'.format(base_url, name))
+        cache_dir = self.make_directory()
+        odir = self.make_directory()
+        args = '--cache-dir {} --cache-size 250 --ram load=1,32768 {} {}/game.z80'
+        for mtime, url in enumerate(urls[:2], 1):
+            self.run_tap2sna(args.format(cache_dir, url, odir))
+            os.utime(self._cached_url_fname(cache_dir, url), (mtime, mtime))
+
+        def remove(fname):
+            # Simulate another process removing the file first
+            os_remove(fname)
+            raise FileNotFoundError(2, 'No such file or directory', fname)
+
+        os_remove = os.remove
+        with patch.object(tap2sna.os, 'remove', remove):
+            output, error = self.run_tap2sna(args.format(cache_dir, urls[2], odir))
+        self.assertEqual(error, '')
+        for url, cached in zip(urls, (False, True, True)):
+            self.assertEqual(cached, os.path.isfile(self._cached_url_fname(cache_dir, url)))
+        self.assertEqual(2, len(os.listdir('{}/data'.format(cache_dir))))
+
+    @patch.object(tap2sna, '_write_z80', mock_write_z80)
+    def test_option_cache_size_keeps_files_newer_than_eviction(self):
+        server, base_url = self._start_http_server()
+        urls = []
+        for name in 'ab':
+            server.files['/{}.tap'.format(name)] = (bytes(create_tap_data_block([ord(name)] * 98)), '"{}"'.format(name))
+            urls.append('{}/{}.tap'.format(base_url, name))
+        cache_dir = self.make_directory()
+        odir = self.make_directory()
+        args = '--cache-dir {} --cache-size 150 --ram load=1,32768 {} {}/game.z80'
+        self.run_tap2sna(args.format(cache_dir, urls[0], odir))
+        os.utime(self._cached_url_fname(cache_dir, urls[0]), (1, 1))
+
+        # A file just stored by another process (and not yet referenced by an
+        # entry) must survive
+        new_file = '{}/data/{}'.format(cache_dir, '0' * 64)
+        with open(new_file, 'wb') as f:
+            f.write(bytes(200))
+        future = time.time() + 3600
+        os.utime(new_file, (future, future))
+
+        self.run_tap2sna(args.format(cache_dir, urls[1], odir))
+        self.assertTrue(os.path.isfile(new_file))
+        for url, cached in zip(urls, (False, True)):
+            self.assertEqual(cached, os.path.isfile(self._cached_url_fname(cache_dir, url)))
+
+    @patch.object(tap2sna, '_write_z80', mock_write_z80)
+    def test_option_offline(self):
+        server, base_url = self._start_http_server()
+        server.files['/game.zip'] = (self._write_tap_archive(), '"zip"')
+        url = base_url + '/game.zip'
+        cache_dir = self.make_directory()
+        odir = self.make_directory()
+        self.run_tap2sna('--cache-dir {} --ram load=1,32768 {} {}/game.z80'.format(cache_dir, url, odir))
+        server.requests.clear()
+
+        output, error = self.run_tap2sna('--cache-dir {} --offline --ram load=1,32768 {} {}/game.z80'.format(cache_dir, url, odir))
+        self.assertEqual(output, 'Using cached copy of {}\nExtracting game.tap\n'.format(url))
+        self.assertEqual(error, '')
+        self.assertEqual([5, 6], snapshot[32768:32770])
+        self.assertEqual([], server.requests)
+
+        url2 = base_url + '/other.tap'
+        with self.assertRaisesRegex(SkoolKitError, '^Error while getting snapshot game.z80: {} is not in the download cache$'.format(url2)):
+            self.run_tap2sna('--cache-dir {} --offline {} {}/game.z80'.format(cache_dir, url2, odir))
+        self.assertEqual([], server.requests)
+
+    def test_option_offline_without_cache_dir(self):
+        with self.assertRaisesRegex(SkoolKitError, '^Error while getting snapshot game.z80: --offline requires --cache-dir$'):
+            self.run_tap2sna('--offline http://example.com/game.tap {}/game.z80'.format(self.make_directory()))
+
+    def _write_tap_archive(self):
+        archive = BytesIO()
+        with ZipFile(archive, 'w') as z:
+            z.writestr('game.tap', bytes(create_tap_data_block([5, 6])))
+        return archive.getvalue()
+
     def test_option_d(self):
         odir = '{}/tap2sna'.format(self.make_directory())
         block = create_tap_data_block([0])
@@ -321,6 +617,20 @@ class Tap2SnaTest(SkoolKitTestCase):
         snapshot = self._get_snapshot(start, data, load_options='--ram load=1,{},,,,{}'.format(start, inc))
         self.assertEqual([data[2]] + data[:2], snapshot[65533:])
 
+    def test_ram_load_wraparound(self):
+        start = 65534
+        data = [n & 255 for n in range(1, 16389)]
+        snapshot = self._get_snapshot(start, data)
+        self.assertEqual(data[:2], snapshot[65534:])
+        self.assertEqual(data[16386:], snapshot[16384:16386])
+
+    def test_ram_load_at_end_of_memory(self):
+        data = [23, 24, 25]
+        start = 65536 - len(data)
+        snapshot = self._get_snapshot(start, data)
+        self.assertEqual(data, snapshot[start:])
+        self.assertEqual(65536, len(snapshot))
+
     def test_ram_load_wraparound_with_step(self):
         start = 65535
         data = [23, 24, 25]
@@ -4,6 +4,7 @@ import sys
 import os
 import time
 import gc
+from io import BytesIO
 
 # Use the current development version of SkoolKit
 SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
@@ -16,7 +17,8 @@ if not os.path.isdir(SKOOLKIT_HOME):
 sys.path.insert(0, SKOOLKIT_HOME)
 
 from skoolkit.image import ImageWriter
-from skoolkit.skoolhtml import Udg, Frame
+from skoolkit.graphics import Udg, Frame
+from skoolkit.pngwriter import IDAT
 
 def write(line):
     print(line)
@@ -42,7 +44,7 @@ def clock(method, *args):
     return sum(keep) / len(keep)
 
 def get_method(iw, method):
-    png_writer = iw.writers['png']
+    png_writer = iw.writer
     if hasattr(png_writer, method):
         return getattr(iw, method)
     m_name = '_build_image_data_{}'.format(method)
@@ -54,8 +56,8 @@ def get_method(iw, method):
 def _get_attr_map(iw, udgs, scale):
     frame = Frame(udgs, scale)
     use_flash = True
-    colours, attrs, flash_rect = iw._get_colours(frame, use_flash)
-    palette, attr_map = iw._get_palette(colours, attrs, frame.has_trans)
+    iw._get_colours(frame, use_flash)
+    palette, attr_map, has_trans = iw._get_palette(frame.colours, frame.attrs, frame.has_trans, frame.tindex)
     palette_size = len(palette) // 3
     if palette_size > 4:
         bit_depth = 4
@@ -170,6 +172,29 @@ METHODS = (
     ('bd1_at', 'bd1_nt', bd1)
 )
 
+def time_chunks(udg_arrays, scales):
+    iw = ImageWriter()
+    png_writer = iw.writer
+    udg_arrays = udg_arrays or (
+        [[Udg(56, (170,) * 8)]],                        # 1 UDG, 1 attr
+        [[Udg(i, (240,) * 8) for i in range(16)]] * 16, # 256 UDGs, 16 attrs
+        [[Udg(i, (15,) * 8) for i in range(32)]] * 24   # 768 UDGs (#SCR), 32 attrs
+    )
+    scales = scales or (1, 2, 4)
+    write('Scanline building v. chunk writing:')
+    for udgs in udg_arrays:
+        for scale in scales:
+            frame = Frame(udgs, scale)
+            iw._get_colours(frame)
+            palette, attr_map, has_trans = iw._get_palette(frame.colours, frame.attrs, frame.has_trans, frame.tindex)
+            bit_depth, palette_size = png_writer._get_bit_depth(palette)
+            build_args = (frame, palette_size, bit_depth, attr_map)
+            img_data = IDAT + png_writer._build_image_data(*build_args)[0]
+            t1 = clock(png_writer._build_image_data, *build_args)
+            t2 = clock(png_writer._write_img_data_chunk, BytesIO(), img_data)
+            num_udgs = len(udgs[0]) * len(udgs)
+            write('  num_udgs={}, scale={}, chunk_size={}: {:0.3f}ms {:0.3f}ms'.format(num_udgs, scale, len(img_data), t1, t2))
+
 def time_methods(method1_name, method2_name, udg_arrays, scale):
     for name1, name2, f in METHODS:
         if set((name1, name2)) == set((method1_name, method2_name)):
@@ -182,7 +207,7 @@ def list_methods():
     prefix = '_build_image_data_'
     methods = []
     iw = ImageWriter()
-    png_writer = iw.writers['png']
+    png_writer = iw.writer
     for attr in dir(png_writer):
         if attr.startswith(prefix) and not attr.endswith('_bd0'):
             methods.append(attr)
@@ -194,6 +219,7 @@ def list_methods():
 def parse_args(args):
     p_args = []
     run_all = False
+    chunks = False
     udgs = []
     scales = ()
     i = 0
@@ -201,6 +227,8 @@ def parse_args(args):
         arg = args[i]
         if arg == '-a':
             run_all = True
+        elif arg == '-c':
+            chunks = True
         elif arg == '-l':
             list_methods()
         elif arg == '-u':
@@ -214,26 +242,29 @@ def parse_args(args):
         else:
             p_args.append(arg)
         i += 1
-    if run_all:
+    if run_all or chunks:
         if p_args:
             show_usage()
         else:
             p_args = (None, None)
     if len(p_args) != 2:
         show_usage()
-    return p_args[0], p_args[1], run_all, udgs, scales
+    return p_args[0], p_args[1], run_all, chunks, udgs, scales
 
 def show_usage():
     sys.stderr.write("""Usage:
     {0} -a
+    {0} [options] -c
     {0} -l
     {0} [options] METHOD1 METHOD2
 
   Compare the performance of two PngWriter._build_image* methods in the current
-  development version of SkoolKit.
+  development version of SkoolKit, or (with -c) compare the time taken to build
+  the scanlines of an image with the time taken to write them as a PNG chunk.
 
 Available options:
   -a                      Run all method comparisons
+  -c                      Time scanline building and chunk writing separately
   -l                      List methods available on PngWriter
   -s s1[,s2...]           Compare methods using these scales
   -u '[[Udg(...), ... ]'  Compare methods using this UDG array; this option may
@@ -244,10 +275,12 @@ Available options:
 ###############################################################################
 # Begin
 ###############################################################################
-method1_name, method2_name, run_all, udgs, scales = parse_args(sys.argv[1:])
+method1_name, method2_name, run_all, chunks, udgs, scales = parse_args(sys.argv[1:])
 udg_arrays = tuple([eval(udg_array) for udg_array in udgs])
 gc.disable()
-if run_all:
+if chunks:
+    time_chunks(udg_arrays, scales)
+elif run_all:
     for name1, name2, f in METHODS:
         time_methods(name1, name2, udg_arrays, scales)
         write('')
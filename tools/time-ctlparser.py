@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import random
+import argparse
+import tempfile
+
+# Use the current development version of SkoolKit
+SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
+if not SKOOLKIT_HOME:
+    sys.stderr.write('SKOOLKIT_HOME is not set; aborting\n')
+    sys.exit(1)
+if not os.path.isdir(SKOOLKIT_HOME):
+    sys.stderr.write('SKOOLKIT_HOME={}; directory not found\n'.format(SKOOLKIT_HOME))
+    sys.exit(1)
+sys.path.insert(0, SKOOLKIT_HOME)
+
+from skoolkit.ctlparser import CtlParser
+
+def make_ctl(num_entries):
+    # Entries of 4-16 bytes at addresses 1024-65535, each with a title,
+    # description, register and end comment, and a mixture of sub-block
+    # directives, mid-block comments, ASM directives and @ignoreua directives
+    random.seed(0)
+    lines = []
+    span = (65536 - 1024) // num_entries
+    for n in range(num_entries):
+        addr = 1024 + n * span
+        ctl = random.choice('bbcccgstuw')
+        lines.append('{} {} Entry at {}'.format(ctl, addr, addr))
+        lines.append('D {} Description of the entry at {}.'.format(addr, addr))
+        lines.append('R {} A Some value'.format(addr))
+        if random.random() < 0.2:
+            lines.append('@ {} label=L{}'.format(addr, addr))
+        if random.random() < 0.2:
+            lines.append('@ {} ignoreua:t'.format(addr))
+        sub_addr = addr
+        end = addr + min(span, random.randrange(4, 16))
+        while sub_addr < end:
+            length = min(random.randrange(1, 4), end - sub_addr)
+            r = random.random()
+            if r < 0.2:
+                lines.append('N {} Mid-block comment at {}.'.format(sub_addr, sub_addr))
+            elif r < 0.3:
+                lines.append('@ {} ignoreua:m'.format(sub_addr))
+            if random.random() < 0.3:
+                lines.append('@ {} ignoreua:i'.format(sub_addr))
+            if random.random() < 0.3:
+                lines.append('@ {} nowarn'.format(sub_addr))
+            subctl = 'C' if ctl == 'c' else random.choice('BSTW')
+            lines.append('{} {},{} Comment at {}'.format(subctl, sub_addr, length, sub_addr))
+            sub_addr += length
+        lines.append('E {} End comment for the entry at {}.'.format(addr, addr))
+    return '\n'.join(lines) + '\n'
+
+def clock(method, trials, *args):
+    elapsed = []
+    for n in range(trials):
+        start = time.time()
+        result = method(*args)
+        elapsed.append(time.time() - start)
+    return min(elapsed) * 1000, result
+
+def parse(ctlfile):
+    ctl_parser = CtlParser()
+    ctl_parser.parse_ctls([ctlfile])
+    return ctl_parser
+
+def get_blocks(ctlfile):
+    # get_blocks() modifies the parser's entry ASM directives, so use a fresh
+    # parser each time, and count only the time taken by get_blocks()
+    ctl_parser = parse(ctlfile)
+    start = time.time()
+    ctl_parser.get_blocks()
+    return time.time() - start
+
+def run(ctlfile, options):
+    if ctlfile:
+        t1, ctl_parser = clock(parse, options.trials, ctlfile)
+        t2 = min(get_blocks(ctlfile) for n in range(options.trials)) * 1000
+    else:
+        ctlfile = os.path.join(tempfile.mkdtemp(), 'test.ctl')
+        with open(ctlfile, 'w') as f:
+            f.write(make_ctl(options.entries))
+        t1, ctl_parser = clock(parse, options.trials, ctlfile)
+        t2 = min(get_blocks(ctlfile) for n in range(options.trials)) * 1000
+        with open(ctlfile) as f:
+            num_lines = len(f.readlines())
+        os.remove(ctlfile)
+        os.rmdir(os.path.dirname(ctlfile))
+        print('{} entries, {} directives'.format(options.entries, num_lines))
+    print('Parse: {:0.2f}ms'.format(t1))
+    print('Get blocks: {:0.2f}ms'.format(t2))
+    print('Total: {:0.2f}ms'.format(t1 + t2))
+
+###############################################################################
+# Begin
+###############################################################################
+parser = argparse.ArgumentParser(
+    usage='{} [options] [CTLFILE]'.format(os.path.basename(sys.argv[0])),
+    description="Time CtlParser.parse_ctls() and CtlParser.get_blocks() on a control file.\n"
+                "If CTLFILE is not given, a control file containing many entries and\n"
+                "directives is generated.",
+    formatter_class=argparse.RawTextHelpFormatter,
+    add_help=False
+)
+parser.add_argument('ctlfile', help=argparse.SUPPRESS, nargs='?')
+group = parser.add_argument_group('Options')
+group.add_argument('-e', dest='entries', metavar='N', type=int, default=5000,
+                   help="Generate N entries (default: 5000).")
+group.add_argument('-n', dest='trials', metavar='N', type=int, default=5,
+                   help="Run each stage N times and report the fastest (default: 5).")
+namespace, unknown_args = parser.parse_known_args()
+if unknown_args:
+    parser.exit(2, parser.format_help())
+run(namespace.ctlfile, namespace)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import random
+import argparse
+
+# Use the current development version of SkoolKit
+SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
+if not SKOOLKIT_HOME:
+    sys.stderr.write('SKOOLKIT_HOME is not set; aborting\n')
+    sys.exit(1)
+if not os.path.isdir(SKOOLKIT_HOME):
+    sys.stderr.write('SKOOLKIT_HOME={}; directory not found\n'.format(SKOOLKIT_HOME))
+    sys.exit(1)
+sys.path.insert(0, SKOOLKIT_HOME)
+
+from skoolkit.disassembler import Disassembler
+from skoolkit.snapshot import get_snapshot
+
+class Config:
+    def __init__(self, asm_hex, asm_lower):
+        self.asm_hex = asm_hex
+        self.asm_lower = asm_lower
+        self.defb_size = 8
+        self.defm_size = 66
+        self.defw_size = 1
+        self.wrap = False
+
+def get_memory(snafile, banks):
+    if snafile:
+        return [get_snapshot(snafile, page) for page in banks]
+    random.seed(0)
+    lower = [random.randrange(256) for i in range(49152)]
+    return [lower + [random.randrange(256) for i in range(16384)] for page in banks]
+
+def clock(memory, config, base, table, trials):
+    disassemblers = [Disassembler(snapshot, config) for snapshot in memory]
+    if not table:
+        for d in disassemblers:
+            d._table = None
+    elapsed = []
+    for n in range(trials):
+        start = time.time()
+        for i, d in enumerate(disassemblers):
+            # Disassemble 16384-65535 once, and 49152-65535 for each other bank
+            d.disassemble(49152 if i else 16384, 65536, base)
+        elapsed.append(time.time() - start)
+    return min(elapsed) * 1000
+
+def run(snafile, options):
+    if options.banks:
+        banks = range(8)
+    else:
+        banks = (None,)
+    memory = get_memory(snafile, banks)
+    config = Config(options.hex, options.lower)
+    size = '128K' if options.banks else '48K'
+    for base in options.bases:
+        t1 = clock(memory, config, base, False, options.trials)
+        t2 = clock(memory, config, base, True, options.trials)
+        print('{} base={}: decoder methods {:0.1f}ms, pre-decoded table {:0.1f}ms ({:0.2f}x)'.format(size, base, t1, t2, t1 / t2))
+
+###############################################################################
+# Begin
+###############################################################################
+parser = argparse.ArgumentParser(
+    usage='{} [options] [SNAPSHOT]'.format(os.path.basename(sys.argv[0])),
+    description="Compare the time taken by Disassembler.disassemble() with and without its\n"
+                "pre-decoded opcode table to disassemble a 48K or 128K RAM image. If SNAPSHOT\n"
+                "is not given, random data is disassembled.",
+    formatter_class=argparse.RawTextHelpFormatter,
+    add_help=False
+)
+parser.add_argument('snafile', help=argparse.SUPPRESS, nargs='?')
+group = parser.add_argument_group('Options')
+group.add_argument('-b', dest='bases', metavar='BASES', default='nhd',
+                   help="Disassemble in these bases (default: nhd).")
+group.add_argument('-H', dest='hex', action='store_true',
+                   help="Produce a hexadecimal disassembly.")
+group.add_argument('-l', dest='lower', action='store_true',
+                   help="Produce a lower case disassembly.")
+group.add_argument('-n', dest='trials', metavar='N', type=int, default=5,
+                   help="Run each disassembly N times and report the fastest (default: 5).")
+group.add_argument('-p', dest='banks', action='store_true',
+                   help="Disassemble all eight 128K RAM banks.")
+namespace, unknown_args = parser.parse_known_args()
+if unknown_args:
+    parser.exit(2, parser.format_help())
+run(namespace.snafile, namespace)
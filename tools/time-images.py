@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import gc
+import json
+import time
+import random
+import argparse
+from io import BytesIO
+
+# Use the current development version of SkoolKit
+SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
+if not SKOOLKIT_HOME:
+    sys.stderr.write('SKOOLKIT_HOME is not set; aborting\n')
+    sys.exit(1)
+if not os.path.isdir(SKOOLKIT_HOME):
+    sys.stderr.write('SKOOLKIT_HOME={}; directory not found\n'.format(SKOOLKIT_HOME))
+    sys.exit(1)
+sys.path.insert(0, SKOOLKIT_HOME)
+
+from skoolkit import VERSION
+from skoolkit.graphics import Frame, Udg
+from skoolkit.image import ImageWriter, PNG_ENABLE_ANIMATION
+from skoolkit.pngwriter import FDAT2, IDAT
+
+def _bytes():
+    return [random.randrange(256) for i in range(8)]
+
+def _udgs(width, height, attrs, masked=False):
+    return [[Udg(random.choice(attrs), _bytes(), _bytes() if masked else None) for i in range(width)] for j in range(height)]
+
+def _scr(attrs):
+    # A screenshot in which each attribute fills a block of 4x3 character
+    # cells, as is typical of a game screen
+    rows = [[random.choice(attrs) for i in range(8)] for j in range(8)]
+    return [[Udg(rows[j // 3][i // 4], _bytes()) for i in range(32)] for j in range(24)]
+
+def _font(text, attr):
+    return [[Udg(attr, [(ord(c) * (n + 1)) & 255 for n in range(8)]) for c in text]]
+
+def _sprite_frames(num_frames, scale, mask):
+    # A 2x2 masked sprite moving across a 16x4 background, one UDG per frame
+    bg = _udgs(16, 4, (56, 57, 58))
+    sprite = _udgs(2, 2, (66,), True)
+    frames = []
+    for n in range(num_frames):
+        udgs = [[u.copy() for u in row] for row in bg]
+        for j in range(2):
+            for i in range(2):
+                udgs[1 + j][n + i] = sprite[j][i].copy()
+        frames.append(Frame(udgs, scale, mask, delay=10))
+    return frames
+
+def get_corpus():
+    # Each case is (name, frames); the cases between them use every
+    # PngWriter._build_image_data_* method
+    random.seed(0)
+    return (
+        ('scr', [Frame(_scr((56, 7, 71, 40, 2, 66, 120)), 1)]),
+        ('scr-x2', [Frame(_scr((56, 7, 71, 40, 2, 66, 120)), 2)]),
+        ('scr-flash', [Frame(_scr((56, 184, 71, 168, 2, 194, 120)), 2)]),
+        ('scr-cropped', [Frame(_scr((56, 7, 71, 40, 2, 66, 120)), 2, 0, 13, 21, 400, 300)]),
+        ('scr-4colour', [Frame(_scr((56, 57, 58)), 2)]),
+        ('scr-2colour', [Frame(_scr((56,)), 2)]),
+        ('udg-x4', [Frame(_udgs(1, 1, (69,)), 4)]),
+        ('udg-1colour', [Frame([[Udg(56, [0] * 8)]], 4)]),
+        ('udg-masked1-x4', [Frame(_udgs(1, 1, (69,), True), 4, 1)]),
+        ('udg-masked2-x4', [Frame(_udgs(1, 1, (69,), True), 4, 2)]),
+        ('udgarray-2colour-masked', [Frame([[Udg(56, _bytes(), [255] * 8) for i in range(8)] for j in range(8)], 2, 1)]),
+        ('udgarray-4colour-masked', [Frame(_udgs(8, 8, (56,), True), 2, 1)]),
+        ('udgarray-masked', [Frame(_udgs(8, 8, (56, 57, 58, 69, 70), True), 2, 1)]),
+        ('udgarray-masked-cropped', [Frame(_udgs(8, 8, (56, 57, 58, 69, 70), True), 2, 2, 5, 3, 100, 90)]),
+        ('font', [Frame(_font('The quick brown fox jumps over the lazy dog', 56), 2)]),
+        ('animated', _sprite_frames(14, 2, 1)),
+        ('animated-x4', _sprite_frames(14, 4, 1))
+    )
+
+def clock(method, *args):
+    elapsed = []
+    for n in range(3):
+        gc.collect()
+        start = time.perf_counter()
+        method(*args)
+        elapsed.append((time.perf_counter() - start) * 1000)
+
+    trials = max((5, int(1000 / max(min(elapsed), 0.001))))
+    elapsed = []
+    for n in range(min(trials, 1000)):
+        start = time.perf_counter()
+        method(*args)
+        elapsed.append((time.perf_counter() - start) * 1000)
+
+    elapsed.sort()
+    drop = len(elapsed) // 10
+    keep = elapsed[drop:len(elapsed) - drop]
+    return sum(keep) / len(keep)
+
+def get_build_method(png_writer, frame, palette_size, bit_depth):
+    # Mirror the method selection in PngWriter._build_image_data()
+    masked = frame.mask and frame.has_masks
+    bd = 0 if palette_size == 1 else bit_depth
+    return png_writer.png_method_dict[bd][not frame.cropped][masked].__name__[18:]
+
+def time_case(iw, frames):
+    png_writer = iw.writer
+    use_flash = len(frames) == 1 and iw.options[PNG_ENABLE_ANIMATION]
+
+    def get_colours():
+        for frame in frames:
+            iw._get_colours(frame, use_flash)
+
+    get_colours()
+    colours, attrs, has_trans = set(), set(), False
+    for frame in frames:
+        colours.update(frame.colours)
+        attrs.update(frame.attrs)
+        has_trans = has_trans or frame.has_trans
+    palette_args = (colours, attrs, has_trans, frames[0].tindex)
+    palette, attr_map, has_trans = iw._get_palette(*palette_args)
+    bit_depth, palette_size = png_writer._get_bit_depth(palette)
+    flash_rect = frames[0].flash_rect
+
+    if hasattr(png_writer, '_get_deltas'):
+        # Only the part of each subsequent frame that changed is built
+        get_frames = lambda: [d[0] for d in png_writer._get_deltas(frames)[1:]]
+    else:
+        # Older versions of SkoolKit build every frame in full
+        get_frames = lambda: frames[1:]
+
+    def build():
+        data = [png_writer._build_image_data(frames[0], palette_size, bit_depth, attr_map, flash_rect)]
+        for frame in get_frames():
+            data.append(png_writer._build_image_data(frame, palette_size, bit_depth, attr_map))
+        return data
+
+    chunks = []
+    for frame1_data, frame2_data in build():
+        chunks.append(IDAT + frame1_data)
+        if frame2_data:
+            chunks.append(FDAT2 + frame2_data)
+
+    def write_chunks():
+        img_file = BytesIO()
+        for chunk in chunks:
+            png_writer._write_img_data_chunk(img_file, chunk)
+
+    img_file = BytesIO()
+    iw._write_image(frames, img_file)
+    return {
+        'method': get_build_method(png_writer, frames[0], palette_size, bit_depth),
+        'bit_depth': bit_depth,
+        'frames': len(frames),
+        'pixels': sum(f.width * f.height for f in frames),
+        'size': len(img_file.getvalue()),
+        'total': clock(iw._write_image, frames, BytesIO()),
+        'colours': clock(get_colours),
+        'palette': clock(iw._get_palette, set(colours), attrs, has_trans, frames[0].tindex),
+        'build': clock(build),
+        'chunks': clock(write_chunks)
+    }
+
+def _mpps(pixels, ms):
+    # Throughput in megapixels per second
+    return pixels / ms / 1000
+
+def run(options):
+    corpus = get_corpus()
+    if options.cases:
+        corpus = [c for c in corpus if c[0] in options.cases]
+    baseline = {}
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['cases']
+
+    iw = ImageWriter()
+    results = {}
+    name_len = max(len(c[0]) for c in corpus)
+    print('{}  {:>8} {:>7} {:>7} {:>7} {:>7} {:>7} {:>8}'.format('Case'.ljust(name_len), 'Method', 'Total', 'Colours', 'Palette', 'Build', 'Chunks', 'Mpx/s'))
+    for name, frames in corpus:
+        r = results[name] = time_case(iw, frames)
+        line = '{}  {:>8} {:7.2f} {:7.2f} {:7.3f} {:7.2f} {:7.3f} {:8.2f}'.format(
+            name.ljust(name_len), r['method'], r['total'], r['colours'], r['palette'], r['build'], r['chunks'],
+            _mpps(r['pixels'], r['total']))
+        if name in baseline:
+            line += ' ({:0.2f}x)'.format(baseline[name]['total'] / r['total'])
+        print(line)
+
+    total_ms = sum(r['total'] for r in results.values())
+    pixels = sum(r['pixels'] for r in results.values())
+    print('All cases: {:0.2f}ms ({:0.2f} Mpx/s)'.format(total_ms, _mpps(pixels, total_ms)))
+    if baseline:
+        common = [n for n in results if n in baseline]
+        if common:
+            b_ms = sum(baseline[n]['total'] for n in common)
+            r_ms = sum(results[n]['total'] for n in common)
+            print('Speedup over {} ({} cases): {:0.2f}x'.format(options.compare, len(common), b_ms / r_ms))
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump({'version': VERSION, 'python': sys.version.split()[0], 'cases': results}, f, indent=2, sort_keys=True)
+
+###############################################################################
+# Begin
+###############################################################################
+parser = argparse.ArgumentParser(
+    usage='{} [options]'.format(os.path.basename(sys.argv[0])),
+    description="Time ImageWriter._write_image() end to end, and each of its stages (finding\n"
+                "the colours used, building the palette, building the image data, and writing\n"
+                "the PNG chunks), on a fixed corpus of frames covering screenshots, UDGs, UDG\n"
+                "arrays, fonts and animations at every bit depth, with and without masks,\n"
+                "scaling and cropping. Times are in milliseconds; throughput is in megapixels\n"
+                "per second.",
+    formatter_class=argparse.RawTextHelpFormatter,
+    add_help=False
+)
+group = parser.add_argument_group('Options')
+group.add_argument('-c', dest='cases', metavar='CASES',
+                   help="Time only these cases (a comma-separated list of names).")
+group.add_argument('-j', dest='json', metavar='FILE',
+                   help="Save the results to FILE in JSON format.")
+group.add_argument('-r', dest='compare', metavar='FILE',
+                   help="Compare the results with those saved in FILE.")
+namespace, unknown_args = parser.parse_known_args()
+if unknown_args:
+    parser.exit(2, parser.format_help())
+if namespace.cases:
+    namespace.cases = [c.strip() for c in namespace.cases.split(',')]
+    valid_cases = [c[0] for c in get_corpus()]
+    unknown_cases = [c for c in namespace.cases if c not in valid_cases]
+    if unknown_cases:
+        parser.exit(2, '{}Unknown case(s): {}\nValid cases: {}\n'.format(
+            parser.format_usage(), ', '.join(unknown_cases), ', '.join(valid_cases)))
+run(namespace)
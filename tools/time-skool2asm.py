@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import random
+import argparse
+import tempfile
+
+# Use the current development version of SkoolKit
+SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
+if not SKOOLKIT_HOME:
+    sys.stderr.write('SKOOLKIT_HOME is not set; aborting\n')
+    sys.exit(1)
+if not os.path.isdir(SKOOLKIT_HOME):
+    sys.stderr.write('SKOOLKIT_HOME={}; directory not found\n'.format(SKOOLKIT_HOME))
+    sys.exit(1)
+sys.path.insert(0, SKOOLKIT_HOME)
+
+from skoolkit.skoolasm import AsmWriter
+from skoolkit.skoolparser import SkoolParser
+
+WORDS = ('the', 'a', 'counter', 'sprite', 'table', 'screen', 'buffer', 'loop',
+         'until', 'zero', 'jump', 'back', 'set', 'reset', 'flag', 'byte', 'player',
+         'score', 'check', 'address', 'of', 'and', 'next', 'character')
+
+OPERATIONS = ('LD A,(HL)', 'INC HL', 'LD (DE),A', 'DEC B', 'AND $0F', 'LD BC,$0120',
+              'ADD HL,BC', 'EX DE,HL', 'PUSH HL', 'POP HL', 'CP $20', 'RLCA', 'OR C')
+
+def _comment(min_words, max_words):
+    words = [random.choice(WORDS) for i in range(random.randrange(min_words, max_words))]
+    if random.random() < 0.1:
+        words.append('at {}'.format(random.randrange(16384, 65536)))
+    return ' '.join(words).capitalize()
+
+def make_skool(num_instructions):
+    # Routines of 10-40 instructions, with entry descriptions and registers,
+    # mid-block comments and labels, and comments on most instructions (some
+    # long enough to wrap, and some spanning several instructions)
+    random.seed(0)
+    lines = ['@start']
+    addr = 32768
+    while num_instructions > 0:
+        lines.append('; {}'.format(_comment(3, 8)))
+        lines.append(';')
+        lines.append('; {}'.format(_comment(10, 40)))
+        lines.append(';')
+        lines.append('; HL {}'.format(_comment(2, 6)))
+        lines.append('; B {}'.format(_comment(2, 6)))
+        lines.append('@label=R{}'.format(addr))
+        length = min(random.randrange(10, 40), num_instructions)
+        for i in range(length):
+            if i and random.random() < 0.05:
+                lines.append('; {}'.format(_comment(5, 20)))
+            if i == 0:
+                prefix = 'c'
+            elif random.random() < 0.1:
+                prefix = '*'
+            else:
+                prefix = ' '
+            instruction = '{}{} {}'.format(prefix, addr, random.choice(OPERATIONS))
+            r = random.random()
+            if r < 0.05:
+                lines.append('{:<25} ; {{{}'.format(instruction, _comment(5, 20)))
+            elif r < 0.1 and i:
+                lines.append('{:<25} ; }}'.format(instruction))
+            elif r < 0.7:
+                lines.append('{:<25} ; {}'.format(instruction, _comment(2, 15)))
+            else:
+                lines.append(instruction)
+            addr += 1
+        lines.append('')
+        num_instructions -= length
+    return '\n'.join(lines) + '\n'
+
+def clock(method, trials, *args):
+    elapsed = []
+    for n in range(trials):
+        start = time.time()
+        result = method(*args)
+        elapsed.append(time.time() - start)
+    return min(elapsed) * 1000, result
+
+def parse(skoolfile):
+    return SkoolParser(skoolfile, asm_mode=1)
+
+def write(parser, warnings):
+    stdout = sys.stdout
+    stderr = sys.stderr
+    sys.stdout = open(os.devnull, 'w')
+    sys.stderr = open(os.devnull, 'w')
+    AsmWriter(parser, {'warnings': str(warnings)}, {}, {'Address': ''}).write()
+    sys.stdout.close()
+    sys.stderr.close()
+    sys.stdout = stdout
+    sys.stderr = stderr
+
+def run(skoolfile, options):
+    if skoolfile:
+        t1, parser = clock(parse, options.trials, skoolfile)
+    else:
+        skoolfile = os.path.join(tempfile.mkdtemp(), 'test.skool')
+        with open(skoolfile, 'w') as f:
+            f.write(make_skool(options.instructions))
+        t1, parser = clock(parse, options.trials, skoolfile)
+        os.remove(skoolfile)
+        os.rmdir(os.path.dirname(skoolfile))
+    num_instructions = sum(len(e.instructions) for e in parser.memory_map)
+    print('{} entries, {} instructions'.format(len(parser.memory_map), num_instructions))
+    print('Parse: {:0.2f}ms'.format(t1))
+    for warnings in (1, 0):
+        t2 = clock(write, options.trials, parser, warnings)[0]
+        w = 'on' if warnings else 'off'
+        print('Write (warnings {}): {:0.2f}ms ({:0.2f}us per instruction)'.format(w, t2, t2 * 1000 / num_instructions))
+        print('Total (warnings {}): {:0.2f}ms'.format(w, t1 + t2))
+
+###############################################################################
+# Begin
+###############################################################################
+parser = argparse.ArgumentParser(
+    usage='{} [options] [SKOOLFILE]'.format(os.path.basename(sys.argv[0])),
+    description="Time the stages of skool2asm.py (parsing a skool file, and writing the ASM\n"
+                "file with and without warnings enabled). If SKOOLFILE is not given, a skool\n"
+                "file containing many commented routines is generated.",
+    formatter_class=argparse.RawTextHelpFormatter,
+    add_help=False
+)
+parser.add_argument('skoolfile', help=argparse.SUPPRESS, nargs='?')
+group = parser.add_argument_group('Options')
+group.add_argument('-i', dest='instructions', metavar='N', type=int, default=20000,
+                   help="Generate N instructions (default: 20000).")
+group.add_argument('-n', dest='trials', metavar='N', type=int, default=5,
+                   help="Run each stage N times and report the fastest (default: 5).")
+namespace, unknown_args = parser.parse_known_args()
+if unknown_args:
+    parser.exit(2, parser.format_help())
+run(namespace.skoolfile, namespace)
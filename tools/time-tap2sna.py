@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import random
+import argparse
+import tempfile
+
+# Use the current development version of SkoolKit
+SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
+if not SKOOLKIT_HOME:
+    sys.stderr.write('SKOOLKIT_HOME is not set; aborting\n')
+    sys.exit(1)
+if not os.path.isdir(SKOOLKIT_HOME):
+    sys.stderr.write('SKOOLKIT_HOME={}; directory not found\n'.format(SKOOLKIT_HOME))
+    sys.exit(1)
+sys.path.insert(0, SKOOLKIT_HOME)
+
+from skoolkit import tap2sna
+
+class Options:
+    def __init__(self, ram_ops):
+        self.ram_ops = ram_ops
+        self.reg = []
+        self.state = []
+
+def _tzx_block(data):
+    return bytes((16, 0, 0, len(data) % 256, len(data) // 256)) + data
+
+def _header(addr, length):
+    header = [0, 3] + [32] * 10 + [length % 256, length // 256, addr % 256, addr // 256, 0, 128]
+    parity = 0
+    for b in header:
+        parity ^= b
+    return bytes(header + [parity])
+
+def make_tzx(num_blocks, length):
+    random.seed(0)
+    tzx = [b'ZXTape!\x1a\x01\x14']
+    addresses = []
+    for n in range(num_blocks):
+        addr = 16384 + (n * length) % (49152 - length)
+        data = bytes([255] + [random.randrange(256) for i in range(length)] + [0])
+        tzx.append(_tzx_block(_header(addr, length)))
+        tzx.append(_tzx_block(data))
+        addresses.append(addr)
+    return bytearray(b''.join(tzx)), addresses
+
+def clock(method, trials, *args):
+    elapsed = []
+    for n in range(trials):
+        start = time.time()
+        result = method(*args)
+        elapsed.append(time.time() - start)
+    return min(elapsed) * 1000, result
+
+def write_z80(ram, fname):
+    tap2sna._write_z80(ram, Options([]), fname)
+
+def run(tzxfile, options):
+    if tzxfile:
+        with open(tzxfile, 'rb') as f:
+            tzx = bytearray(f.read())
+        ram_ops = []
+    else:
+        tzx, addresses = make_tzx(options.blocks, options.length)
+        if options.offset:
+            # Load each data block with an offset, which forces a byte-by-byte
+            # load
+            ram_ops = ['load={},{},,,1'.format(2 * n + 2, a - 1) for n, a in enumerate(addresses)]
+        else:
+            ram_ops = []
+    t1, blocks = clock(tap2sna._get_tzx_blocks, options.trials, tzx)
+    t2, ram = clock(tap2sna._get_ram, options.trials, blocks, Options(ram_ops))
+    z80 = os.path.join(tempfile.mkdtemp(), 'test.z80')
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    t3 = clock(write_z80, options.trials, ram, z80)[0]
+    sys.stdout.close()
+    sys.stdout = stdout
+    os.remove(z80)
+    os.rmdir(os.path.dirname(z80))
+    print('{} tape blocks ({} bytes)'.format(len(blocks), len(tzx)))
+    print('Parse TZX: {:0.2f}ms'.format(t1))
+    print('Build RAM: {:0.2f}ms'.format(t2))
+    print('Write Z80: {:0.2f}ms'.format(t3))
+    print('Total: {:0.2f}ms'.format(t1 + t2 + t3))
+
+###############################################################################
+# Begin
+###############################################################################
+parser = argparse.ArgumentParser(
+    usage='{} [options] [TZXFILE]'.format(os.path.basename(sys.argv[0])),
+    description="Time the stages of tap2sna.py (parsing a TZX file, building the RAM image,\n"
+                "and writing the Z80 snapshot). If TZXFILE is not given, a TZX file\n"
+                "containing many header and data blocks is generated.",
+    formatter_class=argparse.RawTextHelpFormatter,
+    add_help=False
+)
+parser.add_argument('tzxfile', help=argparse.SUPPRESS, nargs='?')
+group = parser.add_argument_group('Options')
+group.add_argument('-b', dest='blocks', metavar='N', type=int, default=500,
+                   help="Generate N data blocks (default: 500).")
+group.add_argument('-l', dest='length', metavar='L', type=int, default=6912,
+                   help="Generate data blocks of length L (default: 6912).")
+group.add_argument('-n', dest='trials', metavar='N', type=int, default=5,
+                   help="Run each stage N times and report the fastest (default: 5).")
+group.add_argument('-o', dest='offset', action='store_true',
+                   help="Load the generated data blocks with an offset (which\n"
+                        "forces a byte-by-byte load).")
+namespace, unknown_args = parser.parse_known_args()
+if unknown_args:
+    parser.exit(2, parser.format_help())
+run(namespace.tzxfile, namespace)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+from io import StringIO
+
+# Use the current development version of SkoolKit
+SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
+if not SKOOLKIT_HOME:
+    sys.stderr.write('SKOOLKIT_HOME is not set; aborting\n')
+    sys.exit(1)
+if not os.path.isdir(SKOOLKIT_HOME):
+    sys.stderr.write('SKOOLKIT_HOME={}; directory not found\n'.format(SKOOLKIT_HOME))
+    sys.exit(1)
+sys.path.insert(0, SKOOLKIT_HOME)
+
+from skoolkit import skoolhtml
+from skoolkit.defaults import REF_FILE
+from skoolkit.refparser import RefParser
+from skoolkit.skoolhtml import FileInfo, HtmlWriter, TemplateFormatter
+from skoolkit.skoolparser import SkoolParser
+
+COMPILE_EXPR = skoolhtml._compile_template_expr
+
+def get_calls(skoolfile):
+    ref_parser = RefParser()
+    ref_parser.parse(StringIO(REF_FILE))
+    reffile = os.path.splitext(skoolfile)[0] + '.ref'
+    if os.path.isfile(reffile):
+        ref_parser.parse(reffile)
+    skool_parser = SkoolParser(skoolfile, html=True)
+    file_info = FileInfo(tempfile.mkdtemp(), 'game', False)
+    writer = HtmlWriter(skool_parser, ref_parser, file_info)
+    calls = []
+    format_template = writer.formatter.format_template
+    def record(page_id, name, fields):
+        # Copy the dictionaries that the HTML writer updates from page to page
+        calls.append((page_id, name, {k: v.copy() if isinstance(v, dict) else v for k, v in fields.items()}))
+        return format_template(page_id, name, fields)
+    writer.formatter.format_template = record
+    writer.write_asm_entries()
+    writer.write_map('MemoryMap')
+    return writer.formatter.templates, calls
+
+def clock(templates, calls, compiled, trials):
+    elapsed = []
+    if compiled:
+        skoolhtml._compile_template_expr = COMPILE_EXPR
+    else:
+        skoolhtml._compile_template_expr = COMPILE_EXPR.__wrapped__
+    for n in range(trials):
+        formatter = TemplateFormatter(templates)
+        COMPILE_EXPR.cache_clear()
+        if not compiled:
+            formatter._compiled = None
+        start = time.time()
+        for page_id, name, fields in calls:
+            formatter.format_template(page_id, name, fields)
+        elapsed.append(time.time() - start)
+    return min(elapsed) * 1000
+
+def run(skoolfile, trials):
+    templates, calls = get_calls(skoolfile)
+    entries = sum(1 for c in calls if c[0].startswith('Asm') and c[1] == 'Layout')
+    t1 = clock(templates, calls, False, trials)
+    t2 = clock(templates, calls, True, trials)
+    print('{} templates formatted ({} entries)'.format(len(calls), entries))
+    print('Uncompiled: {:0.1f}ms ({:0.3f}ms per entry)'.format(t1, t1 / max(entries, 1)))
+    print('Compiled: {:0.1f}ms ({:0.3f}ms per entry) ({:0.2f}x)'.format(t2, t2 / max(entries, 1), t1 / t2))
+
+###############################################################################
+# Begin
+###############################################################################
+parser = argparse.ArgumentParser(
+    usage='{} [options] SKOOLFILE'.format(os.path.basename(sys.argv[0])),
+    description="Compare the time taken by TemplateFormatter.format_template() with and\n"
+                "without its compiled template and expression caches to format the templates\n"
+                "for every disassembly page and the memory map page of a skool file.",
+    formatter_class=argparse.RawTextHelpFormatter,
+    add_help=False
+)
+parser.add_argument('skoolfile', help=argparse.SUPPRESS, nargs='?')
+group = parser.add_argument_group('Options')
+group.add_argument('-n', dest='trials', metavar='N', type=int, default=5,
+                   help="Format the templates N times and report the fastest (default: 5).")
+namespace, unknown_args = parser.parse_known_args()
+if unknown_args or namespace.skoolfile is None:
+    parser.exit(2, parser.format_help())
+run(namespace.skoolfile, namespace.trials)
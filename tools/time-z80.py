@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import random
+import argparse
+
+# Use the current development version of SkoolKit
+SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
+if not SKOOLKIT_HOME:
+    sys.stderr.write('SKOOLKIT_HOME is not set; aborting\n')
+    sys.exit(1)
+if not os.path.isdir(SKOOLKIT_HOME):
+    sys.stderr.write('SKOOLKIT_HOME={}; directory not found\n'.format(SKOOLKIT_HOME))
+    sys.exit(1)
+sys.path.insert(0, SKOOLKIT_HOME)
+
+from skoolkit.snapshot import _decompress_block, get_snapshot, make_z80_ram_block
+
+def _random_bank():
+    # A mixture of runs (of zeroes, ED bytes and other values), isolated ED
+    # bytes and random values, roughly like the contents of a game's RAM
+    data = []
+    while len(data) < 16384:
+        r = random.random()
+        if r < 0.05:
+            data.extend([random.choice((0, 0, 237, 255, random.randrange(256)))] * random.randrange(2, 600))
+        elif r < 0.1:
+            data.append(237)
+        else:
+            data.extend(random.randrange(256) for i in range(random.randrange(1, 64)))
+    return bytes(data[:16384])
+
+def get_banks(snafile, size):
+    if snafile:
+        if size == 48:
+            ram = get_snapshot(snafile)[16384:]
+            return [bytes(ram[i:i + 16384]) for i in range(0, 49152, 16384)]
+        return [bytes(get_snapshot(snafile, page)[49152:]) for page in range(8)]
+    random.seed(0)
+    return [_random_bank() for i in range(size // 16)]
+
+def clock(method, banks, trials):
+    elapsed = []
+    for n in range(trials):
+        start = time.time()
+        results = [method(data) for data in banks]
+        elapsed.append(time.time() - start)
+    return min(elapsed) * 1000, results
+
+def compress(data):
+    return make_z80_ram_block(data, 0)[3:]
+
+def run(snafile, options):
+    for size in options.sizes:
+        banks = get_banks(snafile, size)
+        t1, blocks = clock(compress, banks, options.trials)
+        t2, results = clock(_decompress_block, blocks, options.trials)
+        if [bytes(r) for r in results] != banks:
+            sys.stderr.write('{}K: round trip failed\n'.format(size))
+            sys.exit(1)
+        ratio = sum(len(b) for b in blocks) / (16384 * len(banks))
+        print('{}K: compress {:0.2f}ms, decompress {:0.2f}ms (compressed size {:0.1%})'.format(size, t1, t2, ratio))
+
+###############################################################################
+# Begin
+###############################################################################
+parser = argparse.ArgumentParser(
+    usage='{} [options] [SNAPSHOT]'.format(os.path.basename(sys.argv[0])),
+    description="Time the compression of 48K and 128K RAM images by make_z80_ram_block(),\n"
+                "and their decompression by _decompress_block(), checking that each\n"
+                "round trip reproduces the original RAM. If SNAPSHOT is not given, random\n"
+                "data is used.",
+    formatter_class=argparse.RawTextHelpFormatter,
+    add_help=False
+)
+parser.add_argument('snafile', help=argparse.SUPPRESS, nargs='?')
+group = parser.add_argument_group('Options')
+group.add_argument('-4', dest='sizes', action='store_const', const=(48,), default=(48, 128),
+                   help="Time 48K RAM images only.")
+group.add_argument('-n', dest='trials', metavar='N', type=int, default=5,
+                   help="Run each test N times and report the fastest (default: 5).")
+namespace, unknown_args = parser.parse_known_args()
+if unknown_args:
+    parser.exit(2, parser.format_help())
+run(namespace.snafile, namespace)